@@ -0,0 +1,86 @@
+"""In-memory zip reading vs extracting the export to disk, on a synthetic export.
+
+The export holds the sample CSVs (ViewingActivity repeated to scale) in the
+real folder layout plus filler members the app never reads, about
+``--size`` MB uncompressed in total.
+
+    python -m benchmarks.bench_archive [--size 200]
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import pandas as pd
+
+from netflix_analysis.archive import read_export
+from netflix_analysis.ingest import read_viewing_activity
+
+
+def build_export(size_mb):
+    with open('Files/ViewingActivity.csv', 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    body = body.rstrip(b'\n') + b'\n'
+    viewing_size = size_mb * 2**20 // 2
+    viewing = header + b'\n' + body * max(1, viewing_size // len(body))
+    filler = os.urandom(2**20).hex().encode() * max(1, (size_mb * 2**20 - len(viewing)) // 2**21)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('CONTENT_INTERACTION/ViewingActivity.csv', viewing)
+        zip_file.write('Files/BillingHistory.csv', 'PAYMENT_AND_BILLING/BillingHistory.csv')
+        zip_file.write('Files/IpAddressesStreaming.csv', 'IP_ADDRESSES/IpAddressesStreaming.csv')
+        zip_file.writestr('CLICKSTREAM/Clickstream.csv', filler)
+    return buffer.getvalue()
+
+
+def extract_to_disk(data):
+    # what the app did before: extract everything into the working directory and read it back
+    with zipfile.ZipFile(io.BytesIO(data), 'r') as zip_file:
+        zip_file.extractall()
+        interaction_df = read_viewing_activity('./CONTENT_INTERACTION/ViewingActivity.csv')
+        df_billing = pd.read_csv('./PAYMENT_AND_BILLING/BillingHistory.csv')
+        streaming_locations_df = pd.read_csv('./IP_ADDRESSES/IpAddressesStreaming.csv')
+    return interaction_df, df_billing, streaming_locations_df
+
+
+def measure(function, data):
+    start = time.perf_counter()
+    function(data)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=200, help='uncompressed export size in MB')
+    args = parser.parse_args()
+
+    data = build_export(args.size)
+    print('export: {:.0f} MB zipped, {} MB uncompressed'.format(len(data) / 2**20, args.size))
+
+    root = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            results = [('extractall', measure(extract_to_disk, data)),
+                       ('in-memory', measure(read_export, data))]
+            written = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tmp) for f in files)
+        finally:
+            os.chdir(root)
+
+    for name, (elapsed, peak) in results:
+        print('{:<11} {:7.2f} s   peak {:7.1f} MB'.format(name, elapsed, peak / 2**20))
+    print('extractall wrote {:.0f} MB to disk, in-memory wrote nothing'.format(written / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Batch precomputation of many exports: one worker vs a process pool.
+
+Generates ``--exports`` synthetic exports of ``--rows`` rows each, checks
+that a result written by the batch mode reads back equal to an in-process
+:func:`analyze_export`, then times the batch with one worker and with
+``--workers`` workers.
+
+    python -m benchmarks.bench_batch [--exports 16] [--rows 100000] [--workers 4]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic_export import write_export
+from netflix_analysis.analysis import analyze_export, export_paths, read_result, run_batch
+
+
+def check_round_trip(path, output):
+    expected = analyze_export(path)
+    actual = read_result(os.path.join(output, os.path.splitext(os.path.basename(path))[0]))
+    assert expected.metrics == actual.metrics
+    assert expected.profiles == actual.profiles
+    assert expected.frames().keys() == actual.frames().keys()
+    for name, frame in expected.frames().items():
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), actual.frames()[name],
+                                      check_dtype=False, check_categorical=False, obj=name)
+
+
+def timed_batch(paths, output, workers):
+    start = time.perf_counter()
+    errors = [error for _, error in run_batch(paths, output, workers) if error is not None]
+    assert not errors, errors
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--exports', type=int, default=16)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exports = os.path.join(tmp, 'exports')
+        os.makedirs(exports)
+        for seed in range(args.exports):
+            write_export(os.path.join(exports, 'account_{:03d}.zip'.format(seed)), rows=args.rows,
+                         titles=max(100, args.rows // 50), seed=seed)
+        paths = export_paths(exports)
+
+        serial = timed_batch(paths, os.path.join(tmp, 'serial'), 1)
+        check_round_trip(paths[0], os.path.join(tmp, 'serial'))
+        print('batch results read back identical to an in-process analysis')
+        parallel = timed_batch(paths, os.path.join(tmp, 'parallel'), args.workers)
+        for label, seconds in [('1 worker', serial), ('{} workers'.format(args.workers), parallel)]:
+            print('{:<12} {:8.1f} s   {:6.2f} exports/s'.format(label, seconds, len(paths) / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Chunked vs in-memory processing of a large generated viewing history.
+
+Writes a ViewingActivity.csv of ``--rows`` rows (the sample repeated) to a
+temporary directory, runs each mode in a fresh process and reports wall
+time and peak RSS. That both modes give identical aggregates is tested in
+tests/test_chunked.py.
+
+    python -m benchmarks.bench_chunked [--rows 5000000] [--chunksize 200000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from netflix_analysis.chunked import summarize_viewing_activity, summarize_watched
+from netflix_analysis.ingest import load_watched
+
+SAMPLE = 'Files/ViewingActivity.csv'
+
+
+def write_history(path, rows):
+    with open(SAMPLE, 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    lines = body.rstrip(b'\n').split(b'\n')
+    with open(path, 'wb') as out:
+        out.write(header + b'\n')
+        block = b'\n'.join(lines) + b'\n'
+        for _ in range(rows // len(lines)):
+            out.write(block)
+        out.write(b'\n'.join(lines[:rows % len(lines)]) + (b'\n' if rows % len(lines) else b''))
+
+
+def in_memory(path, chunksize):
+    return summarize_watched(load_watched(path))
+
+
+def chunked(path, chunksize):
+    return summarize_viewing_activity(path, chunksize)
+
+
+def _run(mode, path, chunksize, queue):
+    start = time.perf_counter()
+    summary = {'in-memory': in_memory, 'chunked': chunked}[mode](path, chunksize)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, summary.rows))
+
+
+def measure(mode, path, chunksize):
+    queue = multiprocessing.get_context('spawn').Queue()
+    process = multiprocessing.get_context('spawn').Process(target=_run, args=(mode, path, chunksize, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--skip-in-memory', action='store_true', help='only run the chunked mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ViewingActivity.csv')
+        write_history(path, args.rows)
+        print('{} rows, {:.0f} MB csv, chunks of {} rows'.format(
+            args.rows, os.path.getsize(path) / 2**20, args.chunksize))
+        modes = ['chunked'] if args.skip_in_memory else ['in-memory', 'chunked']
+        for mode in modes:
+            elapsed, peak, rows = measure(mode, path, args.chunksize)
+            print('{:<10} {:8.1f} s   peak RSS {:8.0f} MB   {} watched rows'.format(mode, elapsed, peak / 2**20, rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Device families: word splitting per row vs classifying each distinct name once.
+
+Times the word matching the app used before against the classifier on the
+Device Type column of the sample history repeated ``r`` times. The
+classifier's accuracy on labelled device names is tested in
+tests/test_devices.py.
+
+    python -m benchmarks.bench_devices
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.devices import classify_devices, device_family
+
+# what the app counted before: the words of every Device_Type string that name a kind of device
+LEGACY_WORDS = ['tv', 'phone', 'ipad', 'tablet', 'pc', 'mac', 'vr', 'iphone', 'chromecast']
+LEGACY_CATEGORIES = {'TV': 'TV', 'iPad': 'Tablet', 'PC': 'PC', 'Chromecast': 'TV',
+                     'MAC': 'PC', 'iPhone': 'Phone', 'Tablet': 'Tablet', 'Phone': 'Phone', 'VR': 'VR'}
+
+
+def legacy_counts(devices):
+    words = devices.str.split(expand=True).stack().value_counts().rename_axis('sub_device').reset_index(name='Count')
+    words = words[words['sub_device'].str.lower().isin(LEGACY_WORDS)].copy()
+    words['Device'] = words['sub_device'].map(LEGACY_CATEGORIES)
+    return words.groupby('Device')['Count'].sum()
+
+
+def family_counts(devices):
+    return classify_devices(devices).value_counts(sort=False)
+
+
+def best_of(function, argument, runs=3):
+    timings = []
+    for _ in range(runs):
+        device_family.cache_clear()
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    devices = pd.read_csv('Files/ViewingActivity.csv', usecols=['Device Type'])['Device Type'].dropna()
+    print('{} rows, {} distinct device names'.format(len(devices), devices.nunique()))
+    print('{:>8} {:>10} {:>12} {:>12} {:>8}'.format('repeats', 'rows', 'words (s)', 'distinct (s)', 'speedup'))
+    for repeats in [1, 10, 100]:
+        column = pd.Series(np.tile(devices.to_numpy(), repeats))
+        # the ingest stage reads Device Type as a categorical, so the conversion is not part of the work here
+        categorical = column.astype('category')
+        legacy = best_of(legacy_counts, column)
+        distinct = best_of(family_counts, categorical)
+        print('{:>8} {:>10} {:>12.3f} {:>12.4f} {:>7.0f}x'.format(
+            repeats, len(column), legacy, distinct, legacy / distinct))
+
+
+if __name__ == '__main__':
+    main()
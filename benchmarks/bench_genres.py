@@ -0,0 +1,98 @@
+"""Genre counts per profile: regex replace + word counting vs exploded integer ids.
+
+Generates ``--movies`` TMDB search results with random genre ids and
+``--views`` watched movie rows over five profiles. Before timing, checks
+that both paths count the single-word genres the same.
+
+    python -m benchmarks.bench_genres [--movies 10000] [--views 200000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_tmdb import GENRES
+from netflix_analysis.genres import explode_genres, genre_frequency, genre_names
+
+PROFILES = ['Johana', 'John', 'Living room', 'Robin', 'Sebastian']
+
+
+def make_data(movies, views, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.array([genre['id'] for genre in GENRES])
+    database = pd.DataFrame({
+        'original_title': ['Movie {}'.format(i) for i in range(movies)],
+        'genre_ids': [[int(i) for i in rng.choice(ids, size=rng.integers(0, 4), replace=False)] for _ in range(movies)],
+        'vote_average': rng.integers(0, 100, movies) / 10,
+    })
+    watched = pd.DataFrame({
+        'Profile_Name': rng.choice(PROFILES, views),
+        'Show_Title': database['original_title'].to_numpy()[rng.integers(0, movies, views)],
+    })
+    return database, watched
+
+
+def word_count(str):
+    counts = dict()
+    for word in str.split():
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def legacy_genres(database, watched, genre_by_id):
+    # the string based path netflix_analysis_app.py used before
+    database = database.copy()
+    database["genre_ids"] = database["genre_ids"].astype("string")
+    database["genre_ids"] = database["genre_ids"].str.replace('[', '', regex=False)
+    database["genre_ids"] = database["genre_ids"].str.replace(']', '', regex=False)
+    dic = {r"\b{}\b".format(k): v for k, v in genre_by_id.items()}
+    database["genre_ids"] = database["genre_ids"].replace(dic, regex=True)
+    movies = watched.merge(database, how='left', left_on=['Show_Title'], right_on=['original_title'])
+    movies = movies.dropna(subset=['genre_ids'])
+    by_user = {}
+    for user in PROFILES:
+        joined = " ".join(movies[movies['Profile_Name'] == user].genre_ids).replace(",", "")
+        by_user[user] = word_count(joined)
+    frequency = pd.DataFrame.from_dict(by_user, orient='columns').reset_index().fillna(value=0)
+    return frequency.melt(id_vars=['index'], var_name='Profile_Name', value_name='Count')
+
+
+def exploded_genres(database, watched, genre_by_id):
+    movie_genres = explode_genres(database, genre_by_id)
+    movies = watched.merge(movie_genres, how='inner', left_on=['Show_Title'], right_on=['original_title'])
+    return genre_frequency(movies, PROFILES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=10_000)
+    parser.add_argument('--views', type=int, default=200_000)
+    args = parser.parse_args()
+
+    genre_by_id = genre_names({'genres': GENRES})
+    database, watched = make_data(args.movies, args.views)
+
+    timings = {}
+    results = {}
+    for name, function in [('regex + words', legacy_genres), ('exploded ids', exploded_genres)]:
+        start = time.perf_counter()
+        results[name] = function(database, watched, genre_by_id)
+        timings[name] = time.perf_counter() - start
+
+    legacy = results['regex + words'].set_index(['index', 'Profile_Name'])['Count']
+    exploded = results['exploded ids'].set_index(['genre', 'Profile_Name'])['Count']
+    single_words = [name for name in set(genre_by_id.values()) if ' ' not in name and ',' not in name]
+    for genre in single_words:
+        for profile in PROFILES:
+            assert legacy.get((genre, profile), 0) == exploded.get((genre, profile), 0), (genre, profile)
+    print('both paths agree on all single-word genres')
+
+    print('{} movies, {} watched rows'.format(args.movies, args.views))
+    for name, seconds in timings.items():
+        print('{:<14} {:8.3f} s'.format(name, seconds))
+
+
+if __name__ == '__main__':
+    main()
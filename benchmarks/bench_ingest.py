@@ -0,0 +1,71 @@
+"""Time and peak memory of the typed ingest stage vs the original script's code path.
+
+The sample ViewingActivity.csv is repeated ``--repeat`` times to get a
+bigger export.
+
+    python -m benchmarks.bench_ingest [--repeat 20]
+"""
+
+import argparse
+import io
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.ingest import load_watched
+
+SAMPLE = 'Files/ViewingActivity.csv'
+
+
+def legacy_ingest(source):
+    # the preprocessing netflix_analysis_app.py did before the ingest module
+    interaction_df = pd.read_csv(source)
+    interaction_df.columns = interaction_df.columns.str.replace(' ', '_')
+    watched_df = interaction_df[interaction_df['Supplemental_Video_Type'].isnull()]
+    watched_df = watched_df[(watched_df['Duration'] > '00:01:00')].copy()
+    watched_df['watched_minutes'] = watched_df['Duration'].str.split(':').apply(lambda x: int(x[0]) * 60 + int(x[1]))
+    watched_df['duration_minutes'] = watched_df['Bookmark'].str.split(':').apply(lambda x: int(x[0]) * 60 + int(x[1]))
+    watched_df['watched_hours'] = watched_df['watched_minutes'] / 60
+    watched_df['percent_watched'] = watched_df['watched_minutes'] / watched_df['duration_minutes'] * 100
+    watched_df['percent_watched2'] = 5 * round(watched_df['percent_watched'] / 5)
+    watched_df["Show_Title"] = [s.partition(":")[0] for s in watched_df.Title]
+    temporary = watched_df['Title'].str.replace('(', '', regex=False)
+    watched_df["Film_Type"] = np.where(temporary.astype(str).str.contains(
+        pat='Season | Säsong | Series | Serie | Episode | Episod | Avsnitt', case=False), 'Series', 'Movie')
+    watched_df['Date'] = pd.to_datetime(watched_df['Start_Time'])
+    watched_df['Weekday'] = watched_df['Date'].dt.day_name()
+    watched_df['Hour'] = watched_df['Date'].dt.hour
+    return watched_df
+
+
+def measure(function, data):
+    start = time.perf_counter()
+    function(io.BytesIO(data))
+    elapsed = time.perf_counter() - start
+    # memory is traced in a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    df = function(io.BytesIO(data))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, df.memory_usage(deep=True).sum(), len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(SAMPLE, 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    data = header + b'\n' + (body.rstrip(b'\n') + b'\n') * args.repeat
+
+    print('{:<8} {:>10} {:>12} {:>12} {:>10}'.format('path', 'time (s)', 'peak (MB)', 'frame (MB)', 'rows'))
+    for name, function in [('legacy', legacy_ingest), ('ingest', load_watched)]:
+        elapsed, peak, size, rows = measure(function, data)
+        print('{:<8} {:>10.2f} {:>12.1f} {:>12.1f} {:>10}'.format(name, elapsed, peak / 2**20, size / 2**20, rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""IP location lookups in the memory-mapped range index, and the integer-coded ISO lookup vs the merge.
+
+Builds an index from a synthetic CIDR file (non-overlapping IPv4 networks
+and IPv6 prefixes, each with a country and region) in a temporary
+directory, then times 1M lookups of integer keys and of address strings
+with the repetition of a real export, next to a plain bisect over the
+ranges. Finally times the map's country sessions from the old merge and
+from the integer lookup on the sample history repeated ``r`` times. That
+the index and the lookup give the right answers is tested in
+tests/test_locations.py.
+
+    python -m benchmarks.bench_locations [--ranges 500000] [--lookups 1000000] [--repeat 50]
+"""
+
+import argparse
+import bisect
+import io
+import ipaddress
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.analysis import country_sessions, read_iso_codes
+from netflix_analysis.ingest import load_watched
+from netflix_analysis.locations import IPIndex, IsoLookup, build_ip_index, ip_key, read_ranges
+from netflix_analysis.rollup import RollupCube
+
+COUNTRIES = ['DK', 'SE', 'NL', 'CH', 'DE', 'GB', 'US', 'PT', 'ES', 'FI']
+
+
+def write_ranges(path, count, rng):
+    # IPv4 networks of /20 to /28 in random non-overlapping blocks, a tenth as many IPv6 /32 to /48 prefixes
+    v4_count, v6_count = count - count // 10, count // 10
+    starts = np.sort(rng.choice(2**32 // 2**12, size=v4_count, replace=False)).astype(np.int64) * 2**12
+    prefix = rng.integers(20, 29, size=v4_count)
+    v6_starts = np.sort(rng.choice(2**31, size=v6_count, replace=False)).astype(np.int64)
+    v6_prefix = rng.integers(32, 49, size=v6_count)
+    countries = rng.integers(len(COUNTRIES), size=count)
+    networks = ['{}/{}'.format(ipaddress.IPv4Address(int(s)), p) for s, p in zip(starts, prefix)]
+    networks += ['{}/{}'.format(ipaddress.IPv6Address((0x2000_0000 + int(s)) << 96), p)
+                 for s, p in zip(v6_starts, v6_prefix)]
+    regions = ['Region {}'.format(c % 50) for c in rng.integers(1000, size=count)]
+    pd.DataFrame({'network': networks, 'country': [COUNTRIES[c] for c in countries], 'region': regions}).to_csv(
+        path, index=False)
+
+
+def bisect_lookup(starts, rows, address):
+    # the plain reference: the last range starting at or before the address
+    key = ip_key(address)[1]
+    i = bisect.bisect_right(starts, key) - 1
+    if i >= 0 and key <= rows[i][1]:
+        return rows[i][2], rows[i][3]
+    return None
+
+
+def legacy_country_sessions(cube, iso_df):
+    # what the app merged on every rerun before the integer lookup
+    sessions = cube.total(['Profile_Name', 'Country'], 'sessions').rename('Sessions').reset_index()
+    sessions['iso_2'] = sessions['Country'].astype(str).str[0:2]
+    iso_df = iso_df[['iso_2', 'iso_3', 'Country']].rename(columns={'Country': 'Country_Name'})
+    sessions = sessions.drop(columns=['Country']).merge(iso_df, how='inner', on='iso_2')
+    return sessions.groupby(['Profile_Name', 'iso_2', 'iso_3', 'Country_Name'], as_index=False)['Sessions'].sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ranges', type=int, default=500_000)
+    parser.add_argument('--lookups', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=50, help='how often the sample history is repeated')
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ranges_path = os.path.join(tmp, 'ranges.csv')
+        write_ranges(ranges_path, args.ranges, rng)
+        start = time.perf_counter()
+        written, conflicts = build_ip_index(os.path.join(tmp, 'index'), read_ranges(ranges_path))
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        index = IPIndex(os.path.join(tmp, 'index'))
+        opened = time.perf_counter() - start
+        print('{} ranges indexed in {:.1f} s ({} conflicts), opened in {:.2f} ms'.format(
+            written, build, len(conflicts), opened * 1000))
+
+        rows = sorted((int(first), int(last), country, region)
+                      for first, last, country, region in read_ranges(ranges_path) if first.version == 4)
+        v4_keys = [row[0] for row in rows]
+        v6_starts = [int(first) for first, _, _, _ in read_ranges(ranges_path) if first.version == 6]
+        # half the sample addresses inside a range, half anywhere
+        inside = [v4_keys[i] + int(rng.integers(16)) for i in rng.integers(len(v4_keys), size=5_000)]
+        anywhere = rng.integers(2**32, size=4_000).tolist()
+        v6 = [ipaddress.IPv6Address(v6_starts[i] + int(rng.integers(2**63))).compressed
+              for i in rng.integers(len(v6_starts), size=1_000)]
+        sample = [str(ipaddress.IPv4Address(key)) for key in inside + anywhere] + v6
+        v4_sample = sample[:len(inside) + len(anywhere)]
+        start = time.perf_counter()
+        for address in v4_sample:
+            bisect_lookup(v4_keys, rows, address)
+        per_bisect = (time.perf_counter() - start) / len(v4_sample)
+
+        # again half inside a range
+        starts = np.array(v4_keys, dtype=np.uint32)
+        half = args.lookups // 2
+        inside_keys = starts[rng.integers(len(starts), size=half)] + rng.integers(16, size=half).astype(np.uint32)
+        keys = np.concatenate([inside_keys,
+                               rng.integers(2**32, size=args.lookups - half, dtype=np.uint64).astype(np.uint32)])
+        start = time.perf_counter()
+        codes = index.locate_keys(keys)
+        keys_seconds = time.perf_counter() - start
+
+        # exports repeat their addresses, a few thousand distinct ones per account
+        distinct = np.array(sample * 3, dtype=object)
+        addresses = distinct[rng.integers(len(distinct), size=args.lookups)]
+        start = time.perf_counter()
+        index.locate(addresses)
+        strings_seconds = time.perf_counter() - start
+
+        print('{} lookups, {:.1f} % located'.format(args.lookups, 100 * np.mean(codes >= 0)))
+        print('{:<22} {:8.3f} s  {:8.0f} ns per lookup'.format('integer keys', keys_seconds,
+                                                              keys_seconds / args.lookups * 1e9))
+        print('{:<22} {:8.3f} s  {:8.0f} ns per lookup'.format('address strings', strings_seconds,
+                                                              strings_seconds / args.lookups * 1e9))
+        print('{:<22} {:8.3f} s  {:8.0f} ns per lookup (extrapolated)'.format(
+            'python bisect', per_bisect * args.lookups, per_bisect * 1e9))
+        del index, codes
+
+    iso_df = read_iso_codes()
+    iso = IsoLookup.from_frame(iso_df)
+    with open('Files/ViewingActivity.csv', 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    watched_df = load_watched(io.BytesIO(header + b'\n' + (body.rstrip(b'\n') + b'\n') * args.repeat))
+    cube = RollupCube.from_frame(watched_df)
+    for name, function, data in [('merge', legacy_country_sessions, iso_df), ('integer lookup', country_sessions, iso)]:
+        start = time.perf_counter()
+        for _ in range(20):
+            function(cube, data)
+        print('{:<22} {:8.2f} ms per map'.format(name, (time.perf_counter() - start) / 20 * 1000))
+
+
+if __name__ == '__main__':
+    main()
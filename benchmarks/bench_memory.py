@@ -0,0 +1,69 @@
+"""Memory across many reruns of netflix_analysis_app.py.
+
+Runs the app headlessly (like bench_rerun) ``--runs`` times against the
+local TMDB stub and reports the resident memory after the warm-up reruns
+and at the end, the matplotlib figures left open and whether anything was
+written to the app directory. Exits with 1 when the memory grew by more
+than ``--max-growth-mb`` or anything was left behind. The widgets keep
+their defaults, so after the first run every chart comes from the figure
+cache; tests/test_figures.py checks the memory over reruns that build new
+figures, the FigureCache budget and the closing of figures.
+
+    python -m benchmarks.bench_memory [--runs 100] [--max-growth-mb 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks.bench_rerun import APP, run_app
+from benchmarks.stub_tmdb import StubTMDBServer
+
+WARMUP = 10
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def directory_state(path):
+    return {name: os.stat(os.path.join(path, name)).st_mtime_ns for name in os.listdir(path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--max-growth-mb', type=float, default=20)
+    args = parser.parse_args()
+
+    with StubTMDBServer() as server, tempfile.TemporaryDirectory() as tmp:
+        os.environ['TMDB_API_URL'] = server.url
+        os.environ['TMDB_API_KEY'] = 'stub'
+        os.environ['TMDB_CACHE_PATH'] = os.path.join(tmp, 'tmdb.sqlite')
+        app_dir = os.path.dirname(APP)
+        os.chdir(app_dir)
+
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        before = directory_state(app_dir)
+        samples = []
+        open_figures = 0
+        for run in range(args.runs):
+            run_app()
+            samples.append(rss())
+            open_figures = max(open_figures, len(plt.get_fignums()))
+        written = directory_state(app_dir) != before
+
+    growth = (samples[-1] - samples[WARMUP - 1]) / 2**20
+    print('{} reruns: RSS {:.0f} MB after {}, {:.0f} MB after {} ({:+.1f} MB), at most {} open figures, {}'.format(
+        args.runs, samples[WARMUP - 1] / 2**20, WARMUP, samples[-1] / 2**20, args.runs, growth, open_figures,
+        'files written to the app directory' if written else 'no files written'))
+    return 1 if growth >= args.max_growth_mb or open_figures or written else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
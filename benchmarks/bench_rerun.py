@@ -0,0 +1,60 @@
+"""Rerun latency of netflix_analysis_app.py with and without the cached stages.
+
+The script is executed headlessly (streamlit "bare mode", widgets return
+their defaults) against the local TMDB stub. "uncached" clears the
+process-wide stores (the sample export's stages, the figure cache, the TMDB
+client) before every run, which is what every widget interaction cost before
+the preprocessing was split into stored stages; "cached" is a normal rerun.
+
+    python -m benchmarks.bench_rerun [--runs 10]
+"""
+
+import argparse
+import os
+import runpy
+import statistics
+import tempfile
+import time
+
+from benchmarks.stub_tmdb import StubTMDBServer
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'netflix_analysis_app.py')
+
+
+def run_app():
+    start = time.perf_counter()
+    runpy.run_path(APP, run_name='__main__')
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with StubTMDBServer() as server, tempfile.TemporaryDirectory() as tmp:
+        os.environ['TMDB_API_URL'] = server.url
+        os.environ['TMDB_API_KEY'] = 'stub'
+        os.environ['TMDB_CACHE_PATH'] = os.path.join(tmp, 'tmdb.sqlite')
+        os.chdir(os.path.dirname(APP))
+
+        import matplotlib
+        matplotlib.use('Agg')
+        import streamlit as st
+
+        run_app()  # warms up imports and the TMDB response cache
+
+        uncached = []
+        for _ in range(args.runs):
+            st.experimental_singleton.clear()
+            uncached.append(run_app())
+
+        cached = [run_app() for _ in range(args.runs)]
+
+    for name, timings in [('uncached', uncached), ('cached', cached)]:
+        print('{:<9} median {:7.3f} s   min {:7.3f} s   max {:7.3f} s'.format(
+            name, statistics.median(timings), min(timings), max(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Chart data from the rollup cube vs a groupby over every watched row.
+
+Times the old per-chart groupbys for the watch time, map, device and
+heatmap charts against the same charts sliced from the cube, per profile
+change. That both give the same numbers is tested in tests/test_rollup.py.
+
+    python -m benchmarks.bench_rollup [--repeat 50]
+"""
+
+import argparse
+import io
+import time
+
+import pandas as pd
+
+from netflix_analysis.ingest import load_watched
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile, weekday_hour_counts
+
+
+def legacy_charts(watched_df, profiles):
+    # the groupbys netflix_analysis_app.py ran on every rerun before the cube
+    selected = watched_df[watched_df['Profile_Name'].isin(profiles)]
+    watch_time = watched_df.groupby(['Profile_Name'], as_index=False, observed=True)['watched_hours'].sum()
+    countries = selected.groupby(by='Country', as_index=False, observed=True).agg({'Start_Time': pd.Series.nunique})
+    words = selected.Device_Type.str.split(expand=True).stack().value_counts()
+    heatmap = watched_df.groupby(['Weekday', 'Hour', 'Profile_Name'], observed=True).size().reset_index(name='Counts')
+    return watch_time, countries, words, heatmap
+
+
+def sessions_by_country(cube):
+    # the country sessions of legacy_charts from the cube; equal to counting unique Start_Time values per country
+    # unless two selected profiles started watching in the same second. The app maps ISO codes instead.
+    return cube.total('Country', 'sessions').rename('Sessions').rename_axis('Country').reset_index()
+
+
+def device_word_counts(cube):
+    # the word counts of legacy_charts from the cube, which the app replaced with device families
+    views = cube.total('Device_Type').rename('Count').rename_axis('Device_Type').reset_index()
+    views['sub_device'] = views['Device_Type'].astype(str).str.split()
+    words = views.explode('sub_device')
+    return words.groupby('sub_device', as_index=False)['Count'].sum().sort_values('Count', ascending=False)
+
+
+def cube_charts(cube, profiles):
+    selected = cube.select(Profile_Name=profiles)
+    return (watch_time_by_profile(cube), sessions_by_country(selected), device_word_counts(selected),
+            weekday_hour_counts(cube))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50, help='how often the sample history is repeated')
+    args = parser.parse_args()
+
+    with open('Files/ViewingActivity.csv', 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    big = load_watched(io.BytesIO(header + b'\n' + (body.rstrip(b'\n') + b'\n') * args.repeat))
+    profiles = list(big['Profile_Name'].unique())
+    start = time.perf_counter()
+    big_cube = RollupCube.from_frame(big)
+    build = time.perf_counter() - start
+
+    timings = {}
+    for name, function, data in [('groupby', legacy_charts, big), ('cube', cube_charts, big_cube)]:
+        start = time.perf_counter()
+        for profile in profiles:
+            function(data, [profile])
+        timings[name] = (time.perf_counter() - start) / len(profiles)
+
+    print('{} watched rows, {} cube cells, cube built in {:.2f} s'.format(len(big), len(big_cube), build))
+    for name, seconds in timings.items():
+        print('{:<8} {:8.1f} ms per profile change'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Time to the first chart: parsing the export zip vs loading its snapshot.
+
+For every size a synthetic export is generated and loaded the three ways
+the app can get to the first chart (the watch time bar chart, as a Plotly
+spec): parsing the zip, the memory-mapped snapshot the app keeps for an
+export it parsed before, and the compressed snapshot a user downloads and
+uploads again. That all three give the same frames is tested in
+tests/test_snapshot.py.
+
+    python -m benchmarks.bench_snapshot [--sizes 100000 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import plotly.express as px
+
+from benchmarks.synthetic_export import write_export
+from netflix_analysis.analysis import parse_export
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile
+from netflix_analysis.snapshot import snapshot_bytes, snapshot_path
+
+
+def first_chart(load):
+    # what the app does before it can show the first chart
+    start = time.perf_counter()
+    snapshot = load()
+    cube = RollupCube.from_frame(snapshot.watched_df)
+    px.bar(watch_time_by_profile(cube), x='Profile_Name', y='watched_hours', color='watched_hours').to_json()
+    return time.perf_counter() - start, snapshot
+
+
+def best_of(repeat, load):
+    timings, snapshot = zip(*[first_chart(load) for _ in range(repeat)])
+    return min(timings), snapshot[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3, help='loads per way, the fastest counts')
+    args = parser.parse_args()
+
+    print('{:>9} {:<22} {:>10} {:>12} {:>9}'.format('rows', 'source', 'MB', 'first chart', 'speedup'))
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.zip')
+            write_export(path, rows=rows, titles=max(100, rows // 50))
+            with open(path, 'rb') as f:
+                export_bytes = f.read()
+
+            parsed_seconds, parsed = best_of(args.repeat, lambda: parse_export(export_bytes))
+            parse_export(export_bytes, 'export', tmp)  # parses once more and keeps the snapshot
+            cached_seconds, _ = best_of(args.repeat, lambda: parse_export(export_bytes, 'export', tmp))
+            download = snapshot_bytes(parsed)
+            uploaded_seconds, _ = best_of(args.repeat, lambda: parse_export(download, 'upload'))
+
+            for label, size, seconds in [
+                    ('export zip', len(export_bytes), parsed_seconds),
+                    ('snapshot (memory map)', os.path.getsize(snapshot_path('export', tmp)), cached_seconds),
+                    ('snapshot (upload)', len(download), uploaded_seconds)]:
+                print('{:>9} {:<22} {:>10.1f} {:>10.2f} s {:>8.1f}x'.format(
+                    rows, label, size / 2**20, seconds, parsed_seconds / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Title classification: per-row regex vs parsing each distinct title once.
+
+Uses the distinct titles of the sample history and repeats them so that
+every title appears ``r`` times, for growing ``r``.
+
+    python -m benchmarks.bench_titles
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.titles import classify_titles, parse_title
+
+
+def legacy_classify(titles):
+    # the per-row Show_Title / Film_Type logic the app used before
+    show_title = [s.partition(":")[0] for s in titles]
+    temporary = titles.str.replace('(', '', regex=False)
+    film_type = np.where(temporary.astype(str).str.contains(
+        pat='Season | Säsong | Series | Serie | Episode | Episod | Avsnitt', case=False), 'Series', 'Movie')
+    return show_title, film_type
+
+
+def best_of(function, argument, runs=3):
+    timings = []
+    for _ in range(runs):
+        parse_title.cache_clear()
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    history = pd.read_csv('Files/ViewingActivity.csv', usecols=['Title'])
+    unique_titles = history['Title'].dropna().unique()
+    print('{} distinct titles'.format(len(unique_titles)))
+    print('{:>8} {:>10} {:>12} {:>12} {:>8}'.format('repeats', 'rows', 'per-row (s)', 'distinct (s)', 'speedup'))
+    for repeats in [1, 10, 100, 300]:
+        titles = pd.Series(np.tile(unique_titles, repeats))
+        categorical = titles.astype('category')
+        legacy = best_of(legacy_classify, titles)
+        # the ingest stage reads Title as a categorical, so the conversion is not part of the work here
+        distinct = best_of(classify_titles, categorical)
+        print('{:>8} {:>10} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+            repeats, len(titles), legacy, distinct, legacy / distinct))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Cold vs warm TMDB lookups per 1,000 titles against the local stub server.
+
+    python -m benchmarks.bench_tmdb [--titles 1000] [--latency 0.05]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.stub_tmdb import StubTMDBServer
+from netflix_analysis.tmdb_client import TMDBCache, TMDBClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--titles', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every stub response')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    titles = ['Benchmark Movie {}'.format(i) for i in range(args.titles)]
+    per_1000 = 1000 / args.titles
+
+    with StubTMDBServer(latency=args.latency, rate_limit_every=97) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'tmdb.sqlite')
+
+        # what the app did before: one request after another, no cache
+        sequential = TMDBClient('stub', base_url=server.url, cache=TMDBCache(':memory:'), max_workers=1,
+                                requests_per_second=10_000)
+        sample = titles[:50]
+        start = time.perf_counter()
+        for title in sample:
+            sequential._get('/search/movie', {'query': title})
+        sequential_time = (time.perf_counter() - start) * 1000 / len(sample)
+        sequential.close()
+
+        client = TMDBClient('stub', base_url=server.url, cache=TMDBCache(cache_path), max_workers=args.workers)
+        start = time.perf_counter()
+        client.search_movies(titles)
+        cold = time.perf_counter() - start
+        client.close()
+
+        # a fresh client on the same cache file simulates an app restart
+        client = TMDBClient('stub', base_url=server.url, cache=TMDBCache(cache_path), max_workers=args.workers)
+        start = time.perf_counter()
+        client.search_movies(titles)
+        warm = time.perf_counter() - start
+        assert client.misses == 0
+        client.close()
+
+    print('titles: {}, stub latency: {:.0f} ms'.format(args.titles, args.latency * 1000))
+    print('sequential (estimated): {:8.2f} s per 1000 titles'.format(sequential_time))
+    print('cold load:              {:8.2f} s per 1000 titles'.format(cold * per_1000))
+    print('warm load:              {:8.2f} s per 1000 titles'.format(warm * per_1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Rerun latency of the app under N concurrent sessions.
+
+Starts ``streamlit run netflix_analysis_app.py`` headless on a free port,
+with the TMDB client pointed at the local stub and its response cache in a
+temporary directory, and opens N websocket sessions the way browsers do.
+Every session asks for a rerun, waits for the script to finish, and repeats;
+the first run of each session and the later reruns are reported separately.
+
+    python -m benchmarks.load_test [--sessions 8] [--reruns 5] [--tmdb-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.stub_tmdb import StubTMDBServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'netflix_analysis_app.py')
+
+# the websocket route moved under _stcore in Streamlit 1.18
+STREAM_PATHS = ['_stcore/stream', 'stream']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, env):
+    command = [sys.executable, '-m', 'streamlit', 'run', APP, '--server.headless', 'true',
+               '--server.port', str(port), '--server.address', '127.0.0.1',
+               '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_until_healthy(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('streamlit exited: ' + process.stderr.read().decode(errors='replace'))
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:{}/healthz'.format(port), timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('streamlit did not start within {} s'.format(timeout))
+
+
+async def connect(port):
+    from tornado.websocket import websocket_connect
+
+    for path in STREAM_PATHS:
+        try:
+            return await websocket_connect('ws://127.0.0.1:{}/{}'.format(port, path))
+        except Exception:
+            continue
+    raise RuntimeError('no websocket endpoint found on port {}'.format(port))
+
+
+async def rerun(connection):
+    """Seconds until the script run started by a rerun request finishes, and whether it raised."""
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    message = BackMsg()
+    message.rerun_script.query_string = ''
+    start = time.perf_counter()
+    await connection.write_message(message.SerializeToString(), binary=True)
+    failed = False
+    while True:
+        data = await connection.read_message()
+        if data is None:
+            raise RuntimeError('the server closed the session')
+        forward = ForwardMsg()
+        forward.ParseFromString(data)
+        kind = forward.WhichOneof('type')
+        if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+            failed = failed or forward.delta.new_element.WhichOneof('type') == 'exception'
+        elif kind == 'script_finished':
+            return time.perf_counter() - start, failed
+
+
+async def session(port, reruns):
+    connection = await connect(port)
+    try:
+        return [await rerun(connection) for _ in range(reruns + 1)]
+    finally:
+        connection.close()
+
+
+async def load(port, sessions, reruns):
+    return await asyncio.gather(*[session(port, reruns) for _ in range(sessions)])
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def report(name, timings):
+    print('{:<6} runs {:4d}   p50 {:7.3f} s   p95 {:7.3f} s   max {:7.3f} s'.format(
+        name, len(timings), statistics.median(timings), percentile(timings, 95), max(timings)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--reruns', type=int, default=5, help='reruns per session after its first run')
+    parser.add_argument('--tmdb-latency', type=float, default=0.05, help='seconds added to every stub response')
+    args = parser.parse_args()
+
+    with StubTMDBServer(latency=args.tmdb_latency) as server, tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, TMDB_API_URL=server.url, TMDB_API_KEY='stub',
+                   TMDB_CACHE_PATH=os.path.join(tmp, 'tmdb.sqlite'), MPLBACKEND='Agg')
+        port = free_port()
+        process = start_server(port, env)
+        try:
+            wait_until_healthy(port, process)
+            # one session first, so the process-wide assets are loaded before the load starts
+            asyncio.run(load(port, 1, 0))
+            start = time.perf_counter()
+            results = asyncio.run(load(port, args.sessions, args.reruns))
+            elapsed = time.perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    first = [runs[0][0] for runs in results]
+    later = [seconds for runs in results for seconds, _ in runs[1:]]
+    failed = sum(failed for runs in results for _, failed in runs)
+    print('{} sessions x {} reruns in {:.1f} s, TMDB stub requests: {}, runs with an exception: {}'.format(
+        args.sessions, args.reruns + 1, elapsed, server.requests, failed))
+    report('first', first)
+    if later:
+        report('rerun', later)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Benchmark suite: every processing stage of the app on synthetic exports.
+
+For each size a synthetic export is generated (see synthetic_export.py) and
+the stages the app runs are executed headlessly, one after the other.
+Wall time and peak memory above the level before the stage are reported
+per stage. Peak memory is sampled from the process RSS every few
+milliseconds, so very short stages, and stages reusing memory an earlier
+stage freed, may show less than they allocate.
+
+    python -m benchmarks.run_suite [--rows 10000 100000 1000000 10000000] [--csv results.csv]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.stub_tmdb import fake_search_result, GENRES
+from benchmarks.synthetic_export import write_export
+from netflix_analysis.analysis import country_sessions, read_iso_codes
+from netflix_analysis.archive import ExportArchive, VIEWING_ACTIVITY, read_export
+from netflix_analysis.chunked import summarize_viewing_activity, title_counts
+from netflix_analysis.devices import device_family_counts
+from netflix_analysis.genres import explode_genres, genre_frequency, genre_names
+from netflix_analysis.ingest import prepare_watched
+from netflix_analysis.locations import IsoLookup, login_counts, login_locations
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile, weekday_hour_counts
+
+# the suite reads exports far bigger than the app accepts from uploads
+LIMITS = dict(max_member_size=2**40, max_total_size=2**40)
+
+
+def _rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakMemory:
+    """Peak RSS growth while the block runs (tracemalloc where /proc is not available)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+
+    def __enter__(self):
+        if not os.path.exists('/proc/self/statm'):
+            tracemalloc.start()
+            return self
+        self._start = self._max = _rss()
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while self._running:
+            self._max = max(self._max, _rss())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        if tracemalloc.is_tracing():
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return
+        self._running = False
+        self._thread.join()
+        self.peak = max(self._max, _rss()) - self._start
+
+
+def movie_database(titles):
+    # TMDB search results as the stub server would return them, so the suite needs no network
+    results = [fake_search_result(title)['results'][0] for title in titles]
+    return pd.DataFrame(results)[['genre_ids', 'original_title', 'vote_average', 'vote_count', 'release_date']]
+
+
+def run_stages(path):
+    """Run every stage on the export at ``path``, yielding (stage, seconds, peak bytes, rows)."""
+    state = {}
+
+    def load():
+        state['interaction'], state['billing'], state['ip'] = read_export(path, **LIMITS)
+        state['ip'].columns = state['ip'].columns.str.replace(' ', '_')
+        return len(state['interaction'])
+
+    def watched():
+        state['watched'] = prepare_watched(state.pop('interaction'))
+        return len(state['watched'])
+
+    def rollup():
+        state['cube'] = RollupCube.from_frame(state['watched'])
+        return len(state['cube'])
+
+    def favorites():
+        return len(title_counts(state['watched']))
+
+    def charts():
+        cube = state['cube']
+        profiles = list(cube.levels['Profile_Name'])
+        iso = IsoLookup.from_frame(read_iso_codes())
+        watch_time_by_profile(cube)
+        weekday_hour_counts(cube)
+        login_counts(login_locations(state['ip']))
+        for profile in profiles:
+            selected = cube.select(Profile_Name=[profile])
+            country_sessions(selected, iso)
+            device_family_counts(selected)
+        return len(profiles)
+
+    def genres():
+        watched_df = state['watched']
+        movies = watched_df[(watched_df['Film_Type'] == 'Movie') & (watched_df['percent_watched2'] >= 80)]
+        movie_genres = explode_genres(movie_database(movies['Title'].astype(str).unique()),
+                                      genre_names({'genres': GENRES}))
+        views = movies[['Profile_Name', 'Show_Title']].merge(movie_genres, how='inner', left_on=['Show_Title'],
+                                                             right_on=['original_title'])
+        genre_frequency(views, list(watched_df['Profile_Name'].unique()))
+        return len(views)
+
+    def chunked():
+        state.clear()
+        with ExportArchive(path, **LIMITS) as archive, archive.open(VIEWING_ACTIVITY) as f:
+            return summarize_viewing_activity(f).rows
+
+    for name, stage in [('read_export', load), ('prepare_watched', watched), ('rollup_cube', rollup),
+                        ('favorites', favorites), ('chart_slices', charts), ('genres', genres),
+                        ('chunked_summary', chunked)]:
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            rows = stage()
+            elapsed = time.perf_counter() - start
+        yield name, elapsed, memory.peak, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--profiles', type=int, default=5)
+    parser.add_argument('--titles', type=int, default=None, help='distinct titles (default: rows / 50)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='also write the results to this CSV file')
+    args = parser.parse_args()
+
+    results = []
+    print('{:>10} {:<16} {:>10} {:>12} {:>12}'.format('rows', 'stage', 'time (s)', 'peak (MB)', 'output'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, 'export_{}.zip'.format(rows))
+            titles = args.titles or max(100, rows // 50)
+            start = time.perf_counter()
+            write_export(path, rows=rows, profiles=args.profiles, titles=titles, seed=args.seed)
+            print('{:>10} {:<16} {:>10.2f} {:>12} {:>12}'.format(rows, '(generate)', time.perf_counter() - start,
+                                                                 '', os.path.getsize(path)))
+            for stage, seconds, peak, output in run_stages(path):
+                print('{:>10} {:<16} {:>10.2f} {:>12.1f} {:>12}'.format(rows, stage, seconds, peak / 2**20, output))
+                results.append({'rows': rows, 'stage': stage, 'seconds': seconds, 'peak_bytes': peak,
+                                'output_rows': output})
+            os.remove(path)
+
+    if args.csv:
+        pd.DataFrame(results).to_csv(args.csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
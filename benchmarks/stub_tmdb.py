@@ -0,0 +1,110 @@
+"""Local stand-in for the TMDB API used by the benchmarks.
+
+Serves ``/3/search/movie`` and ``/3/genre/movie/list`` with made up but
+deterministic data, optionally adding latency to every response.
+"""
+
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENRES = [
+    {'id': 28, 'name': 'Action'}, {'id': 12, 'name': 'Adventure'}, {'id': 16, 'name': 'Animation'},
+    {'id': 35, 'name': 'Comedy'}, {'id': 80, 'name': 'Crime'}, {'id': 99, 'name': 'Documentary'},
+    {'id': 18, 'name': 'Drama'}, {'id': 10751, 'name': 'Family'}, {'id': 14, 'name': 'Fantasy'},
+    {'id': 36, 'name': 'History'}, {'id': 27, 'name': 'Horror'}, {'id': 10402, 'name': 'Music'},
+    {'id': 9648, 'name': 'Mystery'}, {'id': 10749, 'name': 'Romance'}, {'id': 878, 'name': 'Science Fiction'},
+    {'id': 10770, 'name': 'TV Movie'}, {'id': 53, 'name': 'Thriller'}, {'id': 10752, 'name': 'War'},
+    {'id': 37, 'name': 'Western'},
+]
+
+
+def fake_search_result(title):
+    seed = zlib.crc32(title.encode('utf-8'))
+    return {
+        'page': 1,
+        'results': [{
+            'id': seed % 1_000_000,
+            'original_title': title,
+            'title': title,
+            'genre_ids': [GENRES[seed % len(GENRES)]['id'], GENRES[(seed // 7) % len(GENRES)]['id']],
+            'vote_average': round(4 + (seed % 60) / 10, 1),
+            'vote_count': seed % 20_000,
+            'popularity': (seed % 1000) / 10,
+            'release_date': '{}-01-01'.format(1980 + seed % 42),
+        }],
+        'total_pages': 1,
+        'total_results': 1,
+    }
+
+
+class StubTMDBServer:
+    """Threaded HTTP server on localhost; use as a context manager.
+
+    Every ``rate_limit_every``-th request is answered with a 429 to exercise
+    the client's backoff, and searches for the titles in ``failing`` with a
+    500. ``queries`` lists the searched titles in the order they arrived.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0, failing=()):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.failing = set(failing)
+        self.requests = 0
+        self.queries = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    count = stub.requests
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.rate_limit_every and count % stub.rate_limit_every == 0:
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0')
+                    self.end_headers()
+                    return
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path.endswith('/search/movie'):
+                    title = query.get('query', [''])[0]
+                    with stub._lock:
+                        stub.queries.append(title)
+                    if title in stub.failing:
+                        self.send_response(500)
+                        self.end_headers()
+                        return
+                    body = fake_search_result(title)
+                elif url.path.endswith('/genre/movie/list'):
+                    body = {'genres': GENRES}
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json;charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/3'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,178 @@
+"""Deterministic synthetic Netflix exports.
+
+Writes a zip in the real export layout (CONTENT_INTERACTION/,
+PAYMENT_AND_BILLING/, IP_ADDRESSES/) with the same columns as the real
+ViewingActivity.csv, BillingHistory.csv and IpAddressesStreaming.csv. The
+same arguments and seed always give the same file.
+
+    python -m benchmarks.synthetic_export export.zip --rows 1000000 --profiles 5 --titles 20000
+"""
+
+import argparse
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+VIEWING_COLUMNS = ['Profile Name', 'Start Time', 'Duration', 'Attributes', 'Title', 'Supplemental Video Type',
+                   'Device Type', 'Bookmark', 'Latest Bookmark', 'Country']
+IP_COLUMNS = ['Esn', 'Country', 'Localized Device Description', 'Device Description', 'Ip',
+              'Region Code Display Name', 'Ts']
+BILLING_COLUMNS = ['Transaction Date', 'Service Period Start Date', 'Service Period End Date', 'Description',
+                   'Payment Type', 'Mop Creation Date', 'Mop Pmt Processor Desc', 'Item Price Amt', 'Currency',
+                   'Tax Amt', 'Gross Sale Amt', 'Pmt Txn Type', 'Pmt Status', 'Final Invoice Result', 'Country',
+                   'Next Billing Date']
+
+PROFILE_NAMES = ['Sebastian', 'Johana', 'John', 'Robin', 'Living room', 'Kids', 'Anna', 'Erik', 'Lena', 'Max']
+DEVICES = ['Samsung 2016 UHD Smart TV', 'Apple iPhone 8 (GSM)', 'Chrome PC (Cadmium)', 'Apple iPad Air 2',
+           'Google Chromecast V3 Streaming Stick', 'Sony PS4', 'LG 2019 webOS TV', 'Android Phone (Samsung S21)',
+           'Chrome MAC (Cadmium)', 'Amazon Fire TV Stick 4K', 'Xbox One S', 'Oculus Quest VR']
+COUNTRIES = [('NL (Netherlands)', 'Noord-Holland'), ('SE (Sweden)', 'Stockholm'), ('DK (Denmark)', 'Central Denmark'),
+             ('CH (Switzerland)', 'Zurich'), ('DE (Germany)', 'Berlin'), ('US (United States)', 'California'),
+             ('ES (Spain)', 'Madrid'), ('GB (United Kingdom)', 'England')]
+SEASON_WORDS = ['Season', 'Säsong', 'Staffel', 'Seizoen']
+EPISODE_WORDS = ['Episode', 'Avsnitt', 'Folge', 'Aflevering']
+
+# every duration up to this many seconds is formatted once and looked up
+_MAX_SECONDS = 4 * 3600
+_DURATIONS = np.array(['{}:{:02d}:{:02d}'.format(s // 3600, s // 60 % 60, s % 60) for s in range(_MAX_SECONDS)],
+                      dtype=object)
+
+
+def make_titles(count, rng, series_share=0.7):
+    """``count`` distinct titles, about ``series_share`` of them series episodes."""
+    titles = []
+    for i in range(count):
+        if rng.random() < series_share:
+            language = rng.integers(len(SEASON_WORDS))
+            episode = int(rng.integers(1, 13))
+            titles.append('Show {}: {} {}: Chapter {} ({} {})'.format(
+                i // 40, SEASON_WORDS[language], i % 40 // 10 + 1, i, EPISODE_WORDS[language], episode))
+        else:
+            titles.append('Movie {}'.format(i))
+    return np.array(titles, dtype=object)
+
+
+def viewing_chunks(rows, profiles, titles, start, end, seed, chunksize=500_000):
+    """Yield ViewingActivity frames with ``rows`` rows in total."""
+    rng = np.random.default_rng(seed)
+    title_pool = make_titles(titles, rng)
+    # popular titles are watched far more often than the long tail
+    popularity = 1 / np.arange(1, titles + 1) ** 0.8
+    popularity /= popularity.sum()
+    names = np.array((PROFILE_NAMES * (profiles // len(PROFILE_NAMES) + 1))[:profiles], dtype=object)
+    names = np.array(['{} {}'.format(n, i // len(PROFILE_NAMES)) if i >= len(PROFILE_NAMES) else n
+                      for i, n in enumerate(names)], dtype=object)
+    # each profile mostly uses a couple of devices and one home country
+    profile_devices = rng.integers(len(DEVICES), size=(profiles, 3))
+    profile_country = rng.integers(len(COUNTRIES), size=profiles)
+    countries = np.array([c for c, _ in COUNTRIES], dtype=object)
+    start_s = pd.Timestamp(start).value // 10**9
+    end_s = pd.Timestamp(end).value // 10**9
+
+    for offset in range(0, rows, chunksize):
+        n = min(chunksize, rows - offset)
+        profile = rng.integers(profiles, size=n)
+        started = np.sort(rng.integers(start_s, end_s, size=n))[::-1]
+        bookmark = rng.integers(60, _MAX_SECONDS - 1, size=n)
+        watched = np.minimum(bookmark, (bookmark * rng.beta(3, 0.8, size=n)).astype(np.int64))
+        trailer = rng.random(n) < 0.12
+        watched[trailer] = rng.integers(5, 90, size=trailer.sum())
+        travelling = rng.random(n) < 0.05
+        country = np.where(travelling, rng.integers(len(COUNTRIES), size=n), profile_country[profile])
+
+        frame = pd.DataFrame({
+            'Profile Name': names[profile],
+            'Start Time': pd.to_datetime(started, unit='s'),
+            'Duration': _DURATIONS[watched],
+            'Attributes': np.where(rng.random(n) < 0.2, 'Autoplayed: user action: None;', None),
+            'Title': title_pool[rng.choice(titles, size=n, p=popularity)],
+            'Supplemental Video Type': np.where(trailer, 'TRAILER', None),
+            'Device Type': np.array(DEVICES, dtype=object)[profile_devices[profile, rng.integers(3, size=n)]],
+            'Bookmark': _DURATIONS[bookmark],
+            'Latest Bookmark': np.where(rng.random(n) < 0.8, _DURATIONS[bookmark], 'Not latest view'),
+            'Country': countries[country],
+        })
+        yield frame
+
+
+def ip_addresses(rows, start, end, seed):
+    """IpAddressesStreaming rows with logins between ``start`` and ``end``."""
+    rng = np.random.default_rng(seed + 1)
+    country = rng.integers(len(COUNTRIES), size=rows)
+    device = rng.integers(len(DEVICES), size=rows)
+    ip = rng.integers(1, 224, size=(rows, 4))
+    ts = pd.to_datetime(rng.integers(pd.Timestamp(start).value // 10**9, pd.Timestamp(end).value // 10**9, size=rows),
+                        unit='s')
+    return pd.DataFrame({
+        'Esn': ['NFESN-{:08X}'.format(d * 1_000_003 % 2**32) for d in device],
+        'Country': [COUNTRIES[c][0][:2] for c in country],
+        'Localized Device Description': np.array(DEVICES, dtype=object)[device],
+        'Device Description': np.array(DEVICES, dtype=object)[device],
+        'Ip': ['{}.{}.{}.{}'.format(*octets) for octets in ip],
+        'Region Code Display Name': [COUNTRIES[c][1] for c in country],
+        'Ts': ts.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+    }, columns=IP_COLUMNS)
+
+
+def billing_history(start, end):
+    months = pd.date_range(start, end, freq='MS')
+    return pd.DataFrame({
+        'Transaction Date': months.strftime('%Y-%m-%d'),
+        'Service Period Start Date': months.strftime('%Y-%m-%d'),
+        'Service Period End Date': (months + pd.DateOffset(months=1) - pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+        'Description': 'SUBSCRIPTION',
+        'Payment Type': 'EU_DIRECT_DEBIT',
+        'Mop Creation Date': None,
+        'Mop Pmt Processor Desc': 'DD-EUR',
+        'Item Price Amt': 13.99,
+        'Currency': 'EUR',
+        'Tax Amt': 2.43,
+        'Gross Sale Amt': 13.99,
+        'Pmt Txn Type': 'SALE',
+        'Pmt Status': 'APPROVED',
+        'Final Invoice Result': 'SETTLED',
+        'Country': 'NL',
+        'Next Billing Date': (months + pd.DateOffset(months=1)).strftime('%Y-%m-%d'),
+    }, columns=BILLING_COLUMNS)
+
+
+def _write_csv(zip_file, name, frames):
+    # a fixed timestamp keeps the zip byte-for-byte reproducible
+    info = zipfile.ZipInfo(name, date_time=(2021, 10, 17, 0, 0, 0))
+    info.compress_type = zip_file.compression
+    with zip_file.open(info, 'w', force_zip64=True) as raw:
+        with io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+            header = True
+            for frame in frames:
+                frame.to_csv(out, index=False, header=header, date_format='%Y-%m-%d %H:%M:%S')
+                header = False
+
+
+def write_export(path, rows=100_000, profiles=5, titles=5_000, start='2017-01-01', end='2021-10-17', seed=0,
+                 compression=zipfile.ZIP_DEFLATED):
+    """Write a synthetic export zip to ``path`` (a file name or a binary file object)."""
+    with zipfile.ZipFile(path, 'w', compression=compression, compresslevel=1) as zip_file:
+        _write_csv(zip_file, 'CONTENT_INTERACTION/ViewingActivity.csv',
+                   viewing_chunks(rows, profiles, titles, start, end, seed))
+        _write_csv(zip_file, 'PAYMENT_AND_BILLING/BillingHistory.csv', [billing_history(start, end)])
+        _write_csv(zip_file, 'IP_ADDRESSES/IpAddressesStreaming.csv',
+                   [ip_addresses(max(10, rows // 20), start, end, seed)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help='zip file to write')
+    parser.add_argument('--rows', type=int, default=100_000, help='ViewingActivity rows')
+    parser.add_argument('--profiles', type=int, default=5)
+    parser.add_argument('--titles', type=int, default=5_000, help='number of distinct titles')
+    parser.add_argument('--start', default='2017-01-01', help='first viewing and login date')
+    parser.add_argument('--end', default='2021-10-17', help='last viewing and login date')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.output, args.rows, args.profiles, args.titles, args.start, args.end, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Data processing helpers used by netflix_analysis_app.py."""
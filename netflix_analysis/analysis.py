@@ -0,0 +1,471 @@
+"""Everything the app shows, computed without Streamlit.
+
+:func:`analyze` takes the three export frames (or :func:`analyze_export` a
+zip or a snapshot file, see :mod:`netflix_analysis.snapshot`) and returns
+an :class:`AnalysisResult` with one tidy frame per chart.
+Frames that the app filters by the selected profiles keep a Profile_Name
+column, so a selection is a filter and a sum instead of a new computation.
+The Streamlit page caches and renders the same stage functions.
+
+Many exports can be precomputed at once, in parallel worker processes::
+
+    python -m netflix_analysis.analysis exports/ results/ --workers 8
+
+writes ``results/<export name>/`` with one Parquet file per chart and a
+``metrics.json``. :func:`read_result` loads such a directory again. With
+``--chunked`` the viewing histories are aggregated chunk by chunk (see
+:mod:`netflix_analysis.chunked`), for exports too large to parse whole.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, fields
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.archive import (BILLING_HISTORY, IP_ADDRESSES_STREAMING, VIEWING_ACTIVITY, ExportArchive,
+                                      ExportError, read_export)
+from netflix_analysis.chunked import DEFAULT_CHUNKSIZE, summarize_viewing_activity
+from netflix_analysis.devices import classify_devices, device_family_counts
+from netflix_analysis.genres import explode_genres, genre_frequency, genre_names
+from netflix_analysis.ingest import FAVORITE_MIN_PERCENT, prepare_watched, read_viewing_activity, typed_viewing_activity
+from netflix_analysis.locations import IPIndex, IsoLookup, login_counts, login_locations, travel_timeline
+from netflix_analysis.profiling import stage
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile, weekday_hour_counts
+from netflix_analysis.snapshot import Snapshot, cached_snapshot, is_snapshot, read_snapshot, save_snapshot
+from netflix_analysis.tmdb_client import TMDBClient, TMDBError
+from netflix_analysis.tmdb_index import TMDBIndex
+
+ISO_CODES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Files', 'iso_codes.csv')
+
+# movies count for the genre and rating charts when at least this much of them was watched
+GENRE_MIN_PERCENT = 80
+
+# the columns of the three CSVs as read_frames returns them; no chart uses the optional ones, so an export
+# without them gets them as missing values
+EXPORT_COLUMNS = {
+    VIEWING_ACTIVITY: ['Profile_Name', 'Start_Time', 'Duration', 'Attributes', 'Title', 'Supplemental_Video_Type',
+                       'Device_Type', 'Bookmark', 'Latest_Bookmark', 'Country'],
+    BILLING_HISTORY: ['Pmt Status', 'Final Invoice Result', 'Gross Sale Amt', 'Currency'],
+    IP_ADDRESSES_STREAMING: ['Esn', 'Country', 'Localized_Device_Description', 'Device_Description', 'Ip',
+                             'Region_Code_Display_Name', 'Ts'],
+}
+OPTIONAL_COLUMNS = {'Attributes', 'Latest_Bookmark', 'Localized_Device_Description'}
+
+
+@dataclass
+class Metrics:
+    titles: int
+    devices: int
+    countries: int
+    paid: float
+    currency: str
+
+
+@dataclass
+class AnalysisResult:
+    """The data behind every chart of the app.
+
+    ``genres`` and ``ratings`` are None when the analysis ran without a TMDB client.
+    """
+    metrics: Metrics
+    profiles: List[str]
+    watch_time: pd.DataFrame  # Profile_Name, watched_hours
+    favorite_movies: pd.DataFrame  # Profile_Name, Title, Count
+    favorite_series: pd.DataFrame  # Profile_Name, Show_Title, Count
+    countries: pd.DataFrame  # Profile_Name, iso_2, iso_3, Country_Name, Sessions
+    devices: pd.DataFrame  # Profile_Name, Device, Count
+    login_devices: pd.DataFrame  # Device, Count
+    regions: pd.DataFrame  # Country, Region, Logins, Devices, First_Seen, Last_Seen
+    travels: pd.DataFrame  # Esn, Start, End, Country, Region, Logins, Devices
+    heatmap: pd.DataFrame  # Weekday, Hour, Profile_Name, Counts
+    genres: Optional[pd.DataFrame] = None  # genre, Profile_Name, Count
+    ratings: Optional[pd.DataFrame] = None  # Profile_Name, genre, Movie_Rating
+
+    def frames(self):
+        """The chart frames by field name, leaving out the ones that were not computed."""
+        return {f.name: getattr(self, f.name) for f in fields(self)
+                if f.name not in ('metrics', 'profiles') and getattr(self, f.name) is not None}
+
+
+# stages
+##########################################################################################
+
+def read_frames(source):
+    """Read ``(interaction_df, df_billing, streaming_locations_df)`` from an export.
+
+    ``source`` is an export zip (path, bytes or file object) or a directory
+    holding the three CSVs, like the sample data in Files/.
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        interaction_df = read_viewing_activity(os.path.join(source, VIEWING_ACTIVITY))
+        df_billing = pd.read_csv(os.path.join(source, BILLING_HISTORY))
+        streaming_locations_df = pd.read_csv(os.path.join(source, IP_ADDRESSES_STREAMING))
+    else:
+        interaction_df, df_billing, streaming_locations_df = read_export(source)
+    streaming_locations_df.columns = streaming_locations_df.columns.str.replace(' ', '_')
+    return (check_columns(interaction_df, VIEWING_ACTIVITY), check_columns(df_billing, BILLING_HISTORY),
+            check_columns(streaming_locations_df, IP_ADDRESSES_STREAMING))
+
+
+def check_columns(df, name):
+    """``df`` with the optional columns of :data:`EXPORT_COLUMNS` ``[name]`` it lacks added as missing values.
+
+    Raises :class:`ExportError` listing the other columns it lacks.
+    """
+    missing = [column for column in EXPORT_COLUMNS[name] if column not in df]
+    required = [column.replace('_', ' ') for column in missing if column not in OPTIONAL_COLUMNS]
+    if required:
+        raise ExportError('{} has no column {}'.format(name, ', '.join(required)))
+    return df.assign(**dict.fromkeys(missing, None)) if missing else df
+
+
+def read_iso_codes(path=ISO_CODES_PATH):
+    return pd.read_csv(path, header=None, names=['Country', 'iso_2', 'iso_3', 'UN_Code'])
+
+
+def metrics(watched_df, cube, df_billing):
+    """The numbers at the top of the page; ``paid`` sums the approved and settled payments."""
+    return _metrics(int(watched_df['Title'].nunique()), cube, df_billing)
+
+
+def _metrics(titles, cube, df_billing):
+    settled = (df_billing['Pmt Status'] == 'APPROVED') & (df_billing['Final Invoice Result'] == 'SETTLED')
+    currency = df_billing['Currency'].iloc[0] if len(df_billing) else ''
+    return Metrics(titles, cube.nunique('Device_Type'), cube.nunique('Country'),
+                   float(df_billing.loc[settled, 'Gross Sale Amt'].sum()), str(currency))
+
+
+def favorites(watched_df, film_type):
+    """Fully watched views per profile and title (Show_Title for series), most watched first."""
+    title_column = 'Title' if film_type == 'Movie' else 'Show_Title'
+    df = watched_df[(watched_df['Film_Type'] == film_type) & (watched_df['percent_watched2'] > FAVORITE_MIN_PERCENT)]
+    counts = df.groupby(['Profile_Name', title_column], observed=True).size().rename('Count').reset_index()
+    return counts.sort_values('Count', ascending=False)
+
+
+def country_sessions(cube, iso):
+    """Viewing sessions per profile and country, with the ISO codes the map needs.
+
+    ``iso`` is an :class:`IsoLookup` (or the frame of :func:`read_iso_codes`),
+    countries without an ISO code are left out.
+    """
+    if isinstance(iso, pd.DataFrame):
+        iso = IsoLookup.from_frame(iso)
+    # one ISO row per country level, mapped to the cells through the cube's codes
+    lookup = np.append(iso.rows(cube.levels['Country']), -1)
+    row = lookup[cube.codes['Country']]
+    known = row >= 0
+    profiles = cube.levels['Profile_Name']
+    linear = cube.codes['Profile_Name'][known].astype(np.int64) * len(iso) + row[known]
+    sessions = np.bincount(linear, weights=cube.measures['sessions'][known], minlength=len(profiles) * len(iso))
+    observed = np.flatnonzero(np.bincount(linear, minlength=len(profiles) * len(iso)))
+    profile, row = np.divmod(observed, len(iso))
+    df = pd.DataFrame({'Profile_Name': profiles[profile], 'iso_2': iso.iso_2[row], 'iso_3': iso.iso_3[row],
+                       'Country_Name': iso.names[row], 'Sessions': sessions[observed].astype(np.int64)})
+    df = df[df['Profile_Name'].notna()]
+    return df.sort_values(['Profile_Name', 'iso_2', 'iso_3', 'Country_Name']).reset_index(drop=True)
+
+
+def device_counts(cube):
+    """Views per profile and device family (TV, Phone, Tablet, PC, Console, VR, Streamer, Other)."""
+    return device_family_counts(cube)
+
+
+def login_device_counts(streaming_locations_df):
+    """Entries of IpAddressesStreaming.csv per device family."""
+    families = classify_devices(streaming_locations_df['Device_Description'])
+    counts = families.value_counts(sort=False)
+    return counts[counts > 0].rename('Count').rename_axis('Device').reset_index()
+
+
+def heatmap_table(heatmap):
+    """Pivot the heatmap frame to one row per hour and profile and one column per weekday."""
+    return heatmap.pivot_table(values='Counts', index=['Hour', 'Profile_Name'], columns=['Weekday'], observed=True)
+
+
+def movie_database(watched_df, tmdb_client):
+    """The most popular TMDB search result for every fully watched movie, and how many of the searches failed.
+
+    The movies whose search failed are left out, searching again only requests those.
+    """
+    movies_watched = watched_df[(watched_df['Film_Type'] == 'Movie')
+                                & (watched_df['percent_watched2'] > FAVORITE_MIN_PERCENT)]['Title']
+    # all titles are looked up in one batch, cached titles are not requested again
+    with stage('tmdb_search') as record:
+        counters = (tmdb_client.index_hits, tmdb_client.hits, tmdb_client.misses)
+        titles = list(set(movies_watched.astype(str)))
+        responses = tmdb_client.search_movies(titles)
+        # the client is shared by the sessions, so the failures are counted from this search alone
+        failures = len(titles) - len(responses)
+        record.rows = len(responses)
+        record.tmdb_index_hits, record.tmdb_cache_hits, record.tmdb_misses = (
+            now - before for now, before in zip((tmdb_client.index_hits, tmdb_client.hits, tmdb_client.misses),
+                                                counters))
+        record.tmdb_failures = failures
+    results = [movie for response in responses.values() for movie in response['results']]
+    columns = ['genre_ids', 'original_title', 'vote_average', 'vote_count', 'release_date']
+    if not results:
+        return pd.DataFrame(columns=columns), failures
+    df_movie_database = pd.DataFrame.from_dict(results, orient='columns')
+    df_movie_database = df_movie_database.sort_values(['original_title', 'popularity'], ascending=False)
+    # genre_ids stay lists of integers, they are mapped to names once per movie
+    return df_movie_database.drop_duplicates(subset=['original_title'], keep='first').sort_index()[columns], failures
+
+
+def movie_genres(watched_df, df_movie_database, genre_by_id):
+    """Genre counts per profile and the ratings of the watched movies by genre."""
+    df_movie_genres = explode_genres(df_movie_database, genre_by_id)
+    df_movies_watched = watched_df[(watched_df['Film_Type'] == 'Movie')
+                                   & (watched_df['percent_watched2'] >= GENRE_MIN_PERCENT)]
+    df_movies_watched = df_movies_watched[['Profile_Name', 'Show_Title']].merge(
+        df_movie_genres, how='inner', left_on=['Show_Title'], right_on=['original_title'])
+
+    frequency = genre_frequency(df_movies_watched, list(watched_df['Profile_Name'].unique()))
+    ratings = df_movies_watched[['Profile_Name', 'genre', 'vote_average']].replace({'vote_average': {0: np.nan}})
+    return frequency, ratings.rename(columns={'vote_average': 'Movie_Rating'})
+
+
+def parse_export(source, export_id=None, snapshot_dir=None):
+    """The :class:`netflix_analysis.snapshot.Snapshot` of an export zip or directory, or of a snapshot file.
+
+    With an ``export_id`` and a ``snapshot_dir`` the snapshot kept there is
+    loaded instead of parsing the export again, and a newly parsed export
+    is kept there for the next time.
+    """
+    if is_snapshot(source):
+        snapshot = read_snapshot(source)
+        # identified by the upload itself, not by the export id the file claims
+        snapshot.export_id = export_id or snapshot.export_id
+        return snapshot
+    cache = export_id is not None and snapshot_dir
+    if cache:
+        snapshot = cached_snapshot(export_id, snapshot_dir)
+        if snapshot is not None:
+            return snapshot
+    interaction_df, df_billing, streaming_locations_df = read_frames(source)
+    snapshot = Snapshot.from_frames(export_id, prepare_watched(interaction_df), df_billing, streaming_locations_df)
+    if cache:
+        try:
+            save_snapshot(snapshot, snapshot_dir)
+        except OSError:
+            pass  # a read-only or full disk only costs the next load a parse
+    return snapshot
+
+
+def analyze(interaction_df, df_billing, streaming_locations_df, tmdb_client=None, iso_df=None, ip_index=None):
+    """Compute every chart from the export frames, see :class:`AnalysisResult`.
+
+    The frames can come from :func:`read_frames` or straight from
+    ``pd.read_csv``: column names get underscores for spaces and the viewing
+    activity its types, see :func:`netflix_analysis.ingest.typed_viewing_activity`.
+    Genres and ratings are only computed with a ``tmdb_client``. Logins are
+    located with ``ip_index`` when given, else where Netflix located them.
+    """
+    interaction_df = check_columns(typed_viewing_activity(interaction_df), VIEWING_ACTIVITY)
+    df_billing = check_columns(df_billing, BILLING_HISTORY)
+    streaming_locations_df = check_columns(
+        streaming_locations_df.rename(columns=lambda column: column.replace(' ', '_')), IP_ADDRESSES_STREAMING)
+    return analyze_watched(prepare_watched(interaction_df), df_billing, streaming_locations_df,
+                           tmdb_client=tmdb_client, iso_df=iso_df, ip_index=ip_index)
+
+
+def analyze_watched(watched_df, df_billing, streaming_locations_df, tmdb_client=None, iso_df=None, ip_index=None):
+    """:func:`analyze` with the history already prepared by :func:`prepare_watched`."""
+    cube = RollupCube.from_frame(watched_df)
+    result = _analyze_cube(cube, metrics(watched_df, cube, df_billing),
+                           [str(p) for p in watched_df['Profile_Name'].unique()],
+                           favorites(watched_df, 'Movie'), favorites(watched_df, 'Series'),
+                           streaming_locations_df, iso_df, ip_index)
+    if tmdb_client is not None:
+        df_movie_database, failures = movie_database(watched_df, tmdb_client)
+        if failures:
+            # a result without those movies would be kept as if it were complete
+            raise TMDBError('The TMDB search failed for {} movies'.format(failures))
+        result.genres, result.ratings = movie_genres(watched_df, df_movie_database, genre_names(tmdb_client.genres()))
+    return result
+
+
+def analyze_summary(summary, df_billing, streaming_locations_df, iso_df=None, ip_index=None):
+    """:func:`analyze_watched` from a :class:`netflix_analysis.chunked.ViewingSummary` instead of the history.
+
+    The same charts except genres and ratings, which need every view; the
+    profiles are in alphabetical order rather than in the order they appear.
+    """
+    cube = summary.cube
+    return _analyze_cube(cube, _metrics(len(summary.titles), cube, df_billing),
+                         sorted(str(p) for p in cube.total('Profile_Name').index),
+                         summary_favorites(summary, 'Movie'), summary_favorites(summary, 'Series'),
+                         streaming_locations_df, iso_df, ip_index)
+
+
+def summary_favorites(summary, film_type):
+    """:func:`favorites` from the title counts of a :class:`netflix_analysis.chunked.ViewingSummary`."""
+    counts = summary.title_counts
+    counts = counts[counts.index.get_level_values('Film_Type') == film_type].droplevel('Film_Type')
+    counts = counts.rename_axis(['Profile_Name', 'Title' if film_type == 'Movie' else 'Show_Title'])
+    return counts.reset_index().sort_values('Count', ascending=False)
+
+
+def _analyze_cube(cube, account_metrics, profiles, favorite_movies, favorite_series, streaming_locations_df,
+                  iso_df, ip_index):
+    locations = login_locations(streaming_locations_df, ip_index)
+    return AnalysisResult(
+        metrics=account_metrics,
+        profiles=profiles,
+        watch_time=watch_time_by_profile(cube),
+        favorite_movies=favorite_movies,
+        favorite_series=favorite_series,
+        countries=country_sessions(cube, iso_df if iso_df is not None else read_iso_codes()),
+        devices=device_counts(cube),
+        login_devices=login_device_counts(streaming_locations_df),
+        regions=login_counts(locations, ['Country', 'Region']),
+        travels=travel_timeline(locations, by='Esn'),
+        heatmap=weekday_hour_counts(cube),
+    )
+
+
+def analyze_export(source, tmdb_client=None, iso_df=None, ip_index=None):
+    """:func:`analyze` an export zip or directory, or a snapshot file, see :func:`parse_export`."""
+    snapshot = parse_export(source)
+    return analyze_watched(snapshot.watched_df, snapshot.df_billing, snapshot.streaming_locations_df,
+                           tmdb_client=tmdb_client, iso_df=iso_df, ip_index=ip_index)
+
+
+def analyze_export_chunked(source, iso_df=None, ip_index=None, chunksize=DEFAULT_CHUNKSIZE):
+    """:func:`analyze_summary` of an export zip or directory, reading ViewingActivity.csv ``chunksize`` rows at a time.
+
+    For histories too large to hold in memory as a frame, see :mod:`netflix_analysis.chunked`.
+    """
+    def summarize(f):
+        return summarize_viewing_activity(f, chunksize)
+
+    if isinstance(source, str) and os.path.isdir(source):
+        summary = summarize(os.path.join(source, VIEWING_ACTIVITY))
+        df_billing = pd.read_csv(os.path.join(source, BILLING_HISTORY))
+        streaming_locations_df = pd.read_csv(os.path.join(source, IP_ADDRESSES_STREAMING))
+    else:
+        with ExportArchive(source) as archive:
+            summary = archive.read_csv(VIEWING_ACTIVITY, reader=summarize)
+            df_billing = archive.read_csv(BILLING_HISTORY)
+            streaming_locations_df = archive.read_csv(IP_ADDRESSES_STREAMING)
+    streaming_locations_df.columns = streaming_locations_df.columns.str.replace(' ', '_')
+    return analyze_summary(summary, check_columns(df_billing, BILLING_HISTORY),
+                           check_columns(streaming_locations_df, IP_ADDRESSES_STREAMING), iso_df, ip_index)
+
+
+# results on disk
+##########################################################################################
+
+def write_result(result, directory):
+    """Write one ``<chart>.parquet`` per frame and ``metrics.json`` (metrics and profiles) to ``directory``."""
+    os.makedirs(directory, exist_ok=True)
+    for name, frame in result.frames().items():
+        frame.reset_index(drop=True).to_parquet(os.path.join(directory, name + '.parquet'), index=False)
+    with open(os.path.join(directory, 'metrics.json'), 'w') as f:
+        json.dump({'metrics': asdict(result.metrics), 'profiles': result.profiles}, f, indent=2)
+
+
+def read_result(directory):
+    """Load an :class:`AnalysisResult` written by :func:`write_result`."""
+    with open(os.path.join(directory, 'metrics.json')) as f:
+        meta = json.load(f)
+    frames = {}
+    for f in fields(AnalysisResult):
+        path = os.path.join(directory, f.name + '.parquet')
+        if os.path.exists(path):
+            frames[f.name] = pd.read_parquet(path)
+    return AnalysisResult(metrics=Metrics(**meta['metrics']), profiles=meta['profiles'], **frames)
+
+
+# batch mode
+##########################################################################################
+
+_worker_client = None
+_worker_ip_index = None
+
+
+def _init_worker(with_genres):
+    # one TMDB client per worker process, they share the on-disk response cache,
+    # and the offline IP index (if there is one) memory-mapped once per worker
+    global _worker_client, _worker_ip_index
+    _worker_ip_index = IPIndex.open_default()
+    if with_genres:
+        _worker_client = TMDBClient(os.environ['TMDB_API_KEY'], index=TMDBIndex.open_default())
+
+
+def _process_export(path, directory, chunked):
+    start = time.perf_counter()
+    if chunked:
+        result = analyze_export_chunked(path, ip_index=_worker_ip_index)
+    else:
+        result = analyze_export(path, tmdb_client=_worker_client, ip_index=_worker_ip_index)
+    write_result(result, directory)
+    return len(result.profiles), time.perf_counter() - start
+
+
+def export_paths(directory):
+    """The export zips in ``directory``, by name."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith('.zip'))
+
+
+def run_batch(paths, output, workers=None, with_genres=False, chunked=False):
+    """Analyze every export in ``paths`` on a process pool, writing to ``output/<export name>/``.
+
+    With ``chunked`` the viewing histories are aggregated chunk by chunk
+    (see :func:`analyze_export_chunked`), which leaves out the genres.
+    Yields ``(path, error)`` as exports finish, ``error`` is None on success.
+    """
+    if with_genres and chunked:
+        raise ValueError('the genre and rating charts need the whole viewing history, not chunks of it')
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(with_genres,)) as executor:
+        futures = {executor.submit(_process_export, path,
+                                   os.path.join(output, os.path.splitext(os.path.basename(path))[0]), chunked): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except (ExportError, TMDBError, KeyError, ValueError, OSError) as error:
+                yield futures[future], error
+            else:
+                yield futures[future], None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m netflix_analysis.analysis',
+                                     description='Precompute the dashboards of a directory of Netflix exports.')
+    parser.add_argument('exports', help='directory with export zips')
+    parser.add_argument('output', help='directory to write one result directory per export to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--genres', action='store_true',
+                        help='also compute the genre and rating charts (needs TMDB_API_KEY)')
+    parser.add_argument('--chunked', action='store_true',
+                        help='read the viewing histories in chunks of {} rows to bound the memory per worker '
+                             '(without --genres)'.format(DEFAULT_CHUNKSIZE))
+    args = parser.parse_args(argv)
+    if args.genres and not os.environ.get('TMDB_API_KEY'):
+        parser.error('--genres needs the TMDB_API_KEY environment variable')
+    if args.genres and args.chunked:
+        parser.error('--genres needs the whole viewing history and cannot be combined with --chunked')
+
+    paths = export_paths(args.exports)
+    failed = 0
+    start = time.perf_counter()
+    for path, error in run_batch(paths, args.output, args.workers, args.genres, args.chunked):
+        if error is None:
+            print('done    {}'.format(path))
+        else:
+            failed += 1
+            print('failed  {}: {}'.format(path, error), file=sys.stderr)
+    print('{} exports in {:.1f}s, {} failed'.format(len(paths), time.perf_counter() - start, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Reading the CSVs the app needs straight out of a Netflix export zip.
+
+Nothing is extracted to disk: only the members the app uses are
+decompressed, streamed directly into pandas, and cut off as soon as they
+grow past the configured size limits.
+"""
+
+import io
+import posixpath
+from zipfile import BadZipFile, ZipFile
+
+import pandas as pd
+
+from netflix_analysis.ingest import read_viewing_activity
+
+# the file names inside the export, found by suffix so the folder layout may change
+VIEWING_ACTIVITY = 'ViewingActivity.csv'
+BILLING_HISTORY = 'BillingHistory.csv'
+IP_ADDRESSES_STREAMING = 'IpAddressesStreaming.csv'
+
+MAX_MEMBER_SIZE = 512 * 2**20  # bytes after decompression
+MAX_TOTAL_SIZE = 1024 * 2**20
+MAX_COMPRESSION_RATIO = 200
+
+
+class ExportError(ValueError):
+    """The upload is not a usable Netflix export (or is too large)."""
+
+
+class _LimitedReader(io.RawIOBase):
+    # zip headers can lie about sizes, so count what is actually decompressed
+    def __init__(self, raw, limit, message):
+        self._raw = raw
+        self._limit = limit
+        self._message = message  # of the ExportError raised past the limit
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.bytes_read > self._limit:
+            raise ExportError(self._message)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def find_member(zip_file, name):
+    """Return the ZipInfo whose path ends with ``name`` (case-insensitive)."""
+    matches = [info for info in zip_file.infolist()
+               if not info.is_dir() and posixpath.basename(info.filename).lower() == name.lower()]
+    if not matches:
+        raise ExportError('{} was not found in the uploaded zip'.format(name))
+    # prefer the shallowest match, e.g. CONTENT_INTERACTION/ViewingActivity.csv over a nested copy
+    return min(matches, key=lambda info: info.filename.count('/'))
+
+
+class ExportArchive:
+    """A Netflix export zip opened from a path, bytes or a file-like object."""
+
+    def __init__(self, source, max_member_size=MAX_MEMBER_SIZE, max_total_size=MAX_TOTAL_SIZE,
+                 max_compression_ratio=MAX_COMPRESSION_RATIO):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        try:
+            self.zip_file = ZipFile(source, 'r')
+        except BadZipFile as error:
+            raise ExportError('The upload is not a valid zip file') from error
+        self.max_member_size = max_member_size
+        self.max_total_size = max_total_size
+        self.max_compression_ratio = max_compression_ratio
+        self.total_read = 0
+
+    def open(self, name):
+        """Open a member for streaming reads, enforcing the size limits."""
+        info = find_member(self.zip_file, name)
+        remaining = self.max_total_size - self.total_read
+        if remaining < self.max_member_size:
+            limit = remaining
+            message = 'The export is larger than {} MB in total, {} does not fit'.format(
+                self.max_total_size // 2**20, name)
+        else:
+            limit = self.max_member_size
+            message = '{} is larger than {} MB'.format(name, limit // 2**20)
+        if info.file_size > limit:
+            raise ExportError(message)
+        if info.compress_size and info.file_size / info.compress_size > self.max_compression_ratio:
+            raise ExportError('{} is compressed suspiciously well, refusing to unpack it'.format(name))
+        reader = _LimitedReader(self.zip_file.open(info), limit, message)
+        return io.BufferedReader(reader, buffer_size=2**20)
+
+    def read_csv(self, name, reader=pd.read_csv, **kwargs):
+        with self.open(name) as f:
+            df = reader(f, **kwargs)
+            self.total_read += f.raw.bytes_read
+        return df
+
+    def close(self):
+        self.zip_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_export(source, **limits):
+    """Read ViewingActivity, BillingHistory and IpAddressesStreaming from an export zip.
+
+    Returns ``(interaction_df, df_billing, streaming_locations_df)``, the
+    viewing activity already typed by :func:`read_viewing_activity`.
+    """
+    with ExportArchive(source, **limits) as archive:
+        interaction_df = archive.read_csv(VIEWING_ACTIVITY, reader=read_viewing_activity)
+        df_billing = archive.read_csv(BILLING_HISTORY)
+        streaming_locations_df = archive.read_csv(IP_ADDRESSES_STREAMING)
+    return interaction_df, df_billing, streaming_locations_df
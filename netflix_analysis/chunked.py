@@ -0,0 +1,82 @@
+"""Chunked processing of ViewingActivity.csv for very large viewing histories.
+
+The CSV is read in fixed-size chunks and only the aggregates the charts need
+are kept: the rollup cube (watch time, countries, devices, heatmap), title
+counts for the favorites charts and the set of distinct titles. Peak memory
+is bounded by the chunk size plus the size of those aggregates, instead of
+growing with the number of rows.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.ingest import (FAVORITE_MIN_PERCENT, VIEWING_ACTIVITY_DTYPES, _convert_viewing_activity,
+                                     prepare_watched)
+from netflix_analysis.rollup import SESSION_KEY, RollupCube
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def title_counts(watched_df):
+    """Number of (nearly) fully watched views per profile, film type and title.
+
+    Movies are counted by Title, series by Show_Title.
+    """
+    df = watched_df[watched_df['percent_watched2'] > FAVORITE_MIN_PERCENT]
+    title = df['Title'].astype(str).where(df['Film_Type'] == 'Movie', df['Show_Title'].astype(str))
+    counts = df.groupby([df['Profile_Name'].astype(str), df['Film_Type'].astype(str), title]).size()
+    return counts.rename_axis(['Profile_Name', 'Film_Type', 'Title']).rename('Count')
+
+
+@dataclass
+class ViewingSummary:
+    cube: RollupCube
+    title_counts: pd.Series
+    titles: pd.Index
+    rows: int
+
+
+def iter_watched(source, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield cleaned frames of watched titles, ``chunksize`` CSV rows at a time."""
+    reader = pd.read_csv(source, dtype=VIEWING_ACTIVITY_DTYPES, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield prepare_watched(_convert_viewing_activity(chunk))
+
+
+def summarize_viewing_activity(source, chunksize=DEFAULT_CHUNKSIZE):
+    """Aggregate ViewingActivity.csv chunk by chunk into a :class:`ViewingSummary`.
+
+    Gives the same numbers as building everything from the full frame.
+    Sessions are deduplicated across chunks through a sorted array of 64 bit
+    hashes, 8 bytes per session.
+    """
+    cube = None
+    counts = None
+    titles = pd.Index([], dtype=object)
+    seen_sessions = np.array([], dtype=np.uint64)
+    rows = 0
+    for watched_df in iter_watched(source, chunksize):
+        rows += len(watched_df)
+        session_hashes = pd.util.hash_pandas_object(watched_df[SESSION_KEY], index=False).to_numpy()
+        new_session = (~pd.Series(session_hashes).duplicated().to_numpy()
+                       & ~np.isin(session_hashes, seen_sessions, assume_unique=False))
+        seen_sessions = np.union1d(seen_sessions, session_hashes)
+
+        chunk_cube = RollupCube.from_frame(watched_df, new_session=new_session)
+        cube = chunk_cube if cube is None else RollupCube.concat([cube, chunk_cube])
+
+        chunk_counts = title_counts(watched_df)
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0).astype(np.int64)
+        titles = titles.append(pd.Index(watched_df['Title'].astype(str).unique())).unique()
+    if not rows:
+        raise ValueError('ViewingActivity.csv contains no watched titles')
+    return ViewingSummary(cube, counts, titles, rows)
+
+
+def summarize_watched(watched_df):
+    """The same summary built from an in-memory frame."""
+    return ViewingSummary(RollupCube.from_frame(watched_df), title_counts(watched_df),
+                          pd.Index(watched_df['Title'].astype(str).unique()), len(watched_df))
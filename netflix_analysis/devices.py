@@ -0,0 +1,78 @@
+"""Device families from the device names Netflix records.
+
+``Device Type`` in ViewingActivity.csv and ``Device Description`` in
+IpAddressesStreaming.csv hold names like "Samsung 2016 Jazz-L UHD TV Smart
+TV", "Apple iPad 6th Gen 9.7 (Wi-Fi) iPad" or "Netflix Chrome MAC (Cadmium)
+HTML 5". Every distinct name is classified once by the first matching rule
+of :data:`DEVICE_RULES` (remembered across uploads) and the family is mapped
+back to the rows through categorical codes.
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FAMILIES = ['TV', 'Phone', 'Tablet', 'PC', 'Console', 'VR', 'Streamer', 'Other']
+
+# the first matching rule wins, so more specific rules come first:
+# "Netflix Oculus VR Android Phone" is VR, "Apple TV 4K" a Streamer, not a TV
+DEVICE_RULES = [
+    ('VR', r'oculus|\bquest\b|gear ?vr|\bvive\b|\bvr\b|daydream|pico neo'),
+    ('Console', r'playstation|\bps[345]\b|\bps vita\b|xbox|nintendo|\bwii ?u?\b|\bswitch\b'),
+    ('Streamer', r'chromecast|apple ?tv|fire ?tv stick|fire ?tv cube|amazon fire ?tv(?! edition)|\broku\b(?! tv)'
+                 r'|nvidia shield|\bshield\b|mi box|\bstb\b|set.?top|\bmvpd\b|tivo|streaming (?:stick|player|media)'
+                 r'|android tv box|\bbox\b'),
+    ('Tablet', r'ipad|tablet|kindle|galaxy tab|\bsm-t\d|\bmatepad\b|surface (?!laptop|book)'),
+    ('Phone', r'phone|\bpixel\b|\bsm-[gnas]\d|galaxy [snaz]\d|\bxperia\b|\boneplus\b'),
+    ('TV', r'\btv\b|smart ?tv|webos|tizen|bravia|\buhd\b|\bhdtv\b|\boled\b|\bqled\b|vizio|hisense|\btcl\b'),
+    ('PC', r'\bpc\b|\bmac\b|macbook|imac|windows|\bwin\d|chrome|firefox|\bedge\b|safari|\bopera\b|cadmium'
+           r'|html ?5|linux|laptop|desktop'),
+    # what is left: Android devices are mostly phones, TV makers' own names mostly TVs
+    ('Phone', r'\bandroid\b|\bmobile\b'),
+    ('TV', r'samsung|\blg\b|\bsony\b|philips|panasonic|sharp|toshiba'),
+]
+
+_RULES = [(family, re.compile(pattern, re.IGNORECASE)) for family, pattern in DEVICE_RULES]
+
+
+@lru_cache(maxsize=2**14)
+def device_family(name):
+    """The family of one device name, 'Other' when no rule matches."""
+    for family, pattern in _RULES:
+        if pattern.search(name):
+            return family
+    return 'Other'
+
+
+def family_codes(names):
+    """Codes into :data:`FAMILIES` for an index or list of device names (-1 for missing names)."""
+    return np.array([FAMILIES.index(device_family(str(name))) if not pd.isna(name) else -1 for name in names],
+                    dtype=np.int8)
+
+
+def classify_devices(devices):
+    """A categorical column of device families on the index of ``devices``, each distinct name classified once."""
+    categorical = devices.astype('category')
+    lookup = np.append(family_codes(categorical.cat.categories), -1)  # code -1 marks a missing name
+    codes = lookup[categorical.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=FAMILIES), index=devices.index, name='Device')
+
+
+def device_family_counts(cube):
+    """Views per profile and device family, from a :class:`netflix_analysis.rollup.RollupCube`.
+
+    Every view counts for exactly one family.
+    """
+    lookup = np.append(family_codes(cube.levels['Device_Type']), -1)
+    family = lookup[cube.codes['Device_Type']]
+    known = family >= 0
+    profiles = cube.levels['Profile_Name']
+    linear = cube.codes['Profile_Name'][known].astype(np.int64) * len(FAMILIES) + family[known]
+    counts = np.bincount(linear, weights=cube.measures['views'][known],
+                         minlength=len(profiles) * len(FAMILIES)).astype(np.int64)
+    profile, family = np.divmod(np.flatnonzero(counts), len(FAMILIES))
+    df = pd.DataFrame({'Profile_Name': profiles[profile], 'Device': np.array(FAMILIES, dtype=object)[family],
+                       'Count': counts[counts > 0]})
+    return df[df['Profile_Name'].notna()].reset_index(drop=True)
@@ -0,0 +1,84 @@
+"""Rendered charts, cached by the data and the widget state they were made from.
+
+Building a Plotly Express figure or drawing the seaborn heatmap costs far
+more than showing it, and most reruns show a chart that was already built.
+:class:`FigureCache` keeps the serialized results (Plotly JSON specs and PNG
+bytes) in a least recently used cache with a memory budget, shared by all
+sessions of the process. Matplotlib figures are closed as soon as they are
+rendered, so nothing is left behind in pyplot's figure registry.
+"""
+
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+# the budget for all cached figures of the process, in MB
+FIGURE_CACHE_MB = float(os.environ.get('FIGURE_CACHE_MB', 64))
+
+
+class FigureCache:
+    """A thread-safe LRU cache of serialized figures, limited to ``max_bytes`` in total."""
+
+    def __init__(self, max_bytes=int(FIGURE_CACHE_MB * 2**20)):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key, build, keep=True):
+        """The cached value for ``key``, or ``build()`` (a str or bytes) stored under it unless ``keep`` is false."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        # built outside the lock, two sessions may build the same figure once each
+        value = build()
+        size = len(value)
+        with self._lock:
+            self.misses += 1
+            if keep and key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = value
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= len(evicted)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+def plotly_spec(cache, key, build, keep=True):
+    """The figure made by ``build()`` as a dict for ``st.plotly_chart``, built once per ``key``.
+
+    With ``keep`` false it is built every time, e.g. while its data is incomplete.
+    """
+    return json.loads(cache.get_or_create(key, lambda: build().to_json(), keep))
+
+
+def matplotlib_png(cache, key, build, dpi=200):
+    """PNG bytes of the matplotlib figure made by ``build()``, rendered once per ``key``.
+
+    Renders like ``st.pyplot`` does and closes the figure right after.
+    """
+    def render():
+        fig = build()
+        try:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
+    return cache.get_or_create(key, render)
@@ -0,0 +1,60 @@
+"""Movie genres from TMDB search results.
+
+``genre_ids`` stay integer lists. They are exploded once per distinct movie
+and turned into genre names through an integer lookup array. Per-profile
+counts are a single grouped count over the watched movies.
+"""
+
+import numpy as np
+import pandas as pd
+
+# TV genres TMDB sometimes returns for movies, and a shorter name for Science Fiction (878)
+EXTRA_GENRES = {10765: "Sci-Fi, Fantasy", 10763: "News", 10759: "Action, Adventure", 10764: "Reality",
+                10768: 'War, Politics', 10766: "Soap", 10762: "Kids", 10767: "Talk", 878: "Sci-Fi"}
+
+
+def genre_names(genres_json):
+    """Turn the ``genre/movie/list`` response into a dict of genre id -> name."""
+    genre_by_id = {genre['id']: genre['name'] for genre in genres_json['genres']}
+    genre_by_id.update(EXTRA_GENRES)
+    return genre_by_id
+
+
+def genre_lookup(genre_by_id):
+    """An array mapping genre id -> code into the returned categories (-1 for unknown ids)."""
+    names = pd.Index(sorted(set(genre_by_id.values())))
+    lookup = np.full(max(genre_by_id) + 1, -1, dtype=np.int32)
+    ids = np.fromiter(genre_by_id.keys(), dtype=np.int64)
+    lookup[ids] = names.get_indexer(list(genre_by_id.values()))
+    return lookup, names
+
+
+def explode_genres(movies, genre_by_id, column='genre_ids'):
+    """One row per movie and genre, with a categorical ``genre`` column instead of ``genre_ids``.
+
+    Movies without genres and unknown genre ids are left out.
+    """
+    lookup, names = genre_lookup(genre_by_id)
+    genre_lists = [ids if isinstance(ids, (list, tuple, np.ndarray)) else [] for ids in movies[column]]
+    lengths = np.fromiter((len(ids) for ids in genre_lists), dtype=np.int64, count=len(genre_lists))
+    ids = np.fromiter((i for ids in genre_lists for i in ids), dtype=np.int64, count=int(lengths.sum()))
+
+    codes = np.full(len(ids), -1, dtype=np.int32)
+    in_range = (ids >= 0) & (ids < len(lookup))
+    codes[in_range] = lookup[ids[in_range]]
+
+    exploded = movies.drop(columns=[column]).iloc[np.repeat(np.arange(len(movies)), lengths)]
+    exploded = exploded.assign(genre=pd.Categorical.from_codes(codes, categories=names))
+    return exploded[codes >= 0].reset_index(drop=True)
+
+
+def genre_frequency(watched_genres, profiles):
+    """How often each profile watched each genre, as (genre, Profile_Name, Count) rows.
+
+    Every genre watched by anyone gets a row for every profile, 0 if the
+    profile never watched it.
+    """
+    counts = watched_genres.groupby([watched_genres['genre'].astype(str),
+                                     watched_genres['Profile_Name'].astype(str)]).size()
+    table = counts.unstack(fill_value=0).reindex(columns=[str(p) for p in profiles], fill_value=0)
+    return table.rename_axis(index='genre', columns='Profile_Name').stack().rename('Count').reset_index()
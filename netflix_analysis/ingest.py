@@ -0,0 +1,121 @@
+"""Reading and cleaning ViewingActivity.csv.
+
+The CSV is parsed once with explicit dtypes and every derived column the app
+needs is computed with vectorized operations, so the charts can work off a
+single tidy frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.profiling import stage
+from netflix_analysis.titles import classify_titles
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+VIEWING_ACTIVITY_DTYPES = {
+    'Profile Name': 'category',
+    'Attributes': 'object',
+    'Title': 'category',
+    'Supplemental Video Type': 'category',
+    'Device Type': 'category',
+    'Bookmark': 'category',
+    'Latest Bookmark': 'object',
+    'Country': 'category',
+    'Duration': 'category',
+}
+
+# watches shorter than this are autoplays and previews rather than real viewing
+MIN_WATCH_DURATION = pd.Timedelta(minutes=1)
+
+# titles count as favorites when at least this much of them was watched
+FAVORITE_MIN_PERCENT = 85
+
+
+def read_viewing_activity(source, **read_csv_kwargs):
+    """Read ViewingActivity.csv (path or file-like) with compact, typed columns.
+
+    Column names have their spaces replaced with underscores, ``Start_Time`` is
+    a datetime and ``Duration``/``Bookmark`` are timedeltas. Missing columns
+    are left out, :func:`netflix_analysis.analysis.check_columns` reports them.
+    """
+    df = pd.read_csv(source, dtype=VIEWING_ACTIVITY_DTYPES, **read_csv_kwargs)
+    return _convert_viewing_activity(df)
+
+
+def _convert_viewing_activity(df):
+    df.columns = df.columns.str.replace(' ', '_')
+    # parsed here rather than with parse_dates, which fails on a file without the column
+    if 'Start_Time' in df and not pd.api.types.is_datetime64_any_dtype(df['Start_Time']):
+        df['Start_Time'] = pd.to_datetime(df['Start_Time'])
+    with stage('parse_durations') as record:
+        for column in ('Duration', 'Bookmark'):
+            if column in df:
+                df[column] = _categorical_to_timedelta(df[column])
+        record.rows = len(df)
+    return df
+
+
+def typed_viewing_activity(df):
+    """A ViewingActivity.csv frame read any other way (e.g. plain ``pd.read_csv``) as :func:`read_viewing_activity`
+    returns it; columns that have their types already are left as they are.
+    """
+    df = df.rename(columns=lambda column: column.replace(' ', '_'))
+    for column, dtype in VIEWING_ACTIVITY_DTYPES.items():
+        column = column.replace(' ', '_')
+        if column not in df:
+            continue
+        if column in ('Duration', 'Bookmark'):
+            if not pd.api.types.is_timedelta64_dtype(df[column]):
+                df[column] = _categorical_to_timedelta(df[column].astype('category'))
+        elif dtype == 'category' and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    if 'Start_Time' in df and not pd.api.types.is_datetime64_any_dtype(df['Start_Time']):
+        df['Start_Time'] = pd.to_datetime(df['Start_Time'])
+    return df
+
+
+def _categorical_to_timedelta(series):
+    # durations repeat a lot, so only the distinct 'H:MM:SS' strings are parsed
+    codes = series.cat.codes.to_numpy()
+    values = pd.to_timedelta(series.cat.categories.astype(str), errors='coerce').to_numpy()
+    values = np.append(values, np.timedelta64('NaT'))  # code -1 marks a missing value
+    return pd.Series(values[codes], index=series.index, name=series.name)
+
+
+def prepare_watched(interaction_df):
+    """Keep only real viewing and add all derived columns.
+
+    Trailers and other supplemental videos and anything watched for less than
+    a minute are dropped. Adds watched/duration minutes, watched hours,
+    percent watched (and rounded to 5%), Show_Title, Season, Episode,
+    Film_Type, Weekday and Hour.
+    """
+    watched = (interaction_df['Supplemental_Video_Type'].isna()
+               & (interaction_df['Duration'] > MIN_WATCH_DURATION))
+    df = interaction_df.loc[watched].copy()
+
+    one_minute = pd.Timedelta(minutes=1)
+    df['watched_minutes'] = (df['Duration'] // one_minute).astype('int32')
+    # NaN where the bookmark is missing
+    df['duration_minutes'] = df['Bookmark'] // one_minute
+    df['watched_hours'] = df['watched_minutes'] / 60
+    df['percent_watched'] = df['watched_minutes'] / df['duration_minutes'] * 100
+    df['percent_watched2'] = 5 * (df['percent_watched'] / 5).round()
+
+    df['Title'] = df['Title'].cat.remove_unused_categories()
+    with stage('classify_titles') as record:
+        titles = classify_titles(df['Title'])
+        record.rows = len(df)
+        record.distinct_titles = len(df['Title'].cat.categories)
+    for column in titles.columns:
+        df[column] = titles[column]
+
+    df['Weekday'] = pd.Categorical(df['Start_Time'].dt.day_name(), categories=WEEKDAYS, ordered=True)
+    df['Hour'] = df['Start_Time'].dt.hour.astype('int8')
+    return df.reset_index(drop=True)
+
+
+def load_watched(source):
+    """Read ViewingActivity.csv and return the cleaned frame of watched titles."""
+    return prepare_watched(read_viewing_activity(source))
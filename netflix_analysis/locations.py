@@ -0,0 +1,386 @@
+"""Where an account streamed from, without network calls.
+
+IpAddressesStreaming.csv has one row per streaming login with the device
+serial number (``Esn``), the device name, the IP address, the country and
+region Netflix located it in and a timestamp (``Ts``). :func:`login_locations`
+turns it into one tidy row per login, :func:`login_counts` aggregates the
+logins by region, device and time and :func:`travel_timeline` collapses them
+into stays, one per run of consecutive logins from the same region.
+
+Addresses are located with an offline :class:`IPIndex` when there is one,
+built from a local CIDR→country/region file::
+
+    python -m netflix_analysis.locations build ip_index/ ranges.csv
+    python -m netflix_analysis.locations lookup ip_index/ 213.237.90.53 2a02:1406::1
+
+The range file is a CSV with either a ``network`` (CIDR) or a ``start`` and
+``end`` address column, a ``country`` (ISO 3166 alpha-2) column and an
+optional ``region`` column. The index is a directory of sorted NumPy arrays,
+memory-mapped on open and searched with binary search, so one index on disk
+serves every process without being loaded. IPv4 addresses are 32 bit keys,
+IPv6 addresses 16 byte big-endian strings, which sort like the 128 bit
+numbers. Nested ranges are split so the most specific one wins, like a
+longest prefix match. Without an index the country and region Netflix
+recorded are used.
+
+:class:`IsoLookup` maps alpha-2 codes to rows of iso_codes.csv through a
+26x26 integer table, which replaces the merge of the country chart.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import socket
+import sys
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.devices import classify_devices
+
+DEFAULT_IP_INDEX_PATH = os.environ.get(
+    'IP_INDEX_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'netflix_analysis', 'ip_index'))
+
+LOCATIONS_FILE = 'locations.json'
+_V4, _V6 = 'v4', 'v6'
+_KEY_DTYPES = {_V4: np.uint32, _V6: 'S16'}
+
+
+# ISO codes
+##########################################################################################
+
+class IsoLookup:
+    """The rows of iso_codes.csv as arrays, found by their alpha-2 code without a merge."""
+
+    def __init__(self, iso_2, iso_3, names):
+        self.iso_2 = np.asarray(iso_2, dtype=object)
+        self.iso_3 = np.asarray(iso_3, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        # row of every possible two letter code, -1 for the unused ones
+        self._table = np.full(26 * 26, -1, dtype=np.int16)
+        for row, code in enumerate(self.iso_2):
+            key = _alpha2_key(code)
+            if key >= 0 and self._table[key] < 0:
+                self._table[key] = row
+
+    @classmethod
+    def from_frame(cls, iso_df):
+        """From the frame of :func:`netflix_analysis.analysis.read_iso_codes`."""
+        return cls(iso_df['iso_2'], iso_df['iso_3'], iso_df['Country'])
+
+    def __len__(self):
+        return len(self.iso_2)
+
+    def rows(self, codes):
+        """Rows for an array of alpha-2 codes (anything after the first two letters is ignored), -1 if unknown."""
+        codes = pd.Index(codes)
+        missing = np.asarray(pd.isna(codes))  # not 'NA' (Namibia) once made a string
+        text = np.where(missing, '', codes.to_numpy(dtype=object)).astype(str)
+        unique, inverse = np.unique(pd.Index(text).str[0:2].str.upper().to_numpy(dtype=object).astype(str),
+                                    return_inverse=True)
+        keys = np.array([_alpha2_key(code) for code in unique], dtype=np.int32)
+        found = np.where(keys >= 0, self._table[np.maximum(keys, 0)], -1)
+        return np.where(missing, -1, found[inverse.ravel()]).astype(np.int16)
+
+
+def _alpha2_key(code):
+    if not isinstance(code, str) or len(code) < 2 or not ('A' <= code[0] <= 'Z' and 'A' <= code[1] <= 'Z'):
+        return -1
+    return (ord(code[0]) - 65) * 26 + ord(code[1]) - 65
+
+
+# IP addresses
+##########################################################################################
+
+def ip_key(address):
+    """``('v4', int)`` or ``('v6', int)`` for an address string, None if it is none.
+
+    IPv4 addresses written as IPv6 (``::ffff:1.2.3.4``) count as IPv4.
+    """
+    address = address.strip()
+    try:
+        return _V4, int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big')
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, address.split('%')[0])
+    except OSError:
+        return None
+    if packed[:12] == b'\0' * 10 + b'\xff\xff':
+        return _V4, int.from_bytes(packed[12:], 'big')
+    return _V6, int.from_bytes(packed, 'big')
+
+
+def _range_keys(start, end):
+    # inclusive key range of the addresses start..end (ipaddress objects of the same version)
+    if start.version == 4:
+        return _V4, int(start), int(end)
+    if start.ipv4_mapped is not None:
+        return _V4, int(start.ipv4_mapped), int(end.ipv4_mapped)
+    return _V6, int(start), int(end)
+
+
+def _key_array(keys, version):
+    if version == _V6:
+        return np.array([key.to_bytes(16, 'big') for key in keys], dtype=_KEY_DTYPES[_V6])
+    return np.array(keys, dtype=_KEY_DTYPES[_V4])
+
+
+def read_ranges(path):
+    """Yield ``(start, end, country, region)`` address ranges of a CIDR or start/end CSV file."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip().str.lower()
+    if 'country' not in df.columns or not ('network' in df.columns or {'start', 'end'} <= set(df.columns)):
+        raise ValueError('{}: needs a country column and a network or start and end columns'.format(path))
+    regions = df['region'] if 'region' in df.columns else [''] * len(df)
+    if 'network' in df.columns:
+        for network, country, region in zip(df['network'], df['country'], regions):
+            network = ipaddress.ip_network(network.strip(), strict=False)
+            yield network.network_address, network.broadcast_address, country.strip().upper(), region.strip()
+    else:
+        for start, end, country, region in zip(df['start'], df['end'], df['country'], regions):
+            yield (ipaddress.ip_address(start.strip()), ipaddress.ip_address(end.strip()), country.strip().upper(),
+                   region.strip())
+
+
+def build_ip_index(output, ranges):
+    """Write ``ranges`` (``(start, end, country, region)`` tuples) as an index directory at ``output``.
+
+    Ranges inside others are cut out of them, so every address gets the
+    location of the most specific range it is in. Ranges that overlap
+    without one containing the other, or cover the same addresses with
+    another location, are conflicts: the range that starts first (or came
+    first) is kept. Returns the number of ranges written and the conflicts
+    as ``(kept, skipped)`` pairs of input tuples.
+    """
+    inputs = []
+    locations = {}
+    tables = {_V4: [], _V6: []}
+    for number, (start, end, country, region) in enumerate(ranges):
+        version, first, last = _range_keys(start, end)
+        location = locations.setdefault((country, region), len(locations))
+        inputs.append((start, end, country, region))
+        # enclosing ranges sort before the ranges inside them
+        tables[version].append((first, -last, number, location))
+
+    os.makedirs(output, exist_ok=True)
+    written = 0
+    conflicts = []
+    for version, rows in tables.items():
+        rows.sort()
+        segments = _split_nested(rows, lambda kept, skipped: conflicts.append((inputs[kept], inputs[skipped])))
+        written += len(segments)
+        np.save(os.path.join(output, version + '_start.npy'), _key_array([s[0] for s in segments], version))
+        np.save(os.path.join(output, version + '_end.npy'), _key_array([s[1] for s in segments], version))
+        np.save(os.path.join(output, version + '_location.npy'), np.array([s[2] for s in segments], dtype=np.int32))
+    with open(os.path.join(output, LOCATIONS_FILE), 'w', encoding='utf-8') as f:
+        json.dump([list(location) for location in locations], f, ensure_ascii=False)
+    return written, conflicts
+
+
+def _split_nested(rows, conflict):
+    # rows are (first, -last, number, location) sorted by first and then widest first; returns disjoint
+    # (first, last, location) segments, each address in the innermost range around it
+    segments = []
+    open_ranges = []  # the ranges around the cursor, innermost last: (first, last, number, location)
+    cursor = None
+
+    def emit(first, last, location):
+        if first > last:
+            return
+        if segments and segments[-1][1] + 1 == first and segments[-1][2] == location:
+            segments[-1] = (segments[-1][0], last, location)
+        else:
+            segments.append((first, last, location))
+
+    def close_until(first):
+        nonlocal cursor
+        while open_ranges and open_ranges[-1][1] < first:
+            _, last, _, location = open_ranges.pop()
+            emit(cursor, last, location)
+            cursor = last + 1
+
+    for first, last, number, location in rows:
+        last = -last
+        close_until(first)
+        if open_ranges:
+            outer_first, outer_last, outer_number, outer_location = open_ranges[-1]
+            if last > outer_last or (first, last) == (outer_first, outer_last):
+                if (first, last, location) != (outer_first, outer_last, outer_location):
+                    conflict(outer_number, number)
+                continue
+            emit(cursor, first - 1, outer_location)
+        cursor = first
+        open_ranges.append((first, last, number, location))
+    close_until(float('inf'))
+    return segments
+
+
+class IPIndex:
+    """Read-only, memory-mapped access to an index built by :func:`build_ip_index`."""
+
+    def __init__(self, path=DEFAULT_IP_INDEX_PATH):
+        self.path = path
+        self._tables = {}
+        for version in (_V4, _V6):
+            self._tables[version] = tuple(np.load(os.path.join(path, '{}_{}.npy'.format(version, part)), mmap_mode='r')
+                                          for part in ('start', 'end', 'location'))
+        if self._tables[_V6][0].dtype != np.dtype(_KEY_DTYPES[_V6]):
+            raise ValueError('{} has 64 bit IPv6 keys, build it again'.format(path))
+        with open(os.path.join(path, LOCATIONS_FILE), encoding='utf-8') as f:
+            locations = json.load(f)
+        self.countries = np.array([country for country, _ in locations], dtype=object)
+        self.regions = np.array([region for _, region in locations], dtype=object)
+
+    @classmethod
+    def open_default(cls):
+        """The index at IP_INDEX_PATH (or the default location), or None when there is none."""
+        exists = os.path.exists(os.path.join(DEFAULT_IP_INDEX_PATH, LOCATIONS_FILE))
+        return cls(DEFAULT_IP_INDEX_PATH) if exists else None
+
+    def __len__(self):
+        return sum(len(starts) for starts, _, _ in self._tables.values())
+
+    def locate_keys(self, keys, version=_V4):
+        """Location codes (into ``countries`` and ``regions``) for keys of :func:`ip_key`, -1 outside every range.
+
+        IPv4 keys can be any integer array, IPv6 keys a list of ints or an
+        array of 16 byte big-endian strings.
+        """
+        starts, ends, locations = self._tables[version]
+        if version == _V6 and not (isinstance(keys, np.ndarray) and keys.dtype.kind == 'S'):
+            keys = _key_array(keys, _V6)
+        keys = np.asarray(keys, dtype=_KEY_DTYPES[version])
+        if not len(starts):
+            return np.full(len(keys), -1, dtype=np.int32)
+        # the last range starting at or before the key, if the key is not past its end
+        position = np.searchsorted(starts, keys, side='right') - 1
+        inside = position >= 0
+        position = np.maximum(position, 0)
+        inside &= keys <= ends[position]
+        return np.where(inside, locations[position], -1).astype(np.int32)
+
+    def locate(self, addresses):
+        """Location codes for an array of address strings, each distinct address parsed once."""
+        codes, unique = pd.factorize(pd.Series(addresses, dtype=object))
+        found = np.full(len(unique), -1, dtype=np.int32)
+        keys = {_V4: ([], []), _V6: ([], [])}
+        for i, address in enumerate(unique):
+            key = ip_key(str(address))
+            if key is not None:
+                keys[key[0]][0].append(i)
+                keys[key[0]][1].append(key[1])
+        for version, (positions, values) in keys.items():
+            if positions:
+                found[positions] = self.locate_keys(_key_array(values, version), version)
+        return np.append(found, -1)[codes]
+
+    def lookup(self, address):
+        """``(country, region)`` of one address, or None."""
+        code = self.locate([address])[0]
+        return (self.countries[code], self.regions[code]) if code >= 0 else None
+
+
+# logins
+##########################################################################################
+
+def login_locations(streaming_locations_df, ip_index=None):
+    """One row per login: Ts, Esn, Device (family), Country (alpha-2) and Region.
+
+    ``streaming_locations_df`` is the frame of :func:`netflix_analysis.analysis.read_frames`
+    (spaces in the column names replaced by underscores). Addresses found in
+    ``ip_index`` take its country and region, the others keep the ones
+    Netflix recorded.
+    """
+    df = streaming_locations_df
+    country = df['Country'].where(df['Country'].isna(), df['Country'].astype(str).str[0:2]).to_numpy(dtype=object)
+    region = df['Region_Code_Display_Name'].to_numpy(dtype=object)
+    if ip_index is not None:
+        codes = ip_index.locate(df['Ip'].to_numpy(dtype=object))
+        located = codes >= 0
+        country = np.where(located, ip_index.countries[np.maximum(codes, 0)], country)
+        region = np.where(located, ip_index.regions[np.maximum(codes, 0)], region)
+    locations = pd.DataFrame({
+        'Ts': pd.to_datetime(df['Ts'], utc=True, errors='coerce'),
+        'Esn': df['Esn'].astype('category'),
+        'Device': classify_devices(df['Device_Description']).array,
+        'Country': pd.Categorical(country),
+        'Region': pd.Categorical(region),
+    })
+    return locations.sort_values('Ts', kind='stable').reset_index(drop=True)
+
+
+def login_counts(locations, by=('Country', 'Region'), freq=None):
+    """Logins per combination of ``by`` (any of Country, Region, Esn, Device) and, with ``freq``, per period.
+
+    ``freq`` is a pandas period alias like ``'D'``, ``'W'`` or ``'M'`` and
+    adds a Period column (the start of the period).
+    """
+    keys = [locations[column] for column in by]
+    if freq is not None:
+        period = locations['Ts'].dt.tz_localize(None).dt.to_period(freq).dt.start_time.rename('Period')
+        keys = [period] + keys
+    counts = locations.groupby(keys, observed=True).agg(Logins=('Ts', 'size'), Devices=('Esn', 'nunique'),
+                                                         First_Seen=('Ts', 'min'), Last_Seen=('Ts', 'max'))
+    return counts.reset_index().sort_values(['Period'] if freq is not None else ['Logins'],
+                                            ascending=freq is not None, kind='stable').reset_index(drop=True)
+
+
+def travel_timeline(locations, by=None):
+    """Stays: runs of consecutive logins from the same country and region, in time order.
+
+    With ``by='Esn'`` (or 'Device') the runs are followed per device, so
+    devices at home do not break up the stays of a travelling phone.
+    Returns Start, End, Country, Region, Logins and Devices, one row per stay
+    (and the ``by`` column).
+    """
+    located = locations[locations['Ts'].notna()]
+    if by is not None:
+        located = located.sort_values([by, 'Ts'], kind='stable')
+    place = located['Country'].astype(str) + '|' + located['Region'].astype(str)
+    if by is not None:
+        place = located[by].astype(str) + '|' + place
+    stay = (place != place.shift()).cumsum().rename('Stay')
+    columns = dict(Start=('Ts', 'min'), End=('Ts', 'max'), Country=('Country', 'first'), Region=('Region', 'first'),
+                   Logins=('Ts', 'size'), Devices=('Esn', 'nunique'))
+    if by is not None:
+        columns = dict({by: (by, 'first')}, **columns)
+    stays = located.groupby(stay).agg(**columns)
+    return stays.sort_values('Start', kind='stable').reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m netflix_analysis.locations',
+                                     description='Build or query the offline IP location index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build an index from CIDR or start/end range files')
+    build.add_argument('output', help='index directory to write')
+    build.add_argument('ranges', nargs='+', help='CSV with network (or start, end), country and region columns')
+
+    lookup = commands.add_parser('lookup', help='look addresses up in an index')
+    lookup.add_argument('index', help='index directory to read')
+    lookup.add_argument('addresses', nargs='+')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        def ranges():
+            for path in args.ranges:
+                yield from read_ranges(path)
+
+        written, conflicts = build_ip_index(args.output, ranges())
+        for kept, skipped in conflicts:
+            print('conflict: {} - {} {} {!r} overlaps {} - {} {} {!r}, skipped'.format(*skipped, *kept),
+                  file=sys.stderr)
+        print('indexed {} ranges into {} ({} conflicting ranges skipped)'.format(written, args.output,
+                                                                                 len(conflicts)))
+    else:
+        index = IPIndex(args.index)
+        for address in args.addresses:
+            json.dump({address: index.lookup(address)}, sys.stdout, ensure_ascii=False)
+            sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
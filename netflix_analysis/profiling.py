@@ -0,0 +1,181 @@
+"""Optional timing and memory instrumentation of the processing stages.
+
+Code marks its stages with ``with stage('name') as record:`` and may set
+``record.rows`` and other counters on the record. The stages are recorded
+by the :class:`Profiler` activated for the current run (thread), with wall
+time, peak traced memory above the level at the start of the stage, and
+logged as one JSON object per line on the ``netflix_analysis.profile``
+logger. Without an enabled profiler ``stage`` returns a shared no-op
+context manager, so the instrumentation costs a function call.
+
+Profiling is switched on by the environment variable
+NETFLIX_ANALYSIS_PROFILE=1 or in ``.streamlit/config.toml``::
+
+    [netflix_analysis]
+    profile = true
+
+(Streamlit warns once about the unknown section, it does not use it.)
+"""
+
+import contextvars
+import json
+import logging
+import os
+import time
+import tracemalloc
+import uuid
+from functools import lru_cache
+
+import pandas as pd
+
+PROFILE_ENV = 'NETFLIX_ANALYSIS_PROFILE'
+CONFIG_PATH = os.path.join('.streamlit', 'config.toml')
+
+LOGGER = logging.getLogger('netflix_analysis.profile')
+
+
+@lru_cache(maxsize=None)
+def _config_enabled(path):
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    try:
+        import tomllib  # Python 3.11+
+    except ImportError:
+        import toml as tomllib  # installed with streamlit
+    return bool(tomllib.loads(text).get('netflix_analysis', {}).get('profile', False))
+
+
+def profiling_enabled(config_path=CONFIG_PATH):
+    """True when the environment variable or the Streamlit config switch profiling on."""
+    value = os.environ.get(PROFILE_ENV)
+    if value is not None:
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return _config_enabled(config_path)
+
+
+class StageRecord:
+    """One finished (or running) stage; ``rows`` and any other attributes set on it end up in the log."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.peak_bytes = None
+        self.rows = None
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items() if not key.startswith('_')}
+
+
+class _NullStage:
+    # returned while profiling is off, attribute writes are dropped
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.record = StageRecord(name)
+
+    def __enter__(self):
+        self.profiler._enter(self.record)
+        return self.record
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.record)
+        return False
+
+
+class Profiler:
+    """Records the stages of one run.
+
+    Peak memory comes from tracemalloc, which is started with the first
+    enabled profiler. It traces the whole process, so stages of concurrent
+    sessions are included in each other's numbers, and it makes
+    allocation-heavy stages several times slower while it runs.
+    """
+
+    def __init__(self, enabled=True, run_id=None):
+        self.enabled = enabled
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.records = []
+        self._stack = []
+        if enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if not LOGGER.handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                LOGGER.addHandler(handler)
+                LOGGER.setLevel(logging.INFO)
+                LOGGER.propagate = False
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _enter(self, record):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # keep the enclosing stage's peak before resetting it for this one
+            parent = self._stack[-1]
+            parent._peak = max(parent._peak, peak)
+        _reset_peak()
+        record._start_memory = current
+        record._peak = current
+        record._start = time.perf_counter()
+        self._stack.append(record)
+
+    def _exit(self, record):
+        record.seconds = time.perf_counter() - record._start
+        record._peak = max(record._peak, tracemalloc.get_traced_memory()[1])
+        record.peak_bytes = record._peak - record._start_memory
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1]._peak = max(self._stack[-1]._peak, record._peak)
+        _reset_peak()
+        record.depth = len(self._stack)
+        self.records.append(record)
+        LOGGER.info(json.dumps(dict(record.as_dict(), event='stage', run=self.run_id), default=str))
+
+    def frame(self):
+        """The finished stages in the order they started, one row each."""
+        rows = sorted(self.records, key=lambda record: record._start)
+        return pd.DataFrame([record.as_dict() for record in rows])
+
+
+def _reset_peak():
+    # tracemalloc.reset_peak is new in Python 3.9, older versions report the peak since the start of the stage's parent
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+_DISABLED = Profiler(enabled=False)
+_active = contextvars.ContextVar('netflix_analysis_profiler', default=_DISABLED)
+
+
+def activate(profiler):
+    """Make ``profiler`` record the stages run by the current thread."""
+    _active.set(profiler)
+    return profiler
+
+
+def current_profiler():
+    return _active.get()
+
+
+def stage(name):
+    """A context manager recording stage ``name`` with the active profiler (a no-op when there is none)."""
+    return _active.get().stage(name)
@@ -0,0 +1,148 @@
+"""Rollup of the viewing history along the dimensions the charts slice by.
+
+The cube is built once per upload and stored sparsely: one small integer code
+array per dimension plus one array per measure, holding only the cells that
+occur in the data. Filtering by profile and summing along a dimension then
+costs O(cells) instead of a groupby over every watched row.
+"""
+
+import numpy as np
+import pandas as pd
+
+from netflix_analysis.ingest import WEEKDAYS
+
+DIMENSIONS = ('Profile_Name', 'Weekday', 'Hour', 'Device_Type', 'Country', 'Film_Type')
+
+# views: watched rows, sessions: distinct start times per profile and country,
+# watched_minutes: total minutes watched
+MEASURES = ('views', 'sessions', 'watched_minutes')
+SESSION_KEY = ['Profile_Name', 'Country', 'Start_Time']
+
+
+def _levels_and_codes(column):
+    if column.name == 'Hour':
+        return pd.Index(range(24), name='Hour'), column.to_numpy().astype(np.int16)
+    if column.name == 'Weekday':
+        categorical = pd.Categorical(column, categories=WEEKDAYS, ordered=True)
+    else:
+        categorical = pd.Categorical(column)
+    levels = pd.Index(categorical.categories, name=column.name)
+    codes = categorical.codes.astype(np.int16)
+    if (codes < 0).any():
+        # missing values get their own level, left out again by RollupCube.total
+        codes[codes < 0] = len(levels)
+        levels = levels.insert(len(levels), np.nan)
+    return levels, codes
+
+
+class RollupCube:
+    """Views, sessions and watched minutes per profile, weekday, hour, device, country and film type."""
+
+    def __init__(self, levels, codes, measures):
+        self.levels = levels  # dimension -> pd.Index of labels
+        self.codes = codes  # dimension -> int array, one entry per cell
+        self.measures = measures  # measure -> array, one entry per cell
+
+    @classmethod
+    def from_frame(cls, watched_df, new_session=None):
+        """Build the cube from the frame returned by :func:`netflix_analysis.ingest.prepare_watched`.
+
+        ``new_session`` marks the rows starting a session, by default every
+        first row of a profile, country and start time.
+        """
+        levels = {}
+        codes = {}
+        for dimension in DIMENSIONS:
+            levels[dimension], codes[dimension] = _levels_and_codes(watched_df[dimension])
+        if new_session is None:
+            new_session = ~watched_df.duplicated(SESSION_KEY).to_numpy()
+        measures = {
+            'views': np.ones(len(watched_df), dtype=np.int64),
+            'sessions': new_session.astype(np.int64),
+            'watched_minutes': watched_df['watched_minutes'].to_numpy().astype(np.int64),
+        }
+        return cls(levels, codes, measures)._compact()
+
+    @classmethod
+    def concat(cls, cubes):
+        """Merge cubes built from different parts of a viewing history."""
+        cubes = list(cubes)
+        levels = {}
+        codes = {}
+        for dimension in DIMENSIONS:
+            merged = cubes[0].levels[dimension]
+            for cube in cubes[1:]:
+                labels = cube.levels[dimension]
+                merged = merged.append(labels[~labels.isin(merged)])
+            levels[dimension] = merged.rename(dimension)
+            codes[dimension] = np.concatenate([merged.get_indexer(cube.levels[dimension])[cube.codes[dimension]]
+                                               for cube in cubes])
+        measures = {m: np.concatenate([cube.measures[m] for cube in cubes]) for m in MEASURES}
+        return cls(levels, codes, measures)._compact()
+
+    def _shape(self, dimensions):
+        return tuple(len(self.levels[dimension]) for dimension in dimensions)
+
+    def _compact(self):
+        # merge rows falling into the same cell
+        if not len(self.measures['views']):
+            return self
+        linear = np.ravel_multi_index([self.codes[d] for d in DIMENSIONS], self._shape(DIMENSIONS))
+        cells, inverse = np.unique(linear, return_inverse=True)
+        self.codes = {d: c.astype(np.int16) for d, c in
+                      zip(DIMENSIONS, np.unravel_index(cells, self._shape(DIMENSIONS)))}
+        self.measures = {m: np.bincount(inverse, weights=values, minlength=len(cells)).astype(values.dtype)
+                         for m, values in self.measures.items()}
+        return self
+
+    def __len__(self):
+        return len(self.measures['views'])
+
+    def select(self, **filters):
+        """A cube with only the cells matching ``dimension=[labels]`` filters."""
+        mask = np.ones(len(self), dtype=bool)
+        for dimension, labels in filters.items():
+            wanted = np.flatnonzero(self.levels[dimension].isin(list(labels)))
+            mask &= np.isin(self.codes[dimension], wanted)
+        return RollupCube(self.levels,
+                          {d: c[mask] for d, c in self.codes.items()},
+                          {m: v[mask] for m, v in self.measures.items()})
+
+    def total(self, by, measure='views'):
+        """Sum ``measure`` by one dimension or a list of them.
+
+        Returns a Series indexed by the labels of ``by``, containing only the
+        combinations that have at least one view (like ``groupby(observed=True)``).
+        """
+        dimensions = [by] if isinstance(by, str) else list(by)
+        shape = self._shape(dimensions)
+        linear = np.ravel_multi_index([self.codes[d] for d in dimensions], shape)
+        size = int(np.prod(shape))
+        values = np.bincount(linear, weights=self.measures[measure], minlength=size)
+        observed = np.flatnonzero(np.bincount(linear, weights=self.measures['views'], minlength=size))
+        values = values[observed].astype(self.measures[measure].dtype)
+        labels = [self.levels[d][p] for d, p in zip(dimensions, np.unravel_index(observed, shape))]
+        known = np.logical_and.reduce([~pd.isna(label) for label in labels])
+        if len(dimensions) == 1:
+            index = labels[0][known]
+        else:
+            index = pd.MultiIndex.from_arrays([label[known] for label in labels])
+        return pd.Series(values[known], index=index, name=measure)
+
+    def nunique(self, dimension):
+        """Number of distinct labels of ``dimension`` with at least one view."""
+        return len(self.total(dimension))
+
+
+# chart data
+##########################################################################################
+
+def watch_time_by_profile(cube):
+    """Hours watched per profile, ascending."""
+    hours = cube.total('Profile_Name', 'watched_minutes') / 60
+    return hours.rename('watched_hours').rename_axis('Profile_Name').reset_index().sort_values('watched_hours')
+
+
+def weekday_hour_counts(cube):
+    """Views per weekday, hour and profile."""
+    return cube.total(['Weekday', 'Hour', 'Profile_Name']).rename('Counts').reset_index()
@@ -0,0 +1,332 @@
+"""Columnar snapshots of parsed exports.
+
+Most of the time to the first chart goes into parsing: reading the CSVs
+out of the zip, the dtype cleanup and the duration and title parsing of
+:func:`netflix_analysis.ingest.prepare_watched`. A :class:`Snapshot` keeps
+the result (the watched history with its derived columns, the billing
+history and the streaming locations) as Arrow IPC tables, so loading it again
+is a memory map instead of a parse.
+
+A snapshot file is a zip of uncompressed members (the Arrow tables may be
+compressed themselves)::
+
+    netflix_snapshot.json   {"format": 1, "parser": 1, "export_id": ..., "tables": {...}}
+    watched.arrow
+    billing.arrow
+    locations.arrow
+
+so the tables are read in place, from a memory-mapped file or from the
+bytes of an upload. Uploads are not trusted: before a table is read its
+columns are checked against :data:`SCHEMAS` and the size of its buffers
+after decompression against the export limits of
+:mod:`netflix_analysis.archive`. The same file can be downloaded and
+uploaded again instead of the Netflix zip.
+
+Keeping parsed uploads on disk is opt-in: with :data:`SNAPSHOT_DIR` set
+they are kept there by the SHA-256 of the export, and the least recently
+used are removed once the directory holds more than
+:data:`SNAPSHOT_CACHE_MB`. Snapshots made by another
+:data:`PARSER_VERSION` are parsed again.
+"""
+
+import io
+import json
+import os
+import struct
+import tempfile
+import zipfile
+from dataclasses import dataclass
+
+import pandas as pd
+import pyarrow as pa
+
+from netflix_analysis.archive import MAX_MEMBER_SIZE, MAX_TOTAL_SIZE, ExportError
+from netflix_analysis.profiling import stage
+
+# one snapshot per export hash, only when SNAPSHOT_DIR is set; the budget for all of them in MB
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', '')
+SNAPSHOT_CACHE_MB = float(os.environ.get('SNAPSHOT_CACHE_MB', 1024))
+
+MANIFEST = 'netflix_snapshot.json'
+FORMAT_VERSION = 1
+# bump whenever prepare_watched or read_frames change what they produce
+PARSER_VERSION = 1
+TABLES = {'watched_df': 'watched.arrow', 'df_billing': 'billing.arrow', 'streaming_locations_df': 'locations.arrow'}
+
+_LOCAL_HEADER = struct.Struct('<4s22xHH')  # signature, ..., file name length, extra field length
+_ARROW_MAGIC = b'ARROW1\x00\x00'  # the stream of messages follows, then the footer
+
+_KINDS = {
+    'category': pa.types.is_dictionary,
+    'datetime': pa.types.is_timestamp,
+    'timedelta': pa.types.is_duration,
+    'string': lambda t: pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_null(t),
+    'integer': pa.types.is_integer,
+    'number': lambda t: pa.types.is_integer(t) or pa.types.is_floating(t),
+}
+
+# the columns kept of every table and their kinds, as prepare_watched and read_frames leave them; of the
+# billing history only what the metrics use
+SCHEMAS = {
+    'watched_df': {
+        'Profile_Name': 'category', 'Start_Time': 'datetime', 'Duration': 'timedelta', 'Attributes': 'string',
+        'Title': 'category', 'Supplemental_Video_Type': 'category', 'Device_Type': 'category',
+        'Bookmark': 'timedelta', 'Latest_Bookmark': 'string', 'Country': 'category', 'watched_minutes': 'integer',
+        'duration_minutes': 'number', 'watched_hours': 'number', 'percent_watched': 'number',
+        'percent_watched2': 'number', 'Show_Title': 'category', 'Season': 'category', 'Episode': 'category',
+        'Film_Type': 'category', 'Weekday': 'category', 'Hour': 'integer'},
+    'df_billing': {'Pmt Status': 'string', 'Final Invoice Result': 'string', 'Gross Sale Amt': 'number',
+                   'Currency': 'string'},
+    'streaming_locations_df': dict.fromkeys(
+        ['Esn', 'Country', 'Localized_Device_Description', 'Device_Description', 'Ip', 'Region_Code_Display_Name',
+         'Ts'], 'string'),
+}
+
+
+@dataclass
+class Snapshot:
+    """A parsed export: ``watched_df`` as :func:`prepare_watched` returns it, the other two frames as read."""
+    export_id: str
+    watched_df: pd.DataFrame
+    df_billing: pd.DataFrame
+    streaming_locations_df: pd.DataFrame
+
+    @classmethod
+    def from_frames(cls, export_id, watched_df, df_billing, streaming_locations_df):
+        """The snapshot of the frames, with the columns in :data:`SCHEMAS` (other columns of the export are dropped)."""
+        frames = {}
+        for field, df in [('watched_df', watched_df), ('df_billing', df_billing),
+                          ('streaming_locations_df', streaming_locations_df)]:
+            columns = list(SCHEMAS[field])
+            frames[field] = df if list(df.columns) == columns else df[columns].copy()
+        return cls(export_id, **frames)
+
+
+def _table_bytes(df, compression):
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def write_snapshot(snapshot, target, compression=None):
+    """Write ``snapshot`` to ``target`` (a path or a binary file object).
+
+    ``compression`` ('lz4' or 'zstd') makes smaller files that take a
+    decompression to load; without it the tables are mapped as they are.
+    Paths are written to a temporary file first and then renamed, so
+    concurrent writers and readers never see half a snapshot.
+    """
+    if not isinstance(target, str):
+        _write_zip(snapshot, target, compression)
+        return
+    directory = os.path.dirname(os.path.abspath(target))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _write_zip(snapshot, f, compression)
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _write_zip(snapshot, f, compression):
+    manifest = {'format': FORMAT_VERSION, 'parser': PARSER_VERSION, 'export_id': snapshot.export_id,
+                'tables': TABLES}
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_STORED) as zip_file:
+        zip_file.writestr(MANIFEST, json.dumps(manifest))
+        for field, member in TABLES.items():
+            zip_file.writestr(member, _table_bytes(getattr(snapshot, field), compression).to_pybytes())
+
+
+def snapshot_bytes(snapshot, compression='zstd'):
+    """The snapshot file as bytes, compressed for downloading."""
+    f = io.BytesIO()
+    write_snapshot(snapshot, f, compression)
+    return f.getvalue()
+
+
+def is_snapshot(source):
+    """True when ``source`` (a path or bytes) is a snapshot file rather than a Netflix export."""
+    if isinstance(source, str) and not os.path.isfile(source):
+        return False  # e.g. the sample data directory
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        with zipfile.ZipFile(source) as zip_file:
+            return MANIFEST in zip_file.NameToInfo
+    except zipfile.BadZipFile:
+        return False
+
+
+def read_snapshot(source):
+    """Load a snapshot file from a path (memory-mapped) or from bytes."""
+    with stage('read_snapshot') as record:
+        if isinstance(source, str):
+            buffer = pa.memory_map(source, 'r').read_buffer()
+        else:
+            buffer = pa.py_buffer(source)
+        try:
+            with zipfile.ZipFile(pa.BufferReader(buffer)) as zip_file:
+                manifest = json.loads(zip_file.read(MANIFEST))
+                if manifest.get('format') != FORMAT_VERSION:
+                    raise ExportError('Unsupported snapshot format {}'.format(manifest.get('format')))
+                if manifest.get('parser') != PARSER_VERSION:
+                    raise ExportError('The snapshot was made by another version of the app, '
+                                      'please upload the export zip instead')
+                if set(manifest['tables']) != set(SCHEMAS):
+                    raise ExportError('The snapshot has the tables {}'.format(sorted(manifest['tables'])))
+                streams = {field: _member_stream(buffer, zip_file.getinfo(member))
+                           for field, member in manifest['tables'].items()}
+            # every size is checked before the first table is decompressed
+            sizes = {field: _table_size(stream, field) for field, stream in streams.items()}
+            if sum(sizes.values()) > MAX_TOTAL_SIZE:
+                raise ExportError('The snapshot tables take more than {} MB'.format(MAX_TOTAL_SIZE // 2**20))
+            frames = {field: _read_table(stream, field) for field, stream in streams.items()}
+        except ExportError:
+            raise
+        except (zipfile.BadZipFile, KeyError, ValueError, TypeError, IndexError, OSError, struct.error,
+                pa.ArrowException) as error:
+            raise ExportError('The snapshot is damaged: {}'.format(error)) from error
+        record.rows = len(frames['watched_df'])
+    return Snapshot(export_id=manifest['export_id'], **frames)
+
+
+def _member_stream(buffer, info):
+    # the member's bytes start after its local header, which may differ from the central directory entry
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ExportError('{} is compressed inside the snapshot'.format(info.filename))
+    signature, name_length, extra_length = _LOCAL_HEADER.unpack(
+        buffer.slice(info.header_offset, _LOCAL_HEADER.size).to_pybytes())
+    if signature != b'PK\x03\x04':
+        raise ExportError('{} has no local header'.format(info.filename))
+    start = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+    member = buffer.slice(start, info.file_size)
+    if member.slice(0, len(_ARROW_MAGIC)).to_pybytes() != _ARROW_MAGIC:
+        raise ExportError('{} is not an Arrow file'.format(info.filename))
+    # read as a stream rather than through the footer, so the messages that were measured are the ones read
+    return member.slice(len(_ARROW_MAGIC))
+
+
+def _table_size(stream, field):
+    """The bytes the batches of ``stream`` take once decompressed, from their metadata alone."""
+    size = 0
+    for message in pa.ipc.MessageReader.open_stream(stream):
+        if message.type in ('record batch', 'dictionary'):
+            size += _body_size(message)
+        if size > MAX_MEMBER_SIZE:
+            raise ExportError('{} takes more than {} MB'.format(field, MAX_MEMBER_SIZE // 2**20))
+    return size
+
+
+def _body_size(message):
+    # walks the flatbuffer of a Message: header (field 2) is a RecordBatch, or a DictionaryBatch whose data
+    # (field 1) is one; its buffers (field 2) are (offset, length) structs into the body, and with a
+    # compression (field 3) every buffer starts with its uncompressed length (-1 when stored as it is)
+    metadata = message.metadata.to_pybytes()
+    batch = _table_field(metadata, _offset(metadata, 0), 2)
+    if message.type == 'dictionary':
+        batch = _table_field(metadata, batch, 1)
+    compressed = _field_position(metadata, batch, 3) is not None
+    buffers = _table_field(metadata, batch, 2)
+    count, = struct.unpack_from('<I', metadata, buffers)
+    size = 0
+    for i in range(count):
+        offset, length = struct.unpack_from('<qq', metadata, buffers + 4 + 16 * i)
+        if compressed and length:
+            uncompressed, = struct.unpack('<q', message.body.slice(offset, 8).to_pybytes())
+            size += length - 8 if uncompressed == -1 else uncompressed
+        else:
+            size += length
+    return size
+
+
+def _field_position(data, table, index):
+    vtable = table - struct.unpack_from('<i', data, table)[0]
+    vtable_size, = struct.unpack_from('<H', data, vtable)
+    if 4 + 2 * index >= vtable_size:
+        return None
+    position, = struct.unpack_from('<H', data, vtable + 4 + 2 * index)
+    return table + position if position else None
+
+
+def _table_field(data, table, index):
+    position = _field_position(data, table, index)
+    if position is None:
+        raise ExportError('A snapshot table has a record batch without field {}'.format(index))
+    return _offset(data, position)
+
+
+def _offset(data, position):
+    return position + struct.unpack_from('<I', data, position)[0]
+
+
+def _read_table(stream, field):
+    reader = pa.ipc.open_stream(stream)
+    check_schema(reader.schema, field)
+    return reader.read_all().to_pandas()
+
+
+def check_schema(schema, field):
+    """Raise :class:`ExportError` unless the Arrow ``schema`` has the columns :data:`SCHEMAS` expects for ``field``."""
+    index = set(name for name in (schema.pandas_metadata or {}).get('index_columns', []) if isinstance(name, str))
+    columns = {f.name: f.type for f in schema if f.name not in index}
+    expected = SCHEMAS[field]
+    if list(columns) != list(expected):
+        raise ExportError('{} has the columns {}, not {}'.format(field, list(columns), list(expected)))
+    for name, kind in expected.items():
+        if not _KINDS[kind](columns[name]):
+            raise ExportError('{} column {} is {}, not {}'.format(field, name, columns[name], kind))
+
+
+def snapshot_path(export_id, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, export_id + '.zip')
+
+
+def cached_snapshot(export_id, directory=SNAPSHOT_DIR):
+    """The snapshot of export ``export_id`` in ``directory``, or None."""
+    if not directory:
+        return None
+    path = snapshot_path(export_id, directory)
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = read_snapshot(path)
+    except ExportError:
+        return None  # written by another version, parsed and replaced again
+    os.utime(path)  # the modification time orders the eviction
+    return snapshot
+
+
+def save_snapshot(snapshot, directory=SNAPSHOT_DIR, max_mb=SNAPSHOT_CACHE_MB):
+    """Keep ``snapshot`` in ``directory`` under its export id (nothing happens without a directory).
+
+    Then the least recently used snapshots are removed until all of them
+    take at most ``max_mb``.
+    """
+    if directory:
+        write_snapshot(snapshot, snapshot_path(snapshot.export_id, directory))
+        evict_snapshots(directory, max_mb)
+
+
+def evict_snapshots(directory, max_mb):
+    """Remove the least recently used snapshots of ``directory`` until the rest take at most ``max_mb``."""
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.zip'):
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                continue  # removed by another process
+            entries.append((info.st_mtime, info.st_size, entry.path))
+    kept = 0
+    for _, size, path in sorted(entries, reverse=True):
+        kept += size
+        if kept > max_mb * 2**20:
+            try:
+                os.unlink(path)  # readers that mapped it keep their mapping
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,105 @@
+"""Per-export storage of the processed stages.
+
+The app keeps an :class:`ExportStore` for every uploaded export in one
+:class:`StoreRegistry` per process, which drops the least recently used
+stores beyond ``STORE_MAX_ENTRIES`` and the ones unused for ``STORE_TTL``
+seconds; a session whose store was dropped builds it again from its upload.
+The store for the sample data is shared by every session of the process and
+kept for its lifetime. Stages are computed on first use and then handed out
+without copying, so callers must treat the returned frames as read-only.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# how many uploaded exports the process keeps, and for how many seconds an unused one is kept
+STORE_MAX_ENTRIES = int(os.environ.get('STORE_MAX_ENTRIES', 16))
+STORE_TTL = float(os.environ.get('STORE_TTL', 60 * 60))
+
+
+class ExportStore:
+    """The processed stages of one export, each computed once."""
+
+    def __init__(self, export_id, source, file_id=None):
+        self.export_id = export_id
+        self.source = source  # path or bytes, dropped once the export is parsed
+        self.file_id = file_id
+        self._values = {}
+        # one lock per stage, so a slow stage (the TMDB search) does not hold up the others;
+        # stages only build stages they depend on, so the locks are always taken in the same order
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._retry_at = {}  # stage -> time.monotonic() after which an incomplete value is built again
+
+    def get(self, name, build, keep_if=None, retry_after=60):
+        """The value of stage ``name``, built by ``build()`` the first time.
+
+        With ``keep_if`` a value for which ``keep_if(value)`` is false (e.g. one
+        missing the results of failed requests) is only kept for
+        ``retry_after`` seconds, then it is built again.
+        """
+        retry_at = self._retry_at.get(name)
+        if retry_at is None or time.monotonic() < retry_at:
+            try:
+                return self._values[name]
+            except KeyError:
+                pass
+        with self._locks_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            retry_at = self._retry_at.get(name)
+            if name in self._values and (retry_at is None or time.monotonic() < retry_at):
+                return self._values[name]
+            value = build()
+            if keep_if is None or keep_if(value):
+                self._retry_at.pop(name, None)
+            else:
+                self._retry_at[name] = time.monotonic() + retry_after
+            self._values[name] = value
+            return value
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def release_source(self):
+        self.source = None
+
+
+class StoreRegistry:
+    """Thread-safe LRU of export stores by ``export_id``, at most ``max_entries`` and none unused for ``ttl`` seconds.
+
+    A dropped store stays usable by the reruns holding it, its memory is
+    freed once they finish.
+    """
+
+    def __init__(self, max_entries=STORE_MAX_ENTRIES, ttl=STORE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stores = OrderedDict()  # export_id -> (store, last used)
+        self._lock = threading.Lock()
+
+    def get_or_create(self, export_id, create):
+        """The store for ``export_id``, or the one made by ``create()`` if there is none."""
+        now = time.monotonic()
+        with self._lock:
+            while self._stores:
+                oldest_id, (_, used) = next(iter(self._stores.items()))
+                if now - used <= self.ttl:
+                    break
+                del self._stores[oldest_id]
+            if export_id in self._stores:
+                store = self._stores.pop(export_id)[0]
+            else:
+                store = create()
+            self._stores[export_id] = store, now
+            while len(self._stores) > self.max_entries:
+                self._stores.popitem(last=False)
+            return store
+
+    def __contains__(self, export_id):
+        return export_id in self._stores
+
+    def __len__(self):
+        return len(self._stores)
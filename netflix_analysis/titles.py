@@ -0,0 +1,97 @@
+"""Parsing Netflix titles into show, season and episode.
+
+Netflix writes series episodes as ``Show: Season 1: Episode name`` or
+``Show: Säsong 6: The Finale (Avsnitt 9)``, in the language of the profile.
+A viewing history repeats the same titles thousands of times, so every
+distinct title is parsed once (and remembered across uploads) and the result
+is mapped back to the rows through categorical codes.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import pandas as pd
+
+# words Netflix uses for "season" and "episode", by language
+SEASON_WORDS = {
+    'en': ['season', 'series', 'limited series', 'miniseries'],
+    'sv': ['säsong', 'serie', 'miniserie'],
+    'da': ['sæson', 'serie', 'miniserie'],
+    'no': ['sesong', 'serie', 'miniserie'],
+    'nl': ['seizoen', 'serie', 'miniserie'],
+    'de': ['staffel', 'serie', 'miniserie'],
+    'fr': ['saison', 'série', 'mini-série'],
+    'es': ['temporada', 'serie', 'miniserie'],
+    'pt': ['temporada', 'série', 'minissérie'],
+    'it': ['stagione', 'serie', 'miniserie'],
+    'fi': ['kausi', 'sarja', 'minisarja'],
+    'pl': ['sezon', 'serial', 'miniserial'],
+}
+EPISODE_WORDS = {
+    'en': ['episode'],
+    'sv': ['avsnitt', 'episod'],
+    'da': ['afsnit', 'episode'],
+    'no': ['episode'],
+    'nl': ['aflevering'],
+    'de': ['folge', 'episode'],
+    'fr': ['épisode'],
+    'es': ['episodio'],
+    'pt': ['episódio'],
+    'it': ['episodio'],
+    'fi': ['jakso'],
+    'pl': ['odcinek'],
+}
+
+
+def _alternatives(words_by_language):
+    words = sorted({w for words in words_by_language.values() for w in words}, key=len, reverse=True)
+    return '|'.join(re.escape(w) for w in words)
+
+
+# a title part like "Season 2", "Säsong 6", "Limited Series" or "Staffel 3"
+_season_part = re.compile(r'^(?:{})(?:\s+\w+)?$'.format(_alternatives(SEASON_WORDS)), re.IGNORECASE)
+# "Episode 3" anywhere, or "(Avsnitt 9)" at the end
+_episode = re.compile(r'\b(?:{})\s*\d+\b'.format(_alternatives(EPISODE_WORDS)), re.IGNORECASE)
+
+TitleInfo = namedtuple('TitleInfo', ['show', 'season', 'episode', 'film_type'])
+
+
+@lru_cache(maxsize=2**16)
+def parse_title(title):
+    """Split one title into a :class:`TitleInfo`.
+
+    ``film_type`` is 'Series' when the title has a season part or an episode
+    marker, otherwise 'Movie'. ``show`` is everything before the first
+    colon, like the Show_Title the app always used.
+    """
+    show = title.partition(':')[0]
+    parts = [part.strip() for part in title.split(':')]
+    season = next((part for part in parts[1:] if _season_part.match(part)), None)
+    episode = None
+    if len(parts) > 1:
+        rest = parts[parts.index(season) + 1:] if season is not None else parts[1:]
+        episode = ': '.join(rest) or None
+    is_series = season is not None or _episode.search(title) is not None
+    if not is_series:
+        episode = None
+    return TitleInfo(show, season, episode, 'Series' if is_series else 'Movie')
+
+
+def classify_titles(titles):
+    """Parse a column of titles, each distinct title only once.
+
+    Returns a frame with categorical Show_Title, Season, Episode and
+    Film_Type columns on the index of ``titles``.
+    """
+    categorical = titles.astype('category').cat.remove_unused_categories()
+    parsed = [parse_title(str(title)) for title in categorical.cat.categories]
+    codes = categorical.cat.codes.to_numpy().copy()
+    codes[codes < 0] = len(parsed)  # missing titles point to a trailing None
+
+    columns = {}
+    for field, column in zip(TitleInfo._fields, ['Show_Title', 'Season', 'Episode', 'Film_Type']):
+        values = pd.Categorical([getattr(info, field) for info in parsed] + [None])
+        columns[column] = pd.Categorical.from_codes(values.codes[codes], categories=values.categories)
+    columns['Film_Type'] = columns['Film_Type'].set_categories(['Movie', 'Series'])
+    return pd.DataFrame(columns, index=titles.index)
@@ -0,0 +1,291 @@
+"""Client for The Movie Database (TMDB) API.
+
+Title searches are batched over a pooled HTTP session and a bounded thread
+pool, throttled to stay under TMDB's rate limit, and stored in a small SQLite
+cache on disk so they survive app restarts.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# both can be overridden through the environment, e.g. to point the app at a local stub server
+TMDB_API_URL = os.environ.get('TMDB_API_URL', 'https://api.themoviedb.org/3')
+DEFAULT_CACHE_PATH = os.environ.get(
+    'TMDB_CACHE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'netflix_analysis', 'tmdb_cache.sqlite'))
+
+# TMDB allows roughly 50 requests per second per IP, stay a bit below that
+DEFAULT_REQUESTS_PER_SECOND = 40
+DEFAULT_TTL = 30 * 24 * 60 * 60  # 30 days
+DEFAULT_MAX_ENTRIES = 100_000
+
+LOGGER = logging.getLogger('netflix_analysis.tmdb')
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_title(title):
+    """Casefold and collapse whitespace so trivially different titles share a cache entry."""
+    title = unicodedata.normalize('NFKC', str(title)).casefold()
+    return _whitespace.sub(' ', title).strip()
+
+
+class TMDBError(Exception):
+    """Raised when TMDB keeps failing after all retries."""
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` calls per second."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class TMDBCache:
+    """SQLite backed response cache keyed by normalized title and language.
+
+    Entries older than ``ttl`` seconds are treated as missing, and once the
+    cache holds more than ``max_entries`` rows the oldest ones are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' payload TEXT NOT NULL,'
+                ' fetched_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at)')
+
+    @staticmethod
+    def key(title, language):
+        return normalize_title(title) + '|' + language
+
+    def get_many(self, keys):
+        """Return a dict of the fresh cached payloads for ``keys``."""
+        found = {}
+        keys = list(keys)
+        oldest = time.time() - self.ttl
+        with self._lock:
+            # sqlite limits the number of bound parameters per statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    'SELECT key, payload FROM responses WHERE fetched_at >= ? AND key IN ({})'.format(
+                        ','.join('?' * len(batch))),
+                    [oldest] + batch,
+                ).fetchall()
+                found.update((key, json.loads(payload)) for key, payload in rows)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items, evict=True):
+        """Store the payloads of ``items``; with ``evict`` false the caller runs :meth:`evict` after a batch."""
+        now = time.time()
+        rows = [(key, json.dumps(payload), now) for key, payload in items.items()]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', rows)
+            if evict:
+                self._evict()
+
+    def set(self, key, payload, evict=True):
+        self.set_many({key: payload}, evict)
+
+    def evict(self):
+        """Drop the expired entries and the oldest beyond ``max_entries``."""
+        with self._lock, self._conn:
+            self._evict()
+
+    def _evict(self):
+        # a count over the whole table, so once per batch rather than per response
+        self._conn.execute('DELETE FROM responses WHERE fetched_at < ?', (time.time() - self.ttl,))
+        (count,) = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN'
+                ' (SELECT key FROM responses ORDER BY fetched_at LIMIT ?)',
+                (count - self.max_entries,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TMDBClient:
+    """Batched, rate limited and cached access to the TMDB endpoints the app uses.
+
+    ``base_url`` can point to a local stub server for tests and benchmarks.
+    With an offline ``index`` (a :class:`netflix_analysis.tmdb_index.TMDBIndex`)
+    titles are looked up there first and only the misses go to the API.
+    """
+
+    def __init__(self, api_key, base_url=TMDB_API_URL, cache=None, index=None, max_workers=8,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, max_retries=5, timeout=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else TMDBCache()
+        self.index = index
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.index_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _get(self, path, params):
+        params = dict(params, api_key=self.api_key)
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+            except requests.RequestException as error:
+                last_error = error
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                last_error = TMDBError('TMDB returned HTTP {}'.format(response.status_code))
+                retry_after = response.headers.get('Retry-After')
+                if retry_after is not None:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+            if attempt < self.max_retries:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        raise TMDBError('Request to {} failed after {} attempts: {}'.format(path, self.max_retries + 1, last_error))
+
+    def genres(self, language='en-US'):
+        """The movie genre list, as returned by ``genre/movie/list``."""
+        key = 'genre/movie/list|' + language
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if self.index is not None:
+            indexed = self.index.genres()
+            if indexed['genres']:
+                return indexed
+        genres = self._get('/genre/movie/list', {'language': language})
+        self.cache.set(key, genres)
+        return genres
+
+    def search_movie(self, title, language='en-US'):
+        results = self.search_movies([title], language)
+        if title not in results:
+            raise TMDBError('TMDB search for {!r} failed'.format(title))
+        return results[title]
+
+    def search_movies(self, titles, language='en-US'):
+        """Search TMDB for every title and return a dict of title -> ``search/movie`` response.
+
+        Titles found in the offline index or the cache are not requested
+        again, the rest are fetched concurrently on ``max_workers`` threads
+        and every response is cached as soon as it arrives. Titles whose
+        search fails are logged and left out of the result, so a later call
+        only requests those again.
+        """
+        titles = list(dict.fromkeys(titles))
+        results = {}
+        if self.index is not None:
+            for title, movie in self.index.lookup_many(titles).items():
+                results[title] = {'page': 1, 'results': [movie], 'total_pages': 1, 'total_results': 1}
+            self.index_hits += len(results)
+            titles = [title for title in titles if title not in results]
+
+        keys = {title: self.cache.key(title, language) for title in titles}
+        cached = self.cache.get_many(set(keys.values()))
+
+        # different spellings of the same title only need one request
+        missing = {}
+        for title, key in keys.items():
+            if key in cached:
+                results[title] = cached[key]
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(title)
+        self.misses += len(missing)
+
+        def fetch(title):
+            return self._get('/search/movie', {'query': title, 'language': language,
+                                               'page': 1, 'include_adult': 'false'})
+
+        if missing:
+            failed = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(fetch, spellings[0]): key for key, spellings in missing.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        response = future.result()
+                    except (TMDBError, requests.RequestException, ValueError) as error:
+                        failed[missing[key][0]] = error
+                        continue
+                    self.cache.set(key, response, evict=False)
+                    for title in missing[key]:
+                        results[title] = response
+            self.cache.evict()
+            if failed:
+                self.failures += len(failed)
+                LOGGER.warning('TMDB search failed for %d of %d titles, e.g. %r: %s', len(failed), len(missing),
+                               *next(iter(failed.items())))
+                for title, error in failed.items():
+                    LOGGER.debug('TMDB search for %r failed: %s', title, error)
+        return results
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
+        if self.index is not None:
+            self.index.close()
@@ -0,0 +1,240 @@
+"""Offline TMDB movie index.
+
+A small SQLite file mapping movie titles to their TMDB id, genres, rating
+and release date, built from a TMDB dataset dump or from the responses
+already in the app's TMDB cache. The app looks every watched title up here
+first and only asks the API for titles the index does not know, so the genre
+and rating charts also work offline.
+
+Build and query it from the command line::
+
+    python -m netflix_analysis.tmdb_index build tmdb_index.sqlite --export movies.jsonl.gz
+    python -m netflix_analysis.tmdb_index build tmdb_index.sqlite --cache ~/.cache/netflix_analysis/tmdb_cache.sqlite
+    python -m netflix_analysis.tmdb_index lookup tmdb_index.sqlite "The Irishman" "Roma"
+
+Export files are JSON lines (optionally gzipped), or a JSON list, of TMDB
+movie objects. ``genre_ids`` or ``genres`` ([{"id", "name"}]) are used for
+the genres; ``genres`` also fills the genre name table.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from netflix_analysis.tmdb_client import DEFAULT_CACHE_PATH, normalize_title
+
+DEFAULT_INDEX_PATH = os.environ.get(
+    'TMDB_INDEX_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'netflix_analysis', 'tmdb_index.sqlite'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    tmdb_id INTEGER PRIMARY KEY,
+    title TEXT,
+    original_title TEXT,
+    normalized_title TEXT,
+    normalized_original_title TEXT,
+    genre_ids TEXT,
+    vote_average REAL,
+    vote_count INTEGER,
+    release_date TEXT,
+    popularity REAL
+);
+CREATE TABLE IF NOT EXISTS genres (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS movies_title ON movies (title);
+CREATE INDEX IF NOT EXISTS movies_original_title ON movies (original_title);
+CREATE INDEX IF NOT EXISTS movies_normalized_title ON movies (normalized_title);
+CREATE INDEX IF NOT EXISTS movies_normalized_original_title ON movies (normalized_original_title);
+"""
+
+_COLUMNS = ('tmdb_id', 'title', 'original_title', 'genre_ids', 'vote_average', 'vote_count', 'release_date',
+            'popularity')
+
+
+def _movie_row(movie):
+    genre_ids = movie.get('genre_ids')
+    if genre_ids is None:
+        genre_ids = [genre['id'] for genre in movie.get('genres') or []]
+    title = movie.get('title') or movie.get('original_title')
+    original_title = movie.get('original_title') or title
+    return (movie['id'], title, original_title, normalize_title(title or ''), normalize_title(original_title or ''),
+            json.dumps(genre_ids), movie.get('vote_average'), movie.get('vote_count'), movie.get('release_date'),
+            movie.get('popularity'))
+
+
+def read_export(path):
+    """Yield the movie objects of a TMDB export file."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_cache(path=DEFAULT_CACHE_PATH):
+    """Yield the movies and genre lists stored in a TMDB response cache.
+
+    Movies are yielded as dicts, genre lists as ``("genres", [...])`` tuples.
+    """
+    conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+    try:
+        for key, payload in conn.execute('SELECT key, payload FROM responses'):
+            payload = json.loads(payload)
+            if key.startswith('genre/movie/list|'):
+                yield ('genres', payload.get('genres', []))
+            else:
+                yield from payload.get('results', [])
+    finally:
+        conn.close()
+
+
+def build_index(output, movies, batch_size=10_000):
+    """Write ``movies`` (TMDB movie dicts or ``("genres", [...])`` tuples) to the index at ``output``.
+
+    Returns the number of movies written. Existing entries with the same
+    TMDB id are replaced, so an index can be extended from several sources.
+    """
+    conn = sqlite3.connect(output)
+    count = 0
+    try:
+        conn.executescript(_SCHEMA)
+        batch = []
+        with conn:
+            for movie in movies:
+                if isinstance(movie, tuple):
+                    conn.executemany('INSERT OR REPLACE INTO genres VALUES (?, ?)',
+                                     [(genre['id'], genre['name']) for genre in movie[1]])
+                    continue
+                if movie.get('genres'):
+                    conn.executemany('INSERT OR REPLACE INTO genres VALUES (?, ?)',
+                                     [(genre['id'], genre['name']) for genre in movie['genres']])
+                batch.append(_movie_row(movie))
+                if len(batch) >= batch_size:
+                    conn.executemany('INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                    count += len(batch)
+                    batch = []
+            conn.executemany('INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            count += len(batch)
+        conn.executescript(_INDEXES)
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    return count
+
+
+class TMDBIndex:
+    """Read-only, memory-mapped access to an index built by :func:`build_index`."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, mmap_size=256 * 2**20):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True, check_same_thread=False)
+        self._conn.execute('PRAGMA mmap_size={}'.format(int(mmap_size)))
+
+    @classmethod
+    def open_default(cls):
+        """The index at TMDB_INDEX_PATH (or the default location), or None when there is none."""
+        return cls(DEFAULT_INDEX_PATH) if os.path.exists(DEFAULT_INDEX_PATH) else None
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _best(self, column, value):
+        rows = self._query(
+            'SELECT {} FROM movies WHERE {} = ? ORDER BY popularity DESC LIMIT 1'.format(', '.join(_COLUMNS), column),
+            (value,))
+        return self._as_result(rows[0]) if rows else None
+
+    @staticmethod
+    def _as_result(row):
+        movie = dict(zip(_COLUMNS, row))
+        movie['id'] = movie.pop('tmdb_id')
+        movie['genre_ids'] = json.loads(movie['genre_ids']) if movie['genre_ids'] else []
+        return movie
+
+    def lookup(self, title):
+        """The most popular movie with this exact title, else with the same normalized title, else None.
+
+        The result looks like one entry of a ``search/movie`` response.
+        """
+        for column, value in (('title', title), ('original_title', title),
+                              ('normalized_title', normalize_title(title)),
+                              ('normalized_original_title', normalize_title(title))):
+            movie = self._best(column, value)
+            if movie is not None:
+                return movie
+        return None
+
+    def lookup_many(self, titles):
+        """Dict of title -> movie for the titles found in the index."""
+        found = {}
+        for title in titles:
+            movie = self.lookup(title)
+            if movie is not None:
+                found[title] = movie
+        return found
+
+    def genres(self):
+        """The genre list in the shape of a ``genre/movie/list`` response (empty if the index has none)."""
+        return {'genres': [{'id': i, 'name': name} for i, name in self._query('SELECT id, name FROM genres', ())]}
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM movies', ())[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m netflix_analysis.tmdb_index',
+                                     description='Build or query the offline TMDB movie index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build or extend an index')
+    build.add_argument('output', help='index file to write')
+    build.add_argument('--export', action='append', default=[], help='TMDB export file (.json, .jsonl, .gz)')
+    build.add_argument('--cache', action='append', default=[], help='TMDB response cache to import')
+
+    lookup = commands.add_parser('lookup', help='look titles up in an index')
+    lookup.add_argument('index', help='index file to read')
+    lookup.add_argument('titles', nargs='+')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        if not args.export and not args.cache:
+            parser.error('build needs at least one --export or --cache')
+
+        def sources():
+            for path in args.export:
+                yield from read_export(path)
+            for path in args.cache:
+                yield from read_cache(path)
+
+        count = build_index(args.output, sources())
+        print('indexed {} movies into {}'.format(count, args.output))
+    else:
+        index = TMDBIndex(args.index)
+        for title in args.titles:
+            json.dump({title: index.lookup(title)}, sys.stdout, ensure_ascii=False)
+            sys.stdout.write('\n')
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
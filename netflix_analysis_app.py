@@ -1,24 +1,151 @@
+import os
+import hashlib
 import streamlit as st
 import pandas as pd
-from zipfile import ZipFile
 import plotly.express as px
-import numpy as np
+import plotly.io as pio
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import seaborn as sns
 from PIL import Image
 
-# The movie database api required packages
+# The movie database api client
 
-import urllib.request
-import urllib.parse
-import json
-import requests
+from netflix_analysis.tmdb_client import TMDBClient
+from netflix_analysis.tmdb_index import TMDBIndex
+
+# per-stage timings and memory, shown in a debug panel and logged as JSON when switched on
+
+from netflix_analysis.profiling import Profiler, activate, profiling_enabled
+
+# built charts, shared by all sessions
+
+from netflix_analysis.figures import FigureCache, plotly_spec, matplotlib_png
+
+# processed data per export, kept per session for uploads and once per process for the sample
+
+from netflix_analysis.store import STORE_TTL, ExportStore, StoreRegistry
+
+# netflix export processing
+
+from netflix_analysis.snapshot import SNAPSHOT_CACHE_MB, SNAPSHOT_DIR, snapshot_bytes
+from netflix_analysis.archive import ExportError
+from netflix_analysis.genres import genre_names
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile, weekday_hour_counts
+from netflix_analysis.locations import IPIndex, IsoLookup, login_locations, login_counts, travel_timeline
+
+# the computations behind every chart, this script only caches and renders them
+
+from netflix_analysis.analysis import (parse_export, read_iso_codes, metrics, favorites, country_sessions,
+                                       device_counts, heatmap_table, movie_database, movie_genres)
 
 # App Theme
 ##########################################################################################
 
 
+# Profiling
+##########################################################################################
+
+# a new profiler per rerun, the library stages (duration parsing, title classification, TMDB search) record into it too
+profiler = activate(Profiler(enabled=profiling_enabled()))
+
+
+# Processing stages
+##########################################################################################
+
+# Every stage is computed once per export and kept in its ExportStore (see netflix_analysis/store.py),
+# so touching a widget only reruns the filtering and the charts. The uploads' stores are kept per process,
+# at most STORE_MAX_ENTRIES (16) and none unused for longer than STORE_TTL (an hour); a session whose store
+# was dropped parses its upload again. The sample data in Files/, the ISO codes and the TMDB genre list are
+# loaded once per process and shared by all sessions without copying, so the stages hand out frames that
+# must not be modified.
+
+def load_export(store):
+    def read():
+        # Files/, an uploaded zip or snapshot; with SNAPSHOT_DIR set an upload's snapshot is reused for the same zip
+        snapshot = parse_export(store.source, store.export_id, SNAPSHOT_DIR if store.file_id is not None else None)
+        store.release_source()
+        return snapshot
+    return store.get('export', read)
+
+def load_watched(store):
+    return load_export(store).watched_df
+
+# views, sessions and watched minutes per profile, weekday, hour, device, country and film type,
+# the watch time, map, device and heatmap charts are all sliced from it
+def load_rollup(store):
+    return store.get('rollup', lambda: RollupCube.from_frame(load_watched(store)))
+
+def load_metrics(store):
+    return store.get('metrics', lambda: metrics(load_watched(store), load_rollup(store), load_export(store).df_billing))
+
+def load_favorites(store, film_type):
+    return store.get('favorites_' + film_type, lambda: favorites(load_watched(store), film_type))
+
+# sessions per profile and country, the map sums the selected profiles
+def load_countries(store):
+    return store.get('countries', lambda: country_sessions(load_rollup(store), load_iso_codes()))
+
+# views per profile and device family (TV, Phone, Tablet, PC, Console, VR, Streamer), see netflix_analysis/devices.py
+def load_devices(store):
+    return store.get('devices', lambda: device_counts(load_rollup(store)))
+
+def load_heatmap(store):
+    #count the views per day and hour, Weekday is an ordered categorical (Monday first)
+    return store.get('heatmap', lambda: heatmap_table(weekday_hour_counts(load_rollup(store))))
+
+# logins from IpAddressesStreaming.csv with their device family, country and region, see netflix_analysis/locations.py
+def load_locations(store):
+    return store.get('locations', lambda: login_locations(load_export(store).streaming_locations_df, get_ip_index()))
+
+def load_regions(store):
+    return store.get('regions', lambda: login_counts(load_locations(store), ['Country', 'Region']))
+
+# runs of logins of one device from the same region
+def load_travels(store):
+    return store.get('travels', lambda: travel_timeline(load_locations(store), by='Esn'))
+
+# alpha-2 code -> row of iso_codes.csv as an integer table, the map needs no merge
+@st.experimental_singleton
+def load_iso_codes():
+    return IsoLookup.from_frame(read_iso_codes())
+
+# the offline CIDR -> country/region index at IP_INDEX_PATH, memory-mapped once per process;
+# without one the logins keep the country and region Netflix recorded
+@st.experimental_singleton
+def get_ip_index():
+    return IPIndex.open_default()
+
+@st.experimental_singleton
+def get_sample_store():
+    return ExportStore('sample', 'Files')
+
+@st.experimental_singleton
+def get_store_registry():
+    return StoreRegistry()
+
+def get_export_store(uploaded_file):
+    if uploaded_file is None:
+        return get_sample_store()
+    upload = st.session_state.get('upload')
+    # hash each upload only once, not on every rerun
+    if upload is None or upload[0] != uploaded_file.id:
+        upload = uploaded_file.id, hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        st.session_state['upload'] = upload
+    file_id, export_id = upload
+    return get_store_registry().get_or_create(
+        export_id, lambda: ExportStore(export_id, uploaded_file.getvalue(), file_id=file_id))
+
+# Plotly specs and heatmap images keyed by export_id, chart and widget state, least recently used ones
+# are dropped beyond FIGURE_CACHE_MB (64 MB by default) for the whole process
+@st.experimental_singleton
+def get_figure_cache():
+    return FigureCache()
+
+figure_cache = get_figure_cache()
+
+
+
 # APP UI MODULES
 ##########################################################################################
 
@@ -41,11 +168,21 @@ with st.expander('Want to know more? Or Do you have any questions or feedback?')
             I am happy about any suggestions, feedback, or just to talk about this project or anything Data. \
             Feel free to reach out to me on [linkedin.com/in/sebastian-ten-berge](https://www.linkedin.com/in/sebastian-ten-berge/)')
 
+# what happens to an upload, for the FAQ and the sidebar
+STORAGE_NOTE = 'files are stored in memory, they get deleted immediately as soon as they’re not needed anymore. \
+    You can find more in depth information in streamlits own documentation:\
+    [where-file-uploader-store-when-deleted](https://docs.streamlit.io/knowledge-base/using-streamlit/where-file-uploader-store-when-deleted). \
+    The tables computed from your export stay in the server’s memory for at most {:.0f} minutes after you last used \
+    the app, so the charts do not have to be computed again on every click.'.format(STORE_TTL / 60)
+if SNAPSHOT_DIR:
+    STORAGE_NOTE += ' On this server a compact parsed copy of the viewing history, streaming locations and amounts paid \
+        is kept on disk, named by a fingerprint of your zip, so the same export loads faster next time. \
+        The least recently used copies are deleted once they take more than {:.0f} MB.'.format(SNAPSHOT_CACHE_MB)
+
 with st.expander('FAQ'):
      st.markdown("**Q.1: Is my data stored if I upload it?**  \n"
-                "A.1: No. files are stored in memory, they get deleted immediately as soon as they’re not needed anymore.\
-                You can find more in depth information in streamlits own documentation:\
-                [where-file-uploader-store-when-deleted](https://docs.streamlit.io/knowledge-base/using-streamlit/where-file-uploader-store-when-deleted)."
+                "A.1: " + ('Not the zip. ' if SNAPSHOT_DIR else 'No. ') + STORAGE_NOTE + "  \n"
+                "The snapshot you can download from the sidebar loads faster when uploaded instead of the zip."
                 )
      st.markdown("**Q.2: What data does the Netflix Export invlude?**  \n"
                 "A.2: The CSV's within the Zip folder of your Netflix data includes an array of different information.  \n"
@@ -57,12 +194,6 @@ with st.expander('FAQ'):
 
      
 
-## !!! next goal is to create option to upload own netflix file. 
-
-interaction_df = pd.read_csv('Files/ViewingActivity.csv')
-df_billing = pd.read_csv('Files/BillingHistory.csv')
-# IP Adress locations - where movies were watched
-streaming_locations_df = pd.read_csv('Files/IpAddressesStreaming.csv')
 
 # Sidebar 
 ##########################################################################################
@@ -72,52 +203,46 @@ uploaded_file = st.sidebar.file_uploader("upload file", type="zip")
 
 st.sidebar.markdown('**What happens to my netflix data if I upload it?** :thinking_face:')
 with st.sidebar.expander('Explanation'):
-     st.markdown('In short, files are stored in memory, they get deleted immediately as soon as they’re not needed anymore. \
-        You can find more in depth information in streamlits own documentation:\
-         [where-file-uploader-store-when-deleted](https://docs.streamlit.io/knowledge-base/using-streamlit/where-file-uploader-store-when-deleted)', unsafe_allow_html=False )
+     st.markdown('In short, ' + STORAGE_NOTE, unsafe_allow_html=False )
 
 
 # Data import processing
 ##########################################################################################
 
-# analyse zip file
-if uploaded_file is not None:
-    with ZipFile(uploaded_file, 'r') as zip:
-        zip.extractall()
-        # # creates df from upload
-        interaction_df = pd.read_csv('./CONTENT_INTERACTION/ViewingActivity.csv')
-        df_billing = pd.read_csv('./PAYMENT_AND_BILLING/BillingHistory.csv')
-        # # IP Adress locations - where movies were watched
-        streaming_locations_df = pd.read_csv('./IP_ADDRESSES/IpAddressesStreaming.csv')
-
-# ISO Codes converter
-iso_df =pd.read_csv('Files/iso_codes.csv', header=None, names=['Country', 'iso_2', 'iso_3', 'UN_Code'])
-
-# adding all dataframes into a list
-alldfs = [interaction_df, streaming_locations_df]
-#add replace all spaces in column titles with underscore
-for column_titles in (alldfs):
-    column_titles.columns = column_titles.columns.str.replace(' ', '_')
-
-
-### Removing all none movie or serie titles
-watched_df = interaction_df[interaction_df['Supplemental_Video_Type'].isnull()]
-### Removing all unwanted autoplays by filtering out all where Duration watched is less than 1 minute 30 seconds
-watched_df = watched_df[(watched_df['Duration'] > '00:01:00')]
-
-### calculating total amount billed
-costs = df_billing.loc[(df_billing['Pmt Status'] == 'APPROVED') & (df_billing['Final Invoice Result'] == 'SETTLED'), "Gross Sale Amt"].sum()
-currency = df_billing['Currency'].iloc[0:1, ]
+# analyse zip file, the sample data is used until a file is uploaded
+export_store = get_export_store(uploaded_file)
+export_id = export_store.export_id
+
+try:
+    with profiler.stage('data_import') as record:
+        export_snapshot = load_export(export_store)
+        watched_df = export_snapshot.watched_df
+        record.rows = len(watched_df)
+except ExportError as error:
+    st.error('Could not read the uploaded Netflix export: {}'.format(error))
+    st.stop()
+with profiler.stage('rollup') as record:
+    rollup = load_rollup(export_store)
+    record.rows = len(rollup)
+
+### titles, devices, countries and the total amount billed
+with profiler.stage('metrics'):
+    account_metrics = load_metrics(export_store)
+
+# the parsed export as one file, uploading it instead of the Netflix zip skips the parsing; only built when asked for
+if st.sidebar.button('Save a snapshot of this export'):
+    st.sidebar.download_button('Download netflix_snapshot.zip', snapshot_bytes(export_snapshot),
+                               file_name='netflix_snapshot.zip', mime='application/zip')
 
 # Basic Statistic on data
 ##########################################################################################
 #viewing_statistics = [(interaction_df.Title.nunique(), interaction_df.Device_Type.nunique(), interaction_df.Country.nunique())]
 #df_viewing_statistics = pd.DataFrame(viewing_statistics, columns=['Titles', 'Devices', 'Country']).reset_index(drop=True)
 col1, col2, col3, col4 = st.columns(4)
-col1.metric('Titles Watched', watched_df.Title.nunique())
-col2.metric('Unique Devices', watched_df.Device_Type.nunique())
-col3.metric('Countries Logged in from', watched_df.Country.nunique())
-col4.metric('Paid for Netflix', (list(currency)[0] + " " + str(np.round_(costs.astype(int), decimals=0))))
+col1.metric('Titles Watched', account_metrics.titles)
+col2.metric('Unique Devices', account_metrics.devices)
+col3.metric('Countries Logged in from', account_metrics.countries)
+col4.metric('Paid for Netflix', account_metrics.currency + " " + str(int(account_metrics.paid)))
 
 
 
@@ -125,35 +250,26 @@ col4.metric('Paid for Netflix', (list(currency)[0] + " " + str(np.round_(costs.a
 
 ##########################################################################################
 
-watched_df['watched_minutes'] = watched_df['Duration'].str.split(':').apply(lambda x: int(x[0]) * 60 + int(x[1]))
-watched_df['duration_minutes'] = watched_df['Bookmark'].str.split(':').apply(lambda x: int(x[0]) * 60 + int(x[1]))
-watched_df['watched_hours'] = watched_df['watched_minutes'] / 60
-watched_df['percent_watched'] = watched_df['watched_minutes'] / watched_df['duration_minutes'] *100
-watched_df['percent_watched2'] = 5 * round(watched_df['percent_watched']/5)
-total_watchtime_df =  watched_df.groupby(['Profile_Name'],as_index=False).sum().sort_values('watched_hours')
+def watch_time_figure():
+    total_watchtime_df = watch_time_by_profile(rollup)
 
-fig3 = px.bar(total_watchtime_df, x= 'Profile_Name',  y="watched_hours",
-             color="watched_hours",
-             color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"],
-             title="Did we spend too much time watching Netflix?")
-st.plotly_chart(fig3, use_container_width=True)
+    fig3 = px.bar(total_watchtime_df, x= 'Profile_Name',  y="watched_hours",
+                 color="watched_hours",
+                 color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"],
+                 title="Did we spend too much time watching Netflix?")
+    return fig3
 
+with profiler.stage('render_watch_time'):
+    st.plotly_chart(plotly_spec(figure_cache, ('watch_time', export_id), watch_time_figure), use_container_width=True)
 
-# defining movie and series
-#########################################################################################
-watched_df["Show_Title"] = [s.partition(":")[0] for s in watched_df.Title]
-
-# filtering out seasons with the word Säsong, season, series, serie
-watched_df["temporary_brackets_removed_title"] = watched_df['Title'].str.replace('(', '')
-watched_df["Film_Type"] = np.where(watched_df.temporary_brackets_removed_title.astype(str).str.contains(pat = 'Season | Säsong | Series | Serie | Episode | Episod | Avsnitt', case = False), 'Series', 'Movie')
-watched_df = watched_df.drop('temporary_brackets_removed_title', 1)
 
 # Users Multi Select Button
 ##########################################################################################
 
-users = watched_df.Profile_Name.unique()
+users = list(watched_df.Profile_Name.unique())
 
 user_radio_button_1 = st.sidebar.multiselect("Netflix Account", users, users)
+selected_users = tuple(sorted(user_radio_button_1))
 
 # Most watched Movies
 ##########################################################################################
@@ -162,11 +278,8 @@ film_type = ['Movie', 'Series']
 
 film_type_radio_button_1 = st.radio("Movies or Series", film_type)
 
-if film_type_radio_button_1 == 'Movie':
-    df_Movies_watched_cleaned_1 = watched_df[(watched_df["Film_Type"] == 'Movie') & (watched_df["percent_watched2"] > 85)]
-    df_Movies_watched_frequency = df_Movies_watched_cleaned_1[['Profile_Name', 'Title', 'Film_Type']].groupby(['Profile_Name', 'Title'])['Film_Type'].count().reset_index()
-    df_Movies_watched_frequency.rename(columns = {'Film_Type':'Count'}, inplace = True)
-    df_Movies_watched_frequency = df_Movies_watched_frequency.sort_values('Count', ascending=False)
+def favorite_movies_figure():
+    df_Movies_watched_frequency = load_favorites(export_store, 'Movie')
     fig5 = px.bar(df_Movies_watched_frequency[df_Movies_watched_frequency['Profile_Name'].isin(user_radio_button_1)].head(10),
                          x='Title',
                          y = 'Count', 
@@ -175,14 +288,17 @@ if film_type_radio_button_1 == 'Movie':
                          title="Our Favorite Movies"
                          )
     fig5.update_layout(xaxis={'categoryorder':'total descending'})
-    st.plotly_chart(fig5, use_container_width=True)
+    return fig5
+
+if film_type_radio_button_1 == 'Movie':
+    with profiler.stage('render_favorite_movies'):
+        st.plotly_chart(plotly_spec(figure_cache, ('favorite_movies', export_id, selected_users), favorite_movies_figure),
+                        use_container_width=True)
 
 # Most watched Series
 ##########################################################################################
-if film_type_radio_button_1 == 'Series':
-    df_series_watched_cleaned_1 = watched_df[(watched_df["Film_Type"] == 'Series') & (watched_df["percent_watched2"] > 85)]
-    df_series_watched_frequency = df_series_watched_cleaned_1[['Profile_Name', 'Show_Title', 'Film_Type']].groupby(['Profile_Name', 'Show_Title'])['Film_Type'].count().reset_index().sort_values('Film_Type', ascending=False)
-    df_series_watched_frequency.rename(columns = {'Film_Type':'Count'}, inplace = True)
+def favorite_series_figure():
+    df_series_watched_frequency = load_favorites(export_store, 'Series')
     fig6 = px.bar(df_series_watched_frequency[df_series_watched_frequency['Profile_Name'].isin(user_radio_button_1)].head(10), 
                         x='Show_Title', 
                         y = 'Count', 
@@ -190,59 +306,98 @@ if film_type_radio_button_1 == 'Series':
                         color_discrete_sequence=["rgb(1,1,1)", "rgb(219,0,0)", "rgb(86,77,77)", "rgb(131,16,16)"],
                         title="Our Favorite Series")
     fig6.update_layout(xaxis={'categoryorder':'total descending'})
-    st.plotly_chart(fig6, use_container_width=True)
+    return fig6
+
+if film_type_radio_button_1 == 'Series':
+    with profiler.stage('render_favorite_series'):
+        st.plotly_chart(plotly_spec(figure_cache, ('favorite_series', export_id, selected_users), favorite_series_figure),
+                        use_container_width=True)
 
 
 # Viewing geo location
 ##########################################################################################
 
 
-streaming_country_df = watched_df[watched_df['Profile_Name'].isin(user_radio_button_1)].groupby(by='Country', as_index=False).agg({'Start_Time': pd.Series.nunique})
-streaming_country_df['Country'] = streaming_country_df['Country'].astype(str).str[0:2]
-streaming_country_df = streaming_country_df.merge(iso_df,how='inner',left_on=['Country'],right_on=['iso_2'])
+with profiler.stage('geo_aggregation') as record:
+    streaming_country_df = load_countries(export_store)
+    streaming_country_df = streaming_country_df[streaming_country_df['Profile_Name'].isin(user_radio_button_1)]
+    streaming_country_df = streaming_country_df.groupby(['iso_3', 'Country_Name'], as_index=False)['Sessions'].sum()
+    record.rows = len(streaming_country_df)
 
 
-fig = px.choropleth(streaming_country_df,                            # Input Dataframe
-                         locations='iso_3',           # identify country code column
-                         color= 'Start_Time',                     # identify representing column
-                         color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"],
-                         hover_name= 'Country_y',              # identify hover name
-                         projection= 'natural earth',        # select projection
-                         range_color=[0,streaming_country_df['Start_Time'].max()],
-                         labels={'Start_Time':'Hours Series/Movies Watched'},
-                         title= 'In which Countries have we watched Netflix?')
-st.plotly_chart(fig)
-fig.write_html("example_map.html")
+def map_figure():
+    fig = px.choropleth(streaming_country_df,                            # Input Dataframe
+                             locations='iso_3',           # identify country code column
+                             color= 'Sessions',                     # identify representing column
+                             color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"],
+                             hover_name= 'Country_Name',              # identify hover name
+                             projection= 'natural earth',        # select projection
+                             range_color=[0,streaming_country_df['Sessions'].max()],
+                             labels={'Sessions':'Hours Series/Movies Watched'},
+                             title= 'In which Countries have we watched Netflix?')
+    return fig
 
+with profiler.stage('render_map'):
+    map_spec = plotly_spec(figure_cache, ('map', export_id, selected_users), map_figure)
+    st.plotly_chart(map_spec)
 
-# Devices Used to Watch Netflix
+# the map as a standalone HTML file, only built when asked for
+if st.button('Export the map as HTML'):
+    st.download_button('Download map.html', pio.to_html(map_spec), file_name='netflix_map.html', mime='text/html')
 
+
+# Login Locations
 ##########################################################################################
 
-word_count_device = watched_df[watched_df['Profile_Name'].isin(user_radio_button_1)].Device_Type.str.split(expand=True).stack().value_counts()
-df_word_count_device = word_count_device.to_frame()
-df_word_count_device.reset_index(inplace=True)
-df_word_count_device = df_word_count_device.rename(columns = {'index':'sub_device', 0:'Count'})
+with profiler.stage('location_aggregation') as record:
+    df_regions = load_regions(export_store)
+    df_travels = load_travels(export_store)
+    record.rows = len(df_regions)
+
+def regions_figure():
+    fig7 = px.bar(df_regions.head(15), x='Region', y='Logins',
+                  color='Country',
+                  color_discrete_sequence=["rgb(1,1,1)", "rgb(219,0,0)", "rgb(86,77,77)", "rgb(131,16,16)"],
+                  hover_data=['Devices', 'First_Seen', 'Last_Seen'],
+                  title="From which Regions did we log in?")
+    fig7.update_layout(xaxis={'categoryorder':'total descending'})
+    return fig7
+
+def travels_figure():
+    stays = df_travels.assign(Start=df_travels['Start'].dt.tz_localize(None), End=df_travels['End'].dt.tz_localize(None))
+    # a stay of a single login still gets a visible bar
+    stays['End'] = stays['End'].where(stays['End'] - stays['Start'] > pd.Timedelta(days=1), stays['Start'] + pd.Timedelta(days=1))
+    fig8 = px.timeline(stays, x_start='Start', x_end='End', y='Region', color='Country',
+                       color_discrete_sequence=["rgb(1,1,1)", "rgb(219,0,0)", "rgb(86,77,77)", "rgb(131,16,16)"],
+                       hover_data=['Esn', 'Logins'],
+                       title="Where have our devices been?")
+    return fig8
+
+with profiler.stage('render_locations'):
+    st.plotly_chart(plotly_spec(figure_cache, ('regions', export_id), regions_figure), use_container_width=True)
+    st.plotly_chart(plotly_spec(figure_cache, ('travels', export_id), travels_figure), use_container_width=True)
 
-devices = ['tv', 'phone', 'ipad', 'tablet', 'pc', 'mac', 'vr', 'iphone', 'chromecast'] 
 
-# selecting rows based on condition 
-df_devices_count = df_word_count_device[df_word_count_device['sub_device'].str.lower().isin(devices)] 
+# Devices Used to Watch Netflix
 
-device_and_categories = {'TV': 'TV','iPad': 'Tablet', 'PC': 'PC', 'Chromecast': 'TV', 
-                        'MAC': 'PC', 'iPhone': 'Phone', 'Tablet': 'Tablet', 'Phone':'Phone', 'VR': 'VR'}
+##########################################################################################
 
-df_devices_count['Device'] = df_devices_count['sub_device'].map(device_and_categories)
-df_devices_count.reset_index(drop=True, inplace=True)
-df_devices_count = df_devices_count.drop(['sub_device'], axis = 1)
+with profiler.stage('device_aggregation') as record:
+    df_devices_count = load_devices(export_store)
+    df_devices_count = df_devices_count[df_devices_count['Profile_Name'].isin(user_radio_button_1)]
+    df_devices_count = df_devices_count.groupby(['Device'], as_index=False)['Count'].sum().sort_values(['Count'])
+    record.rows = len(df_devices_count)
 
-df_devices_count = df_devices_count.groupby(['Device']).sum(['Count']).reset_index().sort_values(['Count'])
+def devices_figure():
+    fig4 = px.bar(df_devices_count, x= 'Device',  y="Count",
+                 title="On which Device do we like to watch Netflix?",
+                 color='Count',
+                 color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"])
+    return fig4
 
-fig4 = px.bar(df_devices_count, x= 'Device',  y="Count",
-             title="On which Device do we like to watch Netflix?",
-             color='Count',
-             color_continuous_scale=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"])
-st.plotly_chart(fig4, use_container_width=True)
+with profiler.stage('render_devices'):
+    st.plotly_chart(plotly_spec(figure_cache, ('devices', export_id, selected_users), devices_figure),
+                    use_container_width=True)
 
 
 
@@ -252,28 +407,9 @@ st.plotly_chart(fig4, use_container_width=True)
 
 ## preparing the data for the heatmap
 
-#filtering for only messages sent by myself
-weekday_df = watched_df
-
-#transformting the date type to 'datetime'
-weekday_df['Date'] = pd.to_datetime(watched_df['Start_Time'])
-
-#selecting only the needed columns
-weekday_df = weekday_df[['Date', 'Profile_Name', 'Start_Time']]
-
-#creating the day of the week column 'Weekday'
-weekday_df['Weekday'] = weekday_df['Date'].dt.day_name()
-weekday_hour_df = weekday_df
-
-#creating the hour of the week column 'Hour'
-weekday_hour_df['Hour'] = weekday_hour_df['Date'].dt.hour
-
-#count the messages per day and hour
-heatmap_total_df = weekday_hour_df.groupby(['Weekday', 'Hour', 'Profile_Name']).size().reset_index(name='Counts')
-
-weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-heatmap_total_df['Weekday'] = pd.Categorical(heatmap_total_df['Weekday'], weekdays)  # set a fixed order
-heatmap_df = heatmap_total_df.pivot_table(values='Counts', index=['Hour', 'Profile_Name'], columns=['Weekday'])
+with profiler.stage('heatmap_aggregation') as record:
+    heatmap_df = load_heatmap(export_store)
+    record.rows = len(heatmap_df)
 
 ## Visualizing the heatmap
 
@@ -282,15 +418,21 @@ users2 = heatmap_df.index.get_level_values('Profile_Name').unique()
 user_radio_button_2 = st.radio("Netflix Account", users2)
 
 
-fig2, ax = plt.subplots(figsize=(15, 10))
-black_red = LinearSegmentedColormap.from_list('black_red', ['white', 'darkgrey', 'darkred', 'red'])
-sns.heatmap(heatmap_df[heatmap_df.index.get_level_values('Profile_Name').isin([user_radio_button_2])].droplevel(1, axis=0),
-            annot=True, fmt='g', cmap=black_red, ax=ax)
-ax.set_title("When does " + user_radio_button_2  + " like to watch Netflix?", fontsize=20)
-ax.set_xlabel('Weekday', fontsize=15)  
-ax.set_ylabel('Time', fontsize=15) 
-# ax.set_yticklabels(range(0,24), rotation=0)
-st.pyplot(fig2)
+def heatmap_figure():
+    fig2, ax = plt.subplots(figsize=(15, 10))
+    black_red = LinearSegmentedColormap.from_list('black_red', ['white', 'darkgrey', 'darkred', 'red'])
+    sns.heatmap(heatmap_df[heatmap_df.index.get_level_values('Profile_Name').isin([user_radio_button_2])].droplevel(1, axis=0),
+                annot=True, fmt='g', cmap=black_red, ax=ax)
+    ax.set_title("When does " + user_radio_button_2  + " like to watch Netflix?", fontsize=20)
+    ax.set_xlabel('Weekday', fontsize=15)  
+    ax.set_ylabel('Time', fontsize=15) 
+    # ax.set_yticklabels(range(0,24), rotation=0)
+    return fig2
+
+with profiler.stage('render_heatmap'):
+    # rendered to a PNG once per profile, the matplotlib figure is closed right away
+    st.image(matplotlib_png(figure_cache, ('heatmap', export_id, user_radio_button_2), heatmap_figure),
+             use_column_width=True)
 
 
 
@@ -298,131 +440,89 @@ st.pyplot(fig2)
 
 ##########################################################################################
 
-tmdb_api_key = st.secrets["tmdb_api_key"]
-
-@st.cache
-def json_of_url(url):
-    webURL = urllib.request.urlopen(url)
-    data = webURL.read()
-    encoding = webURL.info().get_content_charset('utf-8')
-    JSON_object = json.loads(data.decode(encoding))
-    return JSON_object
-@st.cache
-def get_genre_ids():
-    genres_JSON = json_of_url("https://api.themoviedb.org/3/genre/movie/list?api_key=" +  tmdb_api_key)
-    return genres_JSON
-
-genre_by_id = get_genre_ids()
-#list to dataframe
-df_genres = pd.DataFrame.from_dict(genre_by_id['genres'], orient='columns')
-df_genres.rename(columns = {'id':'genre_ids', 'name':'genre'}, inplace = True)
-genre_by_id = df_genres.set_index('genre_ids').to_dict()['genre']
-
-genre_by_id.update({10765: "Sci-Fi, Fantasy", 10763:"News", 10759: "Action, Adventure", 10764:"Reality",10768:'War, Politics', 10766:"Soap", 10762:"Kids",10767:"Talk"})
-genre_by_id[878] = "Sci-Fi"
-
-## Requesting Movies from TMDB
-@st.cache
-def get_movie_data(movie_title):
-    movies_JSONs = json_of_url(("https://api.themoviedb.org/3/search/movie?query={}&language=en-US&page=1&include_adult=false&api_key=" +  tmdb_api_key).format(urllib.parse.quote_plus(movie_title)))
-    return movies_JSONs
-
-movies_watched = list(watched_df[(watched_df["Film_Type"] == 'Movie') & (watched_df["percent_watched2"] > 85)]["Title"])
-# series_watched = list(watched_df[(watched_df["Film_Type"] == 'Series') & (watched_df["percent_watched2"] > 85)]["Show_Title"])
-
-deduplicated_movies_watched = list(set(movies_watched))
+tmdb_api_key = os.environ.get('TMDB_API_KEY') or st.secrets["tmdb_api_key"]
 
-nested_dict_movie_titles = {}
-for movie_title in deduplicated_movies_watched:
-    nested_dict_movie_titles[movie_title] = get_movie_data(movie_title)
+# one client per process, it keeps the HTTP connection pool and the on-disk response cache,
+# titles in the offline index (see netflix_analysis/tmdb_index.py) are never requested
+@st.experimental_singleton
+def get_tmdb_client():
+    return TMDBClient(tmdb_api_key, index=TMDBIndex.open_default())
 
-# print(dict_movie_titles.values['results'])
-valuesofdic = list(nested_dict_movie_titles.values())
-dict_movie_titles = []
-for value_of_dic in valuesofdic:
-    res = value_of_dic['results']
-    dict_movie_titles.extend(res)
+# the genre list hardly ever changes, it is requested once per process
+@st.experimental_singleton
+def load_genre_names():
+    return genre_names(get_tmdb_client().genres())
 
-#creating dataframe from dict of movies
-df_movie_database = pd.DataFrame.from_dict(dict_movie_titles, orient='columns')
-
-# removing duplicate movies
-df_movie_database['is_duplicated'] = df_movie_database.sort_values(['original_title','popularity' ], ascending=False).\
-                            duplicated(subset = ['original_title'], keep='first')
-df_movie_database = df_movie_database[df_movie_database['is_duplicated'] == False]
-
-#cleaning genre_ids column
-df_movie_database["genre_ids"] = df_movie_database["genre_ids"].astype("string")
-df_movie_database["genre_ids"] = df_movie_database["genre_ids"].str.replace('[', '')
-df_movie_database["genre_ids"] = df_movie_database["genre_ids"].str.replace(']', '')
-
-#adding genre to movie
-dic = {r"\b{}\b".format(k): v for k, v in genre_by_id.items()}
-df_movie_database["genre_ids"] = df_movie_database["genre_ids"].replace(dic, regex=True)
-df_movie_database2 = df_movie_database[['genre_ids', 'original_title', 'vote_average', 'vote_count', 'release_date']]
-df_movie_database2[df_movie_database2['vote_count'] > 5000].sort_values(by=['vote_average', 'vote_count'], ascending=False)
-
-df_movies = watched_df[watched_df['Film_Type'] == 'Movie'].merge(df_movie_database2,how='left',left_on=['Show_Title'],right_on=['original_title'])
+## Requesting Movies from TMDB
+# a lookup in which searches failed is only kept for TMDB_RETRY_SECONDS, then the failed titles are requested again
+TMDB_RETRY_SECONDS = 60
+
+def load_movie_database(store):
+    return store.get('movie_database', lambda: movie_database(load_watched(store), get_tmdb_client()),
+                     keep_if=lambda result: not result[1], retry_after=TMDB_RETRY_SECONDS)
+
+# genre counts per profile and the ratings of the watched movies by genre, and the failed searches
+def load_movie_genres(store):
+    def build():
+        df_movie_database, failures = load_movie_database(store)
+        return movie_genres(load_watched(store), df_movie_database, load_genre_names()), failures
+    return store.get('movie_genres', build, keep_if=lambda result: not result[1], retry_after=TMDB_RETRY_SECONDS)
+
+with profiler.stage('tmdb_lookup') as record:
+    (df_movies_genre_frequency2, df_movies_ratings), tmdb_failures = load_movie_genres(export_store)
+    record.rows = len(df_movies_ratings)
+if tmdb_failures:
+    st.warning('TMDB did not answer for {} of your movies, they are missing from the genre and rating charts '
+               'and are looked up again in a minute.'.format(tmdb_failures))
 
 # Pie Chart Movies
 ##########################################################################################
 
-df_movies_watched = df_movies[df_movies['percent_watched2'] >= 80].dropna(subset=['genre_ids'])
-
-dict_movie_user_genres = {}
-for user in users:
-    dict_movie_user_genres[user] = " ".join(review for review in df_movies_watched[df_movies_watched['Profile_Name'] == user].genre_ids)
-
-for user in users:
-    dict_movie_user_genres[user] = dict_movie_user_genres[user].replace(",","")
-
-# function to count words
-@st.cache
-def word_count(str):
-    counts = dict()
-    words = str.split()
+def genres_figure():
+    fig_pie_movie = px.pie(df_movies_genre_frequency2[df_movies_genre_frequency2['Profile_Name'].isin(user_radio_button_1)], 
+                 values='Count', 
+                 color='genre',
+                 color_discrete_sequence=["rgb(1,1,1)", "rgb(131,16,16)", "rgb(86,77,77)", "rgb(219,0,0)"],
+                 title = 'Which Movie Genres do I watch the most?',
+                 names='genre')
+    fig_pie_movie.update_traces(textposition='inside', textinfo='percent+label')
+    return fig_pie_movie
 
-    for word in words:
-        if word in counts:
-            counts[word] += 1
-        else:
-            counts[word] = 1
+with profiler.stage('render_genres'):
+    st.plotly_chart(plotly_spec(figure_cache, ('genres', export_id, selected_users), genres_figure,
+                                keep=not tmdb_failures), use_container_width=True)
 
-    return counts
 
+# Average Movie rating
+##########################################################################################
 
-movie_genres_by_user = {}
-for user in users:
-     movie_genres_by_user[user] = word_count(dict_movie_user_genres[user])
-
-df_movies_genre_frequency = pd.DataFrame.from_dict(movie_genres_by_user, orient='columns').reset_index().fillna(value=0)
 
-df_movies_genre_frequency2 = df_movies_genre_frequency.melt(id_vars=['index'], var_name='Profile_Name', value_name='Count')
+def ratings_figure():
+    fig_rating = px.violin(df_movies_ratings[df_movies_ratings['genre'] == 'Comedy'],
+                        x= 'Profile_Name',  y="Movie_Rating",
+                        color="Profile_Name",
+                        box=True,
+                        title= 'How are the Movies I watched Rated?',
+                        color_discrete_sequence=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"])
+    return fig_rating
 
-fig_pie_movie = px.pie(df_movies_genre_frequency2[df_movies_genre_frequency2['Profile_Name'].isin(user_radio_button_1)], 
-             values='Count', 
-             color='index',
-             color_discrete_sequence=["rgb(1,1,1)", "rgb(131,16,16)", "rgb(86,77,77)", "rgb(219,0,0)"],
-             title = 'Which Movie Genres do I watch the most?',
-             names='index')
-fig_pie_movie.update_traces(textposition='inside', textinfo='percent+label')
-st.plotly_chart(fig_pie_movie, use_container_width=True)
+with profiler.stage('render_ratings'):
+    st.plotly_chart(plotly_spec(figure_cache, ('ratings', export_id), ratings_figure, keep=not tmdb_failures),
+                    use_container_width=True)
 
 
-# Average Movie rating
+# Debug panel
 ##########################################################################################
 
-
-df_movies_ratings = df_movies_watched[['Profile_Name', 'genre_ids', 'vote_average']]
-df_movies_ratings= df_movies_ratings.replace(0,np.NaN)
-df_movies_ratings.rename(columns = {'genre_ids':'genre', 'vote_average':'Movie_Rating'}, inplace = True)
-
-fig_rating = px.violin(df_movies_ratings[df_movies_ratings['genre'].str.contains('Comedy')],
-                    x= 'Profile_Name',  y="Movie_Rating",
-                    color="Profile_Name",
-                    box=True,
-                    title= 'How are the Movies I watched Rated?',
-                    color_discrete_sequence=["rgb(1,1,1)", "rgb(86,77,77)", "rgb(131,16,16)", "rgb(219,0,0)"])
-
-st.plotly_chart(fig_rating, use_container_width=True)
+# only with profiling switched on: NETFLIX_ANALYSIS_PROFILE=1 or [netflix_analysis] profile = true in .streamlit/config.toml
+if profiler.enabled:
+    with st.sidebar.expander('Debug: stage timings'):
+        stage_df = profiler.frame()
+        stage_df['peak_MB'] = stage_df['peak_bytes'] / 2**20
+        st.dataframe(stage_df.drop(columns=['peak_bytes']))
+        tmdb_client = get_tmdb_client()
+        st.markdown('TMDB lookups since start: {} from the offline index, {} cached, {} requested, {} failed'.format(
+            tmdb_client.index_hits, tmdb_client.hits, tmdb_client.misses, tmdb_client.failures))
+        st.markdown('Figure cache: {} figures, {:.1f} MB, {} hits, {} misses'.format(
+            len(figure_cache), figure_cache.bytes / 2**20, figure_cache.hits, figure_cache.misses))
 
@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+from netflix_analysis.analysis import (analyze, analyze_export, analyze_export_chunked, parse_export, read_frames,
+                                       read_iso_codes)
+from netflix_analysis.archive import ExportError
+from netflix_analysis.snapshot import read_snapshot, snapshot_bytes
+
+
+@pytest.fixture(scope='module')
+def expected():
+    return analyze_export('Files', iso_df=read_iso_codes())
+
+
+def assert_results_equal(expected, actual):
+    assert actual.metrics == expected.metrics
+    assert actual.profiles == expected.profiles
+    for name, frame in expected.frames().items():
+        pd.testing.assert_frame_equal(actual.frames()[name], frame, obj=name)
+
+
+def test_analyze_read_frames(expected):
+    assert_results_equal(expected, analyze(*read_frames('Files'), iso_df=read_iso_codes()))
+
+
+def test_analyze_plain_read_csv(expected):
+    frames = [pd.read_csv('Files/' + name) for name in
+              ['ViewingActivity.csv', 'BillingHistory.csv', 'IpAddressesStreaming.csv']]
+    assert_results_equal(expected, analyze(*frames, iso_df=read_iso_codes()))
+
+
+def export_without(columns):
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for folder, name in [('CONTENT_INTERACTION', 'ViewingActivity.csv'),
+                             ('PAYMENT_AND_BILLING', 'BillingHistory.csv'), ('IP_ADDRESSES', 'IpAddressesStreaming.csv')]:
+            df = pd.read_csv('Files/' + name)
+            zip_file.writestr(folder + '/' + name, df.drop(columns=[c for c in columns if c in df]).to_csv(index=False))
+    return f.getvalue()
+
+
+def test_optional_columns_missing(expected):
+    snapshot = parse_export(export_without(['Attributes', 'Latest Bookmark', 'Localized Device Description']))
+    assert snapshot.watched_df['Attributes'].isna().all()
+    assert snapshot.streaming_locations_df['Localized_Device_Description'].isna().all()
+    assert read_snapshot(snapshot_bytes(snapshot)).watched_df['Latest_Bookmark'].isna().all()
+    assert_results_equal(expected, analyze_export(export_without(['Attributes']), iso_df=read_iso_codes()))
+
+
+def test_required_columns_missing():
+    with pytest.raises(ExportError, match='ViewingActivity.csv has no column Start Time, Device Type'):
+        parse_export(export_without(['Start Time', 'Device Type', 'Attributes']))
+    with pytest.raises(ExportError, match='IpAddressesStreaming.csv has no column Ts'):
+        parse_export(export_without(['Ts']))
+    frames = [pd.read_csv('Files/' + name) for name in
+              ['ViewingActivity.csv', 'BillingHistory.csv', 'IpAddressesStreaming.csv']]
+    with pytest.raises(ExportError, match='BillingHistory.csv has no column Currency'):
+        analyze(frames[0], frames[1].drop(columns=['Currency']), frames[2])
+
+
+def normalized(df):
+    df = df.astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('source', ['Files', export_without([])], ids=['directory', 'zip'])
+def test_analyze_export_chunked(expected, source):
+    actual = analyze_export_chunked(source, iso_df=read_iso_codes(), chunksize=997)
+    assert actual.metrics == expected.metrics
+    assert actual.profiles == sorted(expected.profiles)
+    assert actual.genres is None and actual.ratings is None
+    for name, frame in expected.frames().items():
+        pd.testing.assert_frame_equal(normalized(actual.frames()[name]), normalized(frame), obj=name)
@@ -0,0 +1,67 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from netflix_analysis.archive import (BILLING_HISTORY, IP_ADDRESSES_STREAMING, VIEWING_ACTIVITY, ExportArchive,
+                                      ExportError, find_member)
+
+
+def make_zip(members):
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+    return f.getvalue()
+
+
+def csv_bytes(size):
+    # hex digits barely compress, so only the size limits apply
+    return b'Value\n' + b'\n'.join(os.urandom(16).hex().encode() for _ in range(size // 33))
+
+
+def test_member_size_limit():
+    archive = ExportArchive(make_zip({'CONTENT_INTERACTION/' + VIEWING_ACTIVITY: csv_bytes(2 * 2**20)}),
+                            max_member_size=2**20)
+    with pytest.raises(ExportError, match='ViewingActivity.csv is larger than 1 MB'):
+        archive.read_csv(VIEWING_ACTIVITY)
+
+
+def test_total_size_limit():
+    archive = ExportArchive(make_zip({VIEWING_ACTIVITY: csv_bytes(3 * 2**19), BILLING_HISTORY: csv_bytes(3 * 2**19)}),
+                            max_member_size=2 * 2**20, max_total_size=2 * 2**20)
+    assert len(archive.read_csv(VIEWING_ACTIVITY)) > 0
+    with pytest.raises(ExportError, match='The export is larger than 2 MB in total, BillingHistory.csv does not fit'):
+        archive.read_csv(BILLING_HISTORY)
+
+
+def test_total_size_used_up():
+    # the budget left is below 1 MB, which used to be reported as a limit of 0 MB for the member
+    archive = ExportArchive(make_zip({VIEWING_ACTIVITY: csv_bytes(2**20 - 2**10), BILLING_HISTORY: csv_bytes(2**12)}),
+                            max_member_size=2**20, max_total_size=2**20)
+    archive.read_csv(VIEWING_ACTIVITY)
+    with pytest.raises(ExportError, match='The export is larger than 1 MB in total'):
+        archive.read_csv(BILLING_HISTORY)
+
+
+def test_compression_ratio_limit():
+    archive = ExportArchive(make_zip({IP_ADDRESSES_STREAMING: b'Value\n' + b'0\n' * 2**20}))
+    with pytest.raises(ExportError, match='IpAddressesStreaming.csv is compressed suspiciously well'):
+        archive.read_csv(IP_ADDRESSES_STREAMING)
+
+
+def test_find_member_by_path_suffix():
+    zip_file = zipfile.ZipFile(io.BytesIO(make_zip({
+        'netflix-report/CONTENT_INTERACTION/old/ViewingActivity.csv': b'',
+        'netflix-report/CONTENT_INTERACTION/viewingactivity.CSV': b'',
+        'netflix-report/CONTENT_INTERACTION/ViewingActivity.csv.bak': b'',
+    })))
+    assert find_member(zip_file, VIEWING_ACTIVITY).filename == 'netflix-report/CONTENT_INTERACTION/viewingactivity.CSV'
+    with pytest.raises(ExportError, match='BillingHistory.csv was not found in the uploaded zip'):
+        find_member(zip_file, BILLING_HISTORY)
+
+
+def test_not_a_zip():
+    with pytest.raises(ExportError, match='not a valid zip file'):
+        ExportArchive(b'Profile Name,Start Time\n')
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from netflix_analysis.analysis import country_sessions, read_iso_codes
+from netflix_analysis.chunked import summarize_viewing_activity, summarize_watched
+from netflix_analysis.devices import device_family_counts
+from netflix_analysis.ingest import load_watched
+from netflix_analysis.rollup import watch_time_by_profile, weekday_hour_counts
+
+
+@pytest.fixture(scope='module')
+def history(tmp_path_factory):
+    # part of the sample twice over, so sessions repeat across chunks
+    with open('Files/ViewingActivity.csv', 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    path = tmp_path_factory.mktemp('chunked') / 'ViewingActivity.csv'
+    rows = b'\n'.join(body.split(b'\n')[:1500]) + b'\n'
+    path.write_bytes(header + b'\n' + rows * 2)
+    return str(path)
+
+
+def normalized(df):
+    df = df.astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('chunksize', [97, 1000])
+def test_chunked_equals_in_memory(history, chunksize):
+    expected = summarize_watched(load_watched(history))
+    actual = summarize_viewing_activity(history, chunksize)
+    assert actual.rows == expected.rows
+    assert sorted(actual.titles) == sorted(expected.titles)
+    pd.testing.assert_series_equal(actual.title_counts.sort_index(), expected.title_counts.sort_index(),
+                                   check_dtype=False)
+    iso_df = read_iso_codes()
+    for chart in (watch_time_by_profile, lambda cube: country_sessions(cube, iso_df), device_family_counts,
+                  weekday_hour_counts):
+        pd.testing.assert_frame_equal(normalized(chart(actual.cube)), normalized(chart(expected.cube)))
+
+
+def test_no_watched_titles(tmp_path):
+    path = tmp_path / 'ViewingActivity.csv'
+    with open('Files/ViewingActivity.csv', 'rb') as f:
+        path.write_bytes(f.readline())
+    with pytest.raises(ValueError):
+        summarize_viewing_activity(str(path))
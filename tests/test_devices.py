@@ -0,0 +1,27 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from netflix_analysis.devices import FAMILIES, classify_devices, device_family
+
+FIXTURES = pd.read_csv(os.path.join(os.path.dirname(__file__), 'fixtures', 'device_fixtures.csv'))
+
+
+@pytest.mark.parametrize('device, family', list(zip(FIXTURES['device'], FIXTURES['family'])))
+def test_fixture_family(device, family):
+    assert device_family(device) == family
+
+
+def test_fixture_families_known():
+    assert set(FIXTURES['family']) <= set(FAMILIES)
+
+
+def test_classify_devices():
+    devices = pd.Series(['Apple iPhone 8 (CDMA)', np.nan, 'Sony PlayStation 4', 'Apple iPhone 8 (CDMA)'],
+                        index=[3, 5, 7, 9])
+    families = classify_devices(devices)
+    assert list(families.index) == [3, 5, 7, 9]
+    assert list(families.cat.categories) == FAMILIES
+    assert families.astype(object).where(families.notna(), None).tolist() == ['Phone', None, 'Console', 'Phone']
@@ -0,0 +1,124 @@
+import gc
+import itertools
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import plotly.express as px
+import plotly.graph_objects as go
+import pytest
+
+from netflix_analysis.analysis import favorites, heatmap_table, parse_export
+from netflix_analysis.figures import FigureCache, matplotlib_png, plotly_spec
+from netflix_analysis.rollup import RollupCube, weekday_hour_counts
+
+
+def test_budget_and_lru():
+    cache = FigureCache(max_bytes=100)
+    for key in range(5):
+        cache.get_or_create(key, lambda: b'x' * 30)
+        assert cache.bytes <= 100
+    assert list(cache._entries) == [2, 3, 4]
+    cache.get_or_create(2, lambda: pytest.fail('cached'))  # 2 is now the most recently used
+    cache.get_or_create(5, lambda: b'x' * 30)
+    assert list(cache._entries) == [4, 2, 5]
+    assert (cache.hits, cache.misses) == (1, 6)
+
+
+def test_too_big_not_kept():
+    cache = FigureCache(max_bytes=10)
+    assert cache.get_or_create('big', lambda: 'x' * 11) == 'x' * 11
+    assert len(cache) == 0 and cache.bytes == 0
+
+
+def test_built_again_unless_kept():
+    cache = FigureCache()
+    assert plotly_spec(cache, 'partial', lambda: px.bar(x=[1], y=[1]), keep=False)['data']
+    assert len(cache) == 0 and cache.misses == 1
+    plotly_spec(cache, 'partial', lambda: px.bar(x=[1], y=[2]))
+    assert len(cache) == 1
+
+
+def test_plotly_specs_within_budget():
+    budget = 64 * 2**10
+    cache = FigureCache(max_bytes=budget)
+    for state in range(30):
+        spec = plotly_spec(cache, ('bar', state), lambda: px.bar(x=list(range(50)), y=[state] * 50,
+                                                                 title=str(state)))
+        assert spec['layout']['title']['text'] == str(state)
+        assert cache.bytes <= budget
+    assert 0 < len(cache) < 30
+
+
+def test_figures_closed():
+    cache = FigureCache()
+
+    def build():
+        fig, ax = plt.subplots()
+        ax.plot([1, 2, 3])
+        return fig
+
+    png = matplotlib_png(cache, 'line', build, dpi=20)
+    assert png.startswith(b'\x89PNG')
+    assert matplotlib_png(cache, 'line', lambda: pytest.fail('cached'), dpi=20) == png
+    assert not plt.get_fignums()
+
+
+def test_figure_closed_when_rendering_fails():
+    def build():
+        fig, ax = plt.subplots()
+        ax.set_title('$\\notacommand$')  # mathtext fails only when drawn
+        return fig
+
+    with pytest.raises(ValueError):
+        matplotlib_png(FigureCache(), 'broken', build)
+    assert not plt.get_fignums()
+
+
+def test_memory_flat_across_reruns():
+    # charts of the sample data, every rerun with another key and profile selection, so every figure is built
+    # and the cache has to evict. Once the cache is full the traced memory stays flat. The data of every
+    # selection is prepared first, pandas keeps track of the views taken from a frame while it lives.
+    watched_df = parse_export('Files').watched_df
+    favorite_movies = favorites(watched_df, 'Movie')
+    heatmap = heatmap_table(weekday_hour_counts(RollupCube.from_frame(watched_df)))
+    profiles = sorted(favorite_movies['Profile_Name'].astype(str).unique())
+    bars = []
+    for size in range(1, len(profiles) + 1):
+        for selection in itertools.combinations(profiles, size):
+            df = favorite_movies[favorite_movies['Profile_Name'].isin(selection)].head(16)
+            bars.append((selection, df['Title'].astype(str).tolist(), df['Count'].tolist()))
+    heatmaps = [(profile, heatmap.xs(profile, level='Profile_Name').to_numpy(dtype=float)) for profile in profiles]
+    budget = 2**17
+    cache = FigureCache(max_bytes=budget)
+
+    def rerun(run):
+        selection, titles, counts = bars[run % len(bars)]
+        plotly_spec(cache, ('favorites', run, selection), lambda: go.Figure(
+            go.Bar(x=titles[:10 + run % 7], y=counts[:10 + run % 7]), layout={'title': ', '.join(selection)}))
+        if run % 10 == 0:
+            # drawing is slow while memory is traced, so the heatmap only every tenth rerun
+            profile, values = heatmaps[run % len(heatmaps)]
+
+            def heatmap_figure():
+                fig, ax = plt.subplots(figsize=(6, 4))
+                fig.colorbar(ax.imshow(values, aspect='auto'))
+                ax.set_title(profile)
+                return fig
+            matplotlib_png(cache, ('heatmap', run, profile), heatmap_figure, dpi=40)
+
+    tracemalloc.start()
+    try:
+        for run in range(30):
+            rerun(run)
+        assert cache.bytes > budget - 2**14
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        for run in range(30, 130):
+            rerun(run)
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert cache.misses == 130 + 13 and cache.bytes <= budget
+    assert growth < 2**16, '{:.0f} kB more after 100 reruns'.format(growth / 2**10)
+    assert plt.get_fignums() == []
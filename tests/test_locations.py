@@ -0,0 +1,115 @@
+import ipaddress
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from netflix_analysis.analysis import country_sessions, read_iso_codes
+from netflix_analysis.ingest import load_watched
+from netflix_analysis.locations import IPIndex, IsoLookup, build_ip_index, login_locations, read_ranges
+from netflix_analysis.rollup import RollupCube
+
+
+def network(cidr, country, region=''):
+    cidr = ipaddress.ip_network(cidr)
+    return cidr.network_address, cidr.broadcast_address, country, region
+
+
+def index_of(tmp_path, ranges):
+    written, conflicts = build_ip_index(str(tmp_path / 'index'), ranges)
+    return IPIndex(str(tmp_path / 'index')), conflicts
+
+
+def test_most_specific_wins(tmp_path):
+    index, conflicts = index_of(tmp_path, [
+        network('10.1.2.0/24', 'MX'), network('10.0.0.0/8', 'US'), network('10.1.0.0/16', 'CA'),
+        network('2a02:1406::/32', 'DK'), network('2a02:1406:10::/48', 'SE', 'Skåne')])
+    assert conflicts == []
+    assert index.lookup('2a02:1406:10::5') == ('SE', 'Skåne')
+    assert index.lookup('2a02:1406:11::5') == ('DK', '')
+    assert [index.lookup(a) for a in ['10.0.0.1', '10.1.0.1', '10.1.2.3', '10.1.3.1', '::ffff:10.1.2.3']] == [
+        ('US', ''), ('CA', ''), ('MX', ''), ('CA', ''), ('MX', '')]
+    assert index.lookup('11.0.0.0') is None and index.lookup('not an address') is None
+
+
+def test_ipv6_beyond_64_bits(tmp_path):
+    index, conflicts = index_of(tmp_path, [network('2001:db8::/80', 'DK'), network('2001:db8:0:0:1::/80', 'SE')])
+    assert conflicts == []
+    assert index.lookup('2001:db8::1') == ('DK', '')
+    assert index.lookup('2001:db8::1:0:0:1') == ('SE', '')
+    assert index.lookup('2001:db8::2:0:0:1') is None
+
+
+def test_conflicts_reported(tmp_path):
+    mx = network('10.1.2.0/24', 'MX')
+    partial = (ipaddress.ip_address('10.1.2.200'), ipaddress.ip_address('10.1.3.5'), 'FR', '')
+    same_span = network('10.1.2.0/24', 'DE')
+    index, conflicts = index_of(tmp_path, [mx, partial, same_span, network('10.1.2.0/24', 'MX')])
+    assert conflicts == [(mx, same_span), (mx, partial)]
+    assert index.lookup('10.1.2.250') == ('MX', '') and index.lookup('10.1.3.1') is None
+
+
+def test_matches_brute_force(tmp_path):
+    # wide networks with narrower ones inside, some of them the same network with another country
+    rng = random.Random(0)
+    ranges = []
+    for _ in range(300):
+        cidr = ipaddress.ip_network((rng.getrandbits(32) & 0x0fffffff, rng.randint(4, 30)), strict=False)
+        ranges.append(network(str(cidr), rng.choice(['DK', 'SE', 'NL']), str(cidr.prefixlen)))
+    ranges += [network(str(ipaddress.ip_network(r[0]).supernet(new_prefix=int(r[3]))), 'US')
+               for r in ranges[:20] if int(r[3]) >= 5]
+    index, conflicts = index_of(tmp_path, ranges)
+    skipped = [skip for _, skip in conflicts]
+    assert all(kept[:2] == skip[:2] for kept, skip in conflicts)  # CIDR networks only conflict as the same network
+
+    def most_specific(address):
+        inside = [r for r in ranges if r not in skipped and r[0] <= address <= r[1]]
+        return min(inside, key=lambda r: int(r[1]) - int(r[0]))[2:] if inside else None
+
+    samples = [ipaddress.IPv4Address(rng.getrandbits(32) & 0x0fffffff) for _ in range(500)]
+    samples += [r[0] for r in ranges] + [r[1] for r in ranges]
+    assert [index.lookup(str(a)) for a in samples] == [most_specific(a) for a in samples]
+
+
+def test_read_ranges(tmp_path):
+    path = tmp_path / 'ranges.csv'
+    path.write_text('network,country,region\n10.0.0.0/8, us ,Texas\n2a02:1406::/32,DK,\n')
+    assert list(read_ranges(str(path))) == [network('10.0.0.0/8', 'US', 'Texas'), network('2a02:1406::/32', 'DK')]
+    path.write_text('start,end,country\n10.0.0.1,10.0.0.9,SE\n')
+    assert list(read_ranges(str(path))) == [
+        (ipaddress.ip_address('10.0.0.1'), ipaddress.ip_address('10.0.0.9'), 'SE', '')]
+    path.write_text('address,country\n10.0.0.1,SE\n')
+    with pytest.raises(ValueError):
+        list(read_ranges(str(path)))
+
+
+def test_login_locations(tmp_path):
+    index, _ = index_of(tmp_path, [network('10.0.0.0/8', 'SE', 'Skåne')])
+    df = pd.DataFrame({'Esn': ['a', 'b'], 'Country': ['DK (Denmark)', np.nan], 'Device_Description': ['iPhone', 'TV'],
+                       'Ip': ['10.0.0.1', '192.0.2.1'], 'Region_Code_Display_Name': ['Capital', np.nan],
+                       'Ts': ['2021-01-02 10:00:00', '2021-01-01 10:00:00']})
+    netflix = login_locations(df)
+    assert netflix['Country'].astype(object).where(netflix['Country'].notna(), None).tolist() == [None, 'DK']
+    located = login_locations(df, index)[['Esn', 'Country', 'Region']].astype(object)
+    assert located.where(located.notna(), None).values.tolist() == [['b', None, None], ['a', 'SE', 'Skåne']]
+
+
+def test_iso_lookup():
+    iso = IsoLookup(['DK', 'NA', 'SE'], ['DNK', 'NAM', 'SWE'], ['Denmark', 'Namibia', 'Sweden'])
+    assert iso.rows(['SE', 'dk', 'NA', np.nan, 'XX', 'SE (Sweden)', '']).tolist() == [2, 0, 1, -1, -1, 2, -1]
+
+
+def test_country_sessions_match_merge():
+    # the merge the app ran before the integer lookup
+    watched_df = load_watched('Files/ViewingActivity.csv')
+    cube = RollupCube.from_frame(watched_df)
+    iso_df = read_iso_codes()
+    sessions = cube.total(['Profile_Name', 'Country'], 'sessions').rename('Sessions').reset_index()
+    sessions['iso_2'] = sessions['Country'].astype(str).str[0:2]
+    names = iso_df[['iso_2', 'iso_3', 'Country']].rename(columns={'Country': 'Country_Name'})
+    sessions = sessions.drop(columns=['Country']).merge(names, how='inner', on='iso_2')
+    expected = sessions.groupby(['Profile_Name', 'iso_2', 'iso_3', 'Country_Name'], as_index=False)['Sessions'].sum()
+    actual = country_sessions(cube, IsoLookup.from_frame(iso_df))
+    pd.testing.assert_frame_equal(actual.astype({'Profile_Name': str}),
+                                  expected.astype({'Profile_Name': str, 'Sessions': np.int64}), check_dtype=False)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from netflix_analysis.devices import classify_devices, device_family_counts
+from netflix_analysis.ingest import load_watched
+from netflix_analysis.rollup import RollupCube, watch_time_by_profile, weekday_hour_counts
+
+
+@pytest.fixture(scope='module')
+def watched_df():
+    return load_watched('Files/ViewingActivity.csv')
+
+
+@pytest.fixture(scope='module')
+def cube(watched_df):
+    return RollupCube.from_frame(watched_df)
+
+
+def selections(watched_df):
+    # every single profile and all of them together
+    profiles = [str(profile) for profile in watched_df['Profile_Name'].unique()]
+    return [[profile] for profile in profiles] + [profiles]
+
+
+def as_dict(series):
+    return {tuple(map(str, key)) if isinstance(key, tuple) else str(key): value for key, value in series.items()}
+
+
+def test_watch_time(watched_df, cube):
+    expected = watched_df.groupby('Profile_Name', observed=True)['watched_hours'].sum()
+    actual = watch_time_by_profile(cube).set_index('Profile_Name')['watched_hours']
+    assert np.allclose(actual[expected.index.astype(str)].to_numpy(), expected.to_numpy(), rtol=1e-12)
+    assert actual.is_monotonic_increasing
+
+
+def test_sessions_per_country(watched_df, cube):
+    for profiles in selections(watched_df):
+        selected = watched_df[watched_df['Profile_Name'].isin(profiles)]
+        expected = selected.groupby('Country', observed=True)['Start_Time'].nunique()
+        assert as_dict(cube.select(Profile_Name=profiles).total('Country', 'sessions')) == as_dict(expected), profiles
+
+
+def test_views_per_device(watched_df, cube):
+    for profiles in selections(watched_df):
+        selected = watched_df[watched_df['Profile_Name'].isin(profiles)]
+        expected = selected['Device_Type'].value_counts()
+        assert as_dict(cube.select(Profile_Name=profiles).total('Device_Type')) == as_dict(expected[expected > 0])
+
+
+def test_device_families(watched_df, cube):
+    for profiles in selections(watched_df):
+        selected = watched_df[watched_df['Profile_Name'].isin(profiles)]
+        expected = selected.assign(Device=classify_devices(selected['Device_Type'])).groupby(
+            ['Profile_Name', 'Device'], observed=True).size()
+        actual = device_family_counts(cube.select(Profile_Name=profiles)).set_index(['Profile_Name', 'Device'])
+        assert as_dict(actual['Count']) == as_dict(expected), profiles
+
+
+def test_heatmap(watched_df, cube):
+    key = ['Weekday', 'Hour', 'Profile_Name']
+    expected = watched_df.groupby(key, observed=True).size()
+    assert as_dict(weekday_hour_counts(cube).set_index(key)['Counts']) == as_dict(expected)
+
+
+def test_missing_labels_left_out():
+    df = pd.DataFrame({'Profile_Name': ['a', 'a', 'b'], 'Weekday': ['Monday'] * 3, 'Hour': np.int8([1, 2, 3]),
+                       'Device_Type': ['TV', None, 'TV'], 'Country': ['DK', 'DK', None], 'Film_Type': ['Movie'] * 3,
+                       'Start_Time': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03']),
+                       'watched_minutes': [10, 20, 30]})
+    cube = RollupCube.from_frame(df)
+    assert as_dict(cube.total('Device_Type')) == {'TV': 2}
+    assert as_dict(cube.total('Country', 'watched_minutes')) == {'DK': 30}
+    assert as_dict(cube.select(Profile_Name=['b']).total('Profile_Name', 'sessions')) == {'b': 1}
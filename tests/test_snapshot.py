@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from netflix_analysis import snapshot as snapshot_module
+from netflix_analysis.analysis import parse_export
+from netflix_analysis.archive import ExportError
+from netflix_analysis.snapshot import (TABLES, Snapshot, cached_snapshot, read_snapshot, save_snapshot,
+                                       snapshot_bytes, snapshot_path, write_snapshot)
+
+
+@pytest.fixture(scope='module')
+def parsed():
+    return parse_export('Files')
+
+
+def assert_snapshots_equal(expected, actual):
+    for field in TABLES:
+        # newer pandas read Arrow strings back as its string dtype rather than object
+        pd.testing.assert_frame_equal(getattr(expected, field), getattr(actual, field).astype(
+            getattr(expected, field).dtypes.to_dict()), obj=field)
+
+
+@pytest.mark.parametrize('compression', [None, 'zstd'])
+def test_round_trip(parsed, compression):
+    assert_snapshots_equal(parsed, read_snapshot(snapshot_bytes(parsed, compression)))
+
+
+def test_memory_mapped(parsed, tmp_path):
+    path = str(tmp_path / 'export.zip')
+    write_snapshot(parsed, path)
+    assert_snapshots_equal(parsed, read_snapshot(path))
+    assert read_snapshot(path).export_id == parsed.export_id
+
+
+def test_parse_export_caches(tmp_path):
+    parsed = parse_export('Files', 'sample', str(tmp_path))
+    assert (tmp_path / 'sample.zip').exists()
+    assert_snapshots_equal(parsed, parse_export('Files', 'sample', str(tmp_path)))
+
+
+@pytest.mark.parametrize('limit', ['MAX_MEMBER_SIZE', 'MAX_TOTAL_SIZE'])
+def test_size_limits_before_decompressing(parsed, monkeypatch, limit):
+    download = snapshot_bytes(parsed)
+    watched_bytes = parsed.watched_df.memory_usage().sum()
+    monkeypatch.setattr(snapshot_module, limit, int(watched_bytes // 10))
+    with pytest.raises(ExportError, match='more than'):
+        read_snapshot(download)
+
+
+def test_zstd_bomb(parsed, monkeypatch):
+    # 160 MB of zeros (the amounts and the index) that compress to a few kB, next to the sample history
+    billing = pd.DataFrame({'Pmt Status': None, 'Final Invoice Result': None, 'Gross Sale Amt': 0.0, 'Currency': None},
+                           index=np.zeros(10_000_000, dtype=np.int64))
+    bomb = snapshot_bytes(Snapshot('bomb', parsed.watched_df, billing, parsed.streaming_locations_df))
+    assert len(bomb) < 2**21
+    monkeypatch.setattr(snapshot_module, 'MAX_MEMBER_SIZE', 2**20 * 64)
+    with pytest.raises(ExportError, match='df_billing takes more than 64 MB'):
+        read_snapshot(bomb)
+
+
+def test_dictionary_bomb(parsed, monkeypatch):
+    # one Title category of 32 MB that compresses to a few kB: only the dictionary is large, not the batch
+    watched_df = parsed.watched_df.copy()
+    watched_df['Title'] = pd.Categorical.from_codes(np.zeros(len(watched_df), dtype=np.int8), ['x' * 2**25])
+    bomb = snapshot_bytes(Snapshot('bomb', watched_df, parsed.df_billing, parsed.streaming_locations_df))
+    assert len(bomb) < 2**21
+    monkeypatch.setattr(snapshot_module, 'MAX_MEMBER_SIZE', 2**20 * 16)
+    with pytest.raises(ExportError, match='watched_df takes more than 16 MB'):
+        read_snapshot(bomb)
+
+
+def test_wrong_schema(parsed):
+    renamed = Snapshot(parsed.export_id, parsed.watched_df.rename(columns={'Title': 'Name'}), parsed.df_billing,
+                       parsed.streaming_locations_df)
+    with pytest.raises(ExportError, match='columns'):
+        read_snapshot(snapshot_bytes(renamed))
+
+
+def test_wrong_dtype(parsed):
+    billing = parsed.df_billing.astype({'Gross Sale Amt': str})
+    with pytest.raises(ExportError, match='Gross Sale Amt'):
+        read_snapshot(snapshot_bytes(Snapshot(parsed.export_id, parsed.watched_df, billing,
+                                              parsed.streaming_locations_df)))
+
+
+def test_damaged(parsed):
+    download = bytearray(snapshot_bytes(parsed, None))
+    start = download.index(b'ARROW1') + 64
+    download[start:start + 64] = b'\xff' * 64
+    with pytest.raises(ExportError):
+        read_snapshot(bytes(download))
+
+
+def test_other_parser_version(parsed, monkeypatch, tmp_path):
+    path = str(tmp_path / 'export.zip')
+    write_snapshot(parsed, path)
+    monkeypatch.setattr(snapshot_module, 'PARSER_VERSION', snapshot_module.PARSER_VERSION + 1)
+    with pytest.raises(ExportError, match='another version'):
+        read_snapshot(path)
+    assert cached_snapshot('export', str(tmp_path)) is None
+
+
+def test_eviction(parsed, tmp_path):
+    directory = str(tmp_path)
+    for number, export_id in enumerate(['a', 'b', 'c']):
+        save_snapshot(Snapshot(export_id, parsed.watched_df, parsed.df_billing, parsed.streaming_locations_df),
+                      directory)
+        os.utime(snapshot_path(export_id, directory), (number, number))
+    size = os.path.getsize(snapshot_path('a', directory))
+    cached_snapshot('a', directory)  # now the most recently used
+    save_snapshot(Snapshot('d', parsed.watched_df, parsed.df_billing, parsed.streaming_locations_df), directory,
+                  max_mb=2.5 * size / 2**20)
+    assert sorted(os.listdir(directory)) == ['a.zip', 'd.zip']
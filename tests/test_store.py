@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from netflix_analysis.store import ExportStore, StoreRegistry
+
+
+def test_stage_built_once():
+    store = ExportStore('export', b'zip')
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return len(calls)
+
+    threads = [threading.Thread(target=store.get, args=('stage', build)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1] and store.get('stage', build) == 1 and 'stage' in store
+
+
+def test_slow_stage_does_not_block_others():
+    store = ExportStore('export', b'zip')
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    thread = threading.Thread(target=store.get, args=('tmdb', slow))
+    thread.start()
+    started.wait(5)
+    # a stage that depends on another one takes both locks
+    assert store.get('rollup', lambda: store.get('export', lambda: 'export') + ' rollup') == 'export rollup'
+    assert 'tmdb' not in store
+    release.set()
+    thread.join()
+    assert store.get('tmdb', lambda: 'again') == 'slow'
+
+
+def test_registry_least_recently_used():
+    registry = StoreRegistry(max_entries=2, ttl=60)
+    first = registry.get_or_create('a', lambda: ExportStore('a', b'a'))
+    registry.get_or_create('b', lambda: ExportStore('b', b'b'))
+    assert registry.get_or_create('a', lambda: ExportStore('a', b'new')) is first
+    registry.get_or_create('c', lambda: ExportStore('c', b'c'))
+    assert 'b' not in registry and 'a' in registry and len(registry) == 2
+
+
+def test_registry_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    registry = StoreRegistry(max_entries=10, ttl=60)
+    first = registry.get_or_create('a', lambda: ExportStore('a', b'a'))
+    now[0] += 30
+    registry.get_or_create('b', lambda: ExportStore('b', b'b'))
+    now[0] += 45
+    # 'a' was last used 75 s ago, 'b' 45 s ago
+    registry.get_or_create('c', lambda: ExportStore('c', b'c'))
+    assert 'a' not in registry and 'b' in registry
+    assert registry.get_or_create('a', lambda: ExportStore('a', b'a')) is not first
+
+
+def test_incomplete_built_again_after_retry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    store = ExportStore('export', b'zip')
+    results = iter([('partial', 1), ('complete', 0)])
+    keep_if = lambda result: not result[1]
+    assert store.get('tmdb', lambda: next(results), keep_if, retry_after=60) == ('partial', 1)
+    now[0] += 30
+    assert store.get('tmdb', lambda: pytest.fail('retried too early'), keep_if, retry_after=60) == ('partial', 1)
+    now[0] += 31
+    assert store.get('tmdb', lambda: next(results), keep_if, retry_after=60) == ('complete', 0)
+    now[0] += 3600
+    assert store.get('tmdb', lambda: pytest.fail('kept'), keep_if, retry_after=60) == ('complete', 0)
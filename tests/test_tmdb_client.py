@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+
+from benchmarks.stub_tmdb import StubTMDBServer, fake_search_result
+from netflix_analysis.analysis import analyze_export, movie_database, parse_export
+from netflix_analysis.tmdb_client import TMDBCache, TMDBClient, TMDBError, normalize_title
+
+
+@pytest.fixture
+def client(tmp_path):
+    def make(server):
+        return TMDBClient('stub', base_url=server.url, cache=TMDBCache(str(tmp_path / 'cache.sqlite')),
+                          max_retries=0, requests_per_second=1000)
+    return make
+
+
+def test_normalize_title():
+    assert normalize_title('  The\tIrishman ') == normalize_title('the irishman') == 'the irishman'
+
+
+def test_spellings_share_one_request(client):
+    with StubTMDBServer() as server:
+        tmdb = client(server)
+        results = tmdb.search_movies(['Roma', 'roma ', 'ROMA', 'Okja'])
+        assert sorted(server.queries) == ['Okja', 'Roma']
+        assert results['ROMA'] == results['Roma'] == fake_search_result('Roma')
+        assert (tmdb.hits, tmdb.misses) == (0, 2)
+
+        tmdb.search_movies(['Roma', 'roma ', 'Okja', 'Mank'])
+        assert sorted(server.queries) == ['Mank', 'Okja', 'Roma']
+        assert (tmdb.hits, tmdb.misses) == (3, 3)
+        tmdb.close()
+
+
+def test_failures_do_not_abort(client, caplog):
+    with StubTMDBServer(failing={'Broken'}) as server:
+        tmdb = client(server)
+        with caplog.at_level(logging.WARNING, logger='netflix_analysis.tmdb'):
+            results = tmdb.search_movies(['Roma', 'Broken', 'broken', 'Okja'])
+        assert sorted(results) == ['Okja', 'Roma']
+        assert tmdb.failures == 1
+        assert "'Broken'" in caplog.text
+        # the responses that arrived are cached, only the failed title is requested again
+        assert set(tmdb.cache.get_many([TMDBCache.key(t, 'en-US') for t in ['Roma', 'Okja', 'Broken']])) == {
+            TMDBCache.key('Roma', 'en-US'), TMDBCache.key('Okja', 'en-US')}
+        server.queries.clear()
+        tmdb.search_movies(['Roma', 'Broken', 'Okja'])
+        assert server.queries == ['Broken']
+        with pytest.raises(TMDBError):
+            tmdb.search_movie('Broken')
+        assert tmdb.search_movie('Roma') == fake_search_result('Roma')
+        tmdb.close()
+
+
+def test_genres_cached(client):
+    with StubTMDBServer() as server:
+        tmdb = client(server)
+        assert tmdb.genres() == tmdb.genres()
+        assert server.requests == 1
+        tmdb.close()
+
+
+def test_evicts_once_per_search(tmp_path, monkeypatch):
+    calls = []
+    evict = TMDBCache._evict
+    monkeypatch.setattr(TMDBCache, '_evict', lambda cache: calls.append(1) or evict(cache))
+    with StubTMDBServer() as server:
+        tmdb = TMDBClient('stub', base_url=server.url, max_retries=0, requests_per_second=1000,
+                          cache=TMDBCache(str(tmp_path / 'cache.sqlite'), max_entries=5))
+        tmdb.search_movies(['Film {}'.format(number) for number in range(20)])
+        assert len(calls) == 1 and len(tmdb.cache) == 5
+        tmdb.close()
+
+
+def test_cache_ttl_and_size(tmp_path):
+    cache = TMDBCache(str(tmp_path / 'cache.sqlite'), ttl=60, max_entries=3)
+    for number in range(5):
+        cache.set('key{}'.format(number), {'n': number})
+    assert len(cache) == 3
+    assert cache.get('key4') == {'n': 4} and cache.get('key0') is None
+    cache.ttl = -1
+    assert cache.get('key4') is None
+    cache.close()
+
+
+def test_movie_database_counts_failures(client):
+    watched_df = parse_export('Files').watched_df
+    movies = watched_df[(watched_df['Film_Type'] == 'Movie') & (watched_df['percent_watched2'] > 90)]['Title']
+    failing = str(movies.iloc[0])
+    with StubTMDBServer(failing={failing}) as server:
+        tmdb = client(server)
+        df_movie_database, failures = movie_database(watched_df, tmdb)
+        assert failures == 1 and len(df_movie_database)
+        # the batch mode does not write a result without the failed movies
+        with pytest.raises(TMDBError, match='failed for 1 movies'):
+            analyze_export('Files', tmdb_client=tmdb)
+        server.failing.clear()
+        assert movie_database(watched_df, tmdb)[1] == 0
+        assert server.queries.count(failing) == 3
+        tmdb.close()
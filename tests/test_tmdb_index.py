@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.stub_tmdb import StubTMDBServer
+from netflix_analysis.tmdb_client import TMDBCache, TMDBClient
+from netflix_analysis.tmdb_index import TMDBIndex, build_index, read_cache, read_export
+
+EXPORT = os.path.join(os.path.dirname(__file__), 'fixtures', 'tmdb_movies.jsonl.gz')
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    assert build_index(path, read_export(EXPORT)) == 5
+    index = TMDBIndex(path)
+    yield index
+    index.close()
+
+
+def test_read_export_json_list(tmp_path):
+    path = str(tmp_path / 'movies.json')
+    with open(path, 'w') as f:
+        json.dump(list(read_export(EXPORT)), f)
+    assert [movie['id'] for movie in read_export(path)] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize('title, tmdb_id', [
+    ('Roma', 2),  # the more popular of two exact titles
+    ('The Irishman', 4),  # an exact title before a more popular normalized one
+    ('the irishman', 5),  # only normalized titles match, the most popular wins
+    ("Le Fabuleux Destin d'Amélie Poulain", 3),  # the original title
+    ("le fabuleux destin d'AMÉLIE  poulain", 3),  # the normalized original title
+])
+def test_lookup_order(index, title, tmdb_id):
+    assert index.lookup(title)['id'] == tmdb_id
+
+
+def test_lookup_result(index):
+    movie = index.lookup('Amélie')
+    assert movie['genre_ids'] == [35, 10749]
+    assert movie['vote_average'] == 7.9 and movie['release_date'] == '2001-04-25'
+    assert index.lookup('Unknown Film') is None
+    assert set(index.lookup_many(['Roma', 'Unknown Film'])) == {'Roma'}
+
+
+def test_genres(index):
+    assert sorted(genre['name'] for genre in index.genres()['genres']) == ['Comedy', 'Crime', 'Drama', 'Romance']
+
+
+def test_build_from_cache(tmp_path):
+    cache = TMDBCache(str(tmp_path / 'cache.sqlite'))
+    cache.set(TMDBCache.key('Roma', 'en-US'), {'page': 1, 'results': list(read_export(EXPORT))[:2]})
+    cache.set('genre/movie/list|en-US', {'genres': [{'id': 99, 'name': 'Documentary'}]})
+    cache.close()
+    items = list(read_cache(str(tmp_path / 'cache.sqlite')))
+    assert ('genres', [{'id': 99, 'name': 'Documentary'}]) in items
+    path = str(tmp_path / 'index.sqlite')
+    assert build_index(path, items) == 2
+    index = TMDBIndex(path)
+    assert index.lookup('Roma')['id'] == 2
+    assert index.genres() == {'genres': [{'id': 18, 'name': 'Drama'}, {'id': 99, 'name': 'Documentary'}]}
+    index.close()
+
+
+def test_client_fetches_index_misses(index, tmp_path):
+    with StubTMDBServer() as server:
+        client = TMDBClient('stub', base_url=server.url, cache=TMDBCache(str(tmp_path / 'cache.sqlite')), index=index)
+        results = client.search_movies(['Roma', 'the irishman', 'Unknown Film', 'unknown  film', 'Other Film'])
+        assert sorted(server.queries) == ['Other Film', 'Unknown Film']
+        assert results['Roma']['results'][0]['id'] == 2
+        assert results['unknown  film'] == results['Unknown Film']
+        assert (client.index_hits, client.misses) == (2, 2)
+
+        client.search_movies(['Unknown Film', 'Other Film'])
+        assert len(server.queries) == 2
+        client.close()